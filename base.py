@@ -67,6 +67,8 @@ class State(BaseModel):
     time_limit: int = 60 * 60 * 2
     time_usage: int = 0
     timeout: int = 600
+    command_stats: Dict[str, Dict] = Field(default_factory=dict)
+    summaries: Dict[str, Dict] = Field(default_factory=dict)
     submissions: List[str] = Field(default_factory=list)
 
     class Config:
@@ -112,6 +114,38 @@ class State(BaseModel):
             node_id = self.last_node_id
         return self.nodes[node_id].get_path(self.nodes)
 
+    def set_prompt_messages(self, messages: List[Message]) -> None:
+        """
+        Store the prompt for the generator in next_step["args"]["message_refs"].
+        Messages that are the message of a node are stored as that node's id, and
+        only messages that differ from their nodes (trimmed, formatted, notices)
+        are stored in full, so checkpoints don't hold the history twice.
+
+        The options and generation metadata of the previous step are dropped,
+        since the chosen option is already in its node.
+        """
+        node_ids = {id(node.message): node.node_id for node in self.nodes}
+        args = self.next_step.setdefault("args", {})
+        for key in ("messages", "options", "option_counts", "generation_metadata"):
+            args.pop(key, None)
+        args["message_refs"] = [
+            node_ids.get(id(message), message) for message in messages
+        ]
+
+    def get_prompt_messages(self) -> List[Message]:
+        """
+        The prompt for the generator, as set by set_prompt_messages. States
+        that store the messages themselves in next_step["args"]["messages"]
+        are still supported.
+        """
+        args = self.next_step["args"]
+        if "message_refs" not in args:
+            return args["messages"]
+        return [
+            self.nodes[ref].message if isinstance(ref, int) else ref
+            for ref in args["message_refs"]
+        ]
+
 
 class Settings(BaseModel):
     toolkit: str
@@ -120,6 +154,10 @@ class Settings(BaseModel):
     discriminator: str
     actor: str
     autosubmit: bool = False
+    adaptive_sampling: bool = False
+    # models for generators to fall back to, in order, e.g.
+    # {"gpt-4o-2024-05-13": ["gpt-4o-mini-2024-07-18"]}
+    model_fallbacks: Dict[str, List[str]] = Field(default_factory=dict)
 
 
 okabe_ito = {
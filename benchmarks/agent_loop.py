@@ -0,0 +1,273 @@
+"""
+End-to-end benchmark of main.main against an in-process stand-in for pyhooks.
+
+Each configuration (starting state size, tool output size, samples per step)
+runs in its own subprocess, so peak memory and module-level caches don't carry
+over between configurations. Results are written as JSON.
+
+Usage: python -m benchmarks.agent_loop [--nodes 100 1000 10000 50000]
+    [--output-kb 1 16] [--n 1 8] [--steps 10] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from functools import wraps
+
+MODULE_TYPES = ["prompter", "generator", "discriminator", "actor"]
+
+
+def make_state(num_nodes: int, output_chars: int, seed: int = 0) -> dict:
+    """
+    Synthetic state whose path alternates bash calls and their outputs, with a
+    few very long outputs and some abandoned branches.
+    """
+    rng = random.Random(seed)
+    nodes = [
+        {
+            "node_id": 0,
+            "parent": -1,
+            "children": [],
+            "message": {"role": "user", "content": "Start working on the task."},
+            "metadata": {},
+        }
+    ]
+    tip = 0
+    line = "INFO step completed successfully with no errors reported\n"
+    while len(nodes) < num_nodes:
+        node_id = len(nodes)
+        if nodes[tip]["message"]["role"] != "assistant":
+            message = {
+                "role": "assistant",
+                "content": "Let me check the logs.",
+                "function_call": {
+                    "type": "function",
+                    "name": "bash",
+                    "arguments": json.dumps({"command": f"cat log_{node_id}.txt"}),
+                },
+            }
+        else:
+            size = output_chars * (50 if rng.random() < 0.01 else 1)
+            message = {
+                "role": "function",
+                "name": "bash",
+                "content": (line * (size // len(line) + 1))[:size],
+            }
+        nodes.append(
+            {
+                "node_id": node_id,
+                "parent": tip,
+                "children": [],
+                "message": message,
+                "metadata": {},
+            }
+        )
+        nodes[tip]["children"].append(node_id)
+        # occasionally leave a branch behind, as backtracking discriminators do
+        if message["role"] == "function" and rng.random() < 0.05 and node_id > 2:
+            tip = nodes[tip]["parent"]
+        else:
+            tip = node_id
+    if tip != len(nodes) - 1:
+        # new nodes are added after the last one, so the path must end there
+        nodes.append(
+            {
+                "node_id": len(nodes),
+                "parent": tip,
+                "children": [],
+                "message": {"role": "user", "content": "Try a different approach."},
+                "metadata": {},
+            }
+        )
+        nodes[tip]["children"].append(len(nodes) - 1)
+    return {
+        "state": {
+            "task_string": "Benchmark task: find the answer and submit it.",
+            "nodes": nodes,
+            "last_node_id": len(nodes) - 1,
+            # State.parse_obj can't read back empty args, which look like a Node
+            "next_step": {"module_type": "prompter", "args": {"messages": []}},
+            "timeout": 10,
+        }
+    }
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_single(config: dict) -> dict:
+    from benchmarks.fake_hooks import BenchmarkFinished, FakeHooks
+
+    fake_hooks = FakeHooks(steps=config["steps"], output_chars=config["output_chars"])
+    fake_hooks.install()
+
+    import main
+    from modules import actors, discriminators, generators, prompters
+
+    cpu_seconds = {module_type: 0.0 for module_type in [*MODULE_TYPES, "trim_state"]}
+    wall_seconds = {module_type: [] for module_type in cpu_seconds}
+
+    def timed(module_type, fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                cpu, wall = time.process_time(), time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    cpu_seconds[module_type] += time.process_time() - cpu
+                    wall_seconds[module_type].append(time.perf_counter() - wall)
+
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            cpu, wall = time.process_time(), time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                cpu_seconds[module_type] += time.process_time() - cpu
+                wall_seconds[module_type].append(time.perf_counter() - wall)
+
+        return wrapper
+
+    settings = config["settings"]
+    for module, module_type in zip(
+        [prompters, generators, discriminators, actors], MODULE_TYPES
+    ):
+        name = settings[module_type]
+        setattr(module, name, timed(module_type, getattr(module, name)))
+    main.trim_state = timed("trim_state", main.trim_state)
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings_path = os.path.join(directory, "settings.json")
+        with open(settings_path, "w") as f:
+            json.dump(settings, f)
+        os.environ["SETTINGS_PATH"] = settings_path
+        if config["nodes"]:
+            state_path = os.path.join(directory, "state.json")
+            with open(state_path, "w") as f:
+                json.dump(make_state(config["nodes"], config["output_chars"]), f)
+            os.environ["STARTING_STATE_PATH"] = state_path
+            os.environ["SKIP_REPLAY"] = "1"
+
+        start = time.perf_counter()
+        try:
+            asyncio.run(main.main())
+        except BenchmarkFinished:
+            pass
+        total_seconds = time.perf_counter() - start
+
+    # one agent step is a prompter, generator, discriminator and actor step
+    module_steps = fake_hooks.step_times
+    step_seconds = [
+        sum(module_steps[i : i + len(MODULE_TYPES)])
+        for i in range(0, len(module_steps), len(MODULE_TYPES))
+    ]
+    return {
+        **{key: value for key, value in config.items() if key != "settings"},
+        "settings": settings,
+        "total_seconds": total_seconds,
+        "step_seconds": {
+            "p50": percentile(step_seconds, 0.5),
+            "p90": percentile(step_seconds, 0.9),
+            "p99": percentile(step_seconds, 0.99),
+            "mean": statistics.fmean(step_seconds) if step_seconds else 0.0,
+        },
+        "module_cpu_seconds": cpu_seconds,
+        "module_wall_seconds_p50": {
+            module_type: percentile(values, 0.5)
+            for module_type, values in wall_seconds.items()
+        },
+        "checkpoint_bytes": {
+            "max": max(fake_hooks.checkpoint_bytes, default=0),
+            "last": fake_hooks.checkpoint_bytes[-1]
+            if fake_hooks.checkpoint_bytes
+            else 0,
+        },
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--nodes", type=int, nargs="+", default=[100, 1000, 10000, 50000]
+    )
+    parser.add_argument("--output-kb", type=float, nargs="+", default=[1, 16])
+    parser.add_argument("--n", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--toolkit", default="_basic")
+    parser.add_argument("--prompter", default="_context_and_usage_aware")
+    parser.add_argument("--discriminator", default="_basic")
+    parser.add_argument("--actor", default="_basic")
+    parser.add_argument("--model", default="4o", help="gpt generator model suffix")
+    parser.add_argument("--output", default="agent_loop_results.json")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(json.loads(args.single))))
+        return
+
+    results = []
+    for nodes, output_kb, n in itertools.product(args.nodes, args.output_kb, args.n):
+        config = {
+            "nodes": nodes,
+            "output_chars": int(output_kb * 1024),
+            "n": n,
+            "steps": args.steps,
+            "settings": {
+                "toolkit": args.toolkit,
+                "prompter": args.prompter,
+                "generator": f"_gpt_basic_{n}x{args.model}",
+                "discriminator": args.discriminator,
+                "actor": args.actor,
+            },
+        }
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.agent_loop",
+                "--single",
+                json.dumps(config),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            print(process.stderr, file=sys.stderr)
+            raise SystemExit(f"Benchmark failed for {config}")
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f"nodes={nodes} output_kb={output_kb} n={n}:"
+            f" p50 step {result['step_seconds']['p50']:.3f}s,"
+            f" peak {result['peak_rss_mb']:.0f}MB,"
+            f" checkpoint {result['checkpoint_bytes']['max'] / 1e6:.1f}MB",
+            file=sys.stderr,
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+A small stand-in for pytest-benchmark's `benchmark` fixture, so the hot-path
+micro-benchmarks run without adding a dependency.
+
+Each benchmark calls `benchmark(fn, *args, **kwargs)` once. The function is
+run until both a minimum number of rounds and a minimum total time are
+reached, and the median round time is compared against the tracked baselines
+in benchmarks/baselines.json.
+
+Usage:
+    python -m pytest benchmarks
+    python -m pytest benchmarks --save-baselines      # update baselines.json
+    python -m pytest benchmarks --max-slowdown 1.5    # fail on regressions
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("API_URL", "http://localhost:8000")
+os.environ.setdefault("RUN_ID", "123")
+os.environ.setdefault("AGENT_TOKEN", "456")
+os.environ.setdefault("AGENT_BRANCH_NUMBER", "0")
+os.environ.setdefault("TASK_ID", "task/test")
+os.environ.setdefault("PYHOOKS_DEBUG", "0")
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+results_key = pytest.StashKey[dict]()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("microbenchmarks")
+    group.addoption(
+        "--save-baselines",
+        action="store_true",
+        help="Write the measured timings to benchmarks/baselines.json.",
+    )
+    group.addoption(
+        "--max-slowdown",
+        type=float,
+        default=None,
+        help="Fail a benchmark whose median is this many times its baseline.",
+    )
+    group.addoption(
+        "--min-rounds",
+        type=int,
+        default=5,
+        help="Minimum number of timed rounds per benchmark.",
+    )
+
+
+def pytest_configure(config):
+    config.stash[results_key] = {}
+
+
+def load_baselines() -> dict:
+    if not BASELINES_PATH.exists():
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f)["benchmarks"]
+
+
+class Benchmark:
+    def __init__(
+        self,
+        name: str,
+        min_rounds: int = 5,
+        min_time: float = 0.2,
+        max_time: float = 5.0,
+    ):
+        self.name = name
+        self.min_rounds = min_rounds
+        self.min_time = min_time
+        self.max_time = max_time
+        self.stats: dict | None = None
+
+    def __call__(self, fn, *args, **kwargs):
+        # warm up caches (and fail fast) before timing anything
+        result = fn(*args, **kwargs)
+        timings = []
+        while len(timings) < self.min_rounds or (
+            sum(timings) < self.min_time and sum(timings) < self.max_time
+        ):
+            start = time.perf_counter()
+            fn(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+            if sum(timings) > self.max_time and len(timings) >= 3:
+                break
+        self.stats = {
+            "rounds": len(timings),
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.fmean(timings),
+        }
+        return result
+
+
+@pytest.fixture
+def benchmark(request):
+    bench = Benchmark(request.node.name, min_rounds=request.config.option.min_rounds)
+    yield bench
+    if bench.stats is None:
+        return
+    request.config.stash[results_key][bench.name] = bench.stats
+    max_slowdown = request.config.option.max_slowdown
+    baseline = load_baselines().get(bench.name)
+    if max_slowdown and baseline:
+        slowdown = bench.stats["median"] / baseline["median"]
+        if slowdown > max_slowdown:
+            pytest.fail(
+                f"{bench.name} took {bench.stats['median'] * 1e3:.2f}ms,"
+                f" {slowdown:.2f}x its baseline of {baseline['median'] * 1e3:.2f}ms"
+            )
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash[results_key]
+    if not results:
+        return
+    baselines = load_baselines()
+    terminalreporter.section("micro-benchmarks (median per call)")
+    width = max(len(name) for name in results)
+    for name, stats in sorted(results.items()):
+        line = f"{name:<{width}}  {stats['median'] * 1e3:10.3f}ms"
+        if name in baselines:
+            line += f"  {stats['median'] / baselines[name]['median']:6.2f}x baseline"
+        terminalreporter.write_line(line)
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if not config.option.save_baselines or not config.stash[results_key]:
+        return
+    baselines = load_baselines()
+    for name, stats in config.stash[results_key].items():
+        baselines[name] = {"median": stats["median"], "min": stats["min"]}
+    with open(BASELINES_PATH, "w") as f:
+        json.dump(
+            {
+                "machine": {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "processor": platform.machine(),
+                },
+                "benchmarks": dict(sorted(baselines.items())),
+            },
+            f,
+            indent=2,
+        )
+        f.write("\n")
@@ -0,0 +1,143 @@
+"""
+In-process stand-in for the pyhooks API, for running main.main end to end.
+
+The methods of pyhooks.Hooks and pyhooks.Actions are replaced with scripted
+fakes, so every module's `hooks` and `actions` instances use them. Generations
+call the bash tool until the scripted number of steps is reached, and then
+submit, which ends the run with BenchmarkFinished.
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pyhooks
+from pyhooks.types import MiddlemanModelOutput, MiddlemanResult, MiddlemanSettings
+
+
+class BenchmarkFinished(Exception):
+    pass
+
+
+class FakeHooks:
+    def __init__(
+        self,
+        steps: int,
+        output_chars: int = 1000,
+        task: str = "Benchmark task: find the answer and submit it.",
+        task_latency: float = 0.0,
+    ):
+        self.steps = steps
+        self.output_chars = output_chars
+        self.task = task
+        # seconds getTask takes, like the round trip to the real API
+        self.task_latency = task_latency
+        self.generations = 0
+        # wall clock time (time.time) of the first generation request
+        self.first_generation_at: float | None = None
+        self.checkpoint_bytes: list[int] = []
+        self.step_times: list[float] = []
+        self._started = time.perf_counter()
+
+    def _completion(self, function_call: dict) -> MiddlemanModelOutput:
+        return MiddlemanModelOutput(
+            completion="Let me look at the files to work out what to do next.",
+            function_call=function_call,
+            n_completion_tokens_spent=20,
+        )
+
+    async def generate(
+        self, _hooks, settings: MiddlemanSettings, messages=None, **kwargs
+    ):
+        if self.first_generation_at is None:
+            self.first_generation_at = time.time()
+        self.generations += 1
+        if self.generations >= self.steps:
+            function_call = {
+                "name": "submit",
+                "arguments": json.dumps({"submission": "42"}),
+            }
+        else:
+            function_call = {
+                "name": "bash",
+                "arguments": json.dumps({"command": f"cat log_{self.generations}.txt"}),
+            }
+        return MiddlemanResult(
+            outputs=[self._completion(function_call) for _ in range(settings.n)],
+            n_prompt_tokens_spent=sum(
+                len(str(getattr(message, "content", message))) // 4
+                for message in messages or []
+            ),
+            n_completion_tokens_spent=20 * settings.n,
+            duration_ms=0,
+        )
+
+    async def generate_one(self, _hooks, settings=None, **kwargs):
+        return "A summary."
+
+    async def get_task(self, _hooks):
+        await asyncio.sleep(self.task_latency)
+        return SimpleNamespace(
+            instructions=self.task,
+            scoring=SimpleNamespace(intermediate=False),
+        )
+
+    async def get_usage(self, _hooks):
+        return SimpleNamespace(
+            usage=SimpleNamespace(tokens=10_000 * self.generations, total_seconds=0),
+            usageLimits=SimpleNamespace(tokens=10_000_000, total_seconds=24 * 3600),
+        )
+
+    def save_state(self, _hooks, state):
+        self.checkpoint_bytes.append(len(json.dumps(state)))
+        now = time.perf_counter()
+        self.step_times.append(now - self._started)
+        self._started = now
+
+    async def submit(self, _hooks, submission):
+        raise BenchmarkFinished(submission)
+
+    async def action(self, _hooks, action):
+        pass
+
+    def log(self, _hooks, *args, **kwargs):
+        pass
+
+    async def run_bash(self, _actions, command, timeout):
+        line = "INFO step completed successfully with no errors reported\n"
+        stdout = (line * (self.output_chars // len(line) + 1))[: self.output_chars]
+        return json.dumps({"stdout": stdout, "stderr": "", "status": 0})
+
+    async def run_python(self, _actions, code, timeout):
+        return "ok"
+
+    def install(self) -> None:
+        fakes = {
+            pyhooks.Hooks: {
+                "generate": self.generate,
+                "generate_one": self.generate_one,
+                "getTask": self.get_task,
+                "get_usage": self.get_usage,
+                "save_state": self.save_state,
+                "submit": self.submit,
+                "action": self.action,
+                "log": self.log,
+                "log_with_attributes": self.log,
+            },
+            pyhooks.Actions: {
+                "run_bash": self.run_bash,
+                "run_python": self.run_python,
+            },
+        }
+        for cls, methods in fakes.items():
+            for name, fake in methods.items():
+                # plain functions, so they are bound to the hooks instance
+                setattr(cls, name, _unbound(fake))
+
+
+def _unbound(method):
+    def function(self, *args, **kwargs):
+        return method(self, *args, **kwargs)
+
+    return function
@@ -0,0 +1,79 @@
+"""
+Benchmark for modules.output_summary on large synthetic logs.
+
+Usage: python -m benchmarks.output_summary [--size-mb 100] [--token-budget 500]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from modules.output_summary import summarize_output
+
+
+def make_log(size_mb: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    step = 0
+    while size < size_mb * 1024 * 1024:
+        kind = rng.random()
+        if kind < 0.6:
+            part = f"[{step:08d}] INFO processed batch {step} in {rng.random():.3f}s\n"
+        elif kind < 0.8:
+            part = (
+                "".join(
+                    f"\r{p}% |{'#' * (p // 10):<10}| {p}/100 [00:{p % 60:02d}<00:00]"
+                    for p in range(0, 101, 5)
+                )
+                + "\n"
+            )
+        elif kind < 0.99:
+            part = "WARNING: deprecated call in module foo\n"
+        elif kind < 0.999:
+            part = f"ERROR: shard {step} failed with code {rng.randint(1, 9)}\n"
+        else:
+            part = (
+                "Traceback (most recent call last):\n"
+                '  File "train.py", line 42, in <module>\n'
+                "    main()\n"
+                f"RuntimeError: step {step} diverged\n"
+            )
+        parts.append(part)
+        size += len(part)
+        step += 1
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=100)
+    parser.add_argument("--token-budget", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    log = make_log(args.size_mb)
+    timings = []
+    summary = ""
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        summary = summarize_output(log, token_budget=args.token_budget)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(
+        json.dumps(
+            {
+                "input_mb": len(log) / (1024 * 1024),
+                "input_lines": log.count("\n"),
+                "summary_chars": len(summary),
+                "best_seconds": best,
+                "mb_per_second": len(log) / (1024 * 1024) / best,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
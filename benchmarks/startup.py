@@ -0,0 +1,144 @@
+"""
+Benchmark of agent startup: how long a fresh process takes to import the agent
+and to send its first generation request, against an in-process stand-in for
+pyhooks whose getTask takes --task-latency seconds.
+
+Also reports where import time goes, from `python -X importtime`, as self time
+summed by package.
+
+Usage: python -m benchmarks.startup [--repeats 5] [--task-latency 0.2]
+    [--prompter _context_and_usage_aware] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+_importtime_re = re.compile(r"import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)")
+
+
+def run_single(config: dict) -> dict:
+    from benchmarks.fake_hooks import BenchmarkFinished, FakeHooks
+
+    fake_hooks = FakeHooks(steps=1, task_latency=config["task_latency"])
+    fake_hooks.install()
+
+    import main
+
+    imported_at = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        settings_path = os.path.join(directory, "settings.json")
+        with open(settings_path, "w") as f:
+            json.dump(config["settings"], f)
+        os.environ["SETTINGS_PATH"] = settings_path
+        try:
+            asyncio.run(main.main())
+        except BenchmarkFinished:
+            pass
+    return {
+        "imported_at": imported_at,
+        "first_generation_at": fake_hooks.first_generation_at,
+    }
+
+
+def import_profile() -> dict[str, float]:
+    """
+    Self import time in seconds by package, e.g. "pydantic" or "modules.tools".
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds = defaultdict(float)
+    for line in process.stderr.splitlines():
+        match = _importtime_re.match(line)
+        if match is None:
+            continue
+        name = match.group(2)
+        package = name if name.startswith("modules.") else name.split(".")[0]
+        seconds[package] += int(match.group(1)) / 1e6
+    return dict(sorted(seconds.items(), key=lambda item: -item[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--task-latency", type=float, default=0.2)
+    parser.add_argument("--toolkit", default="_basic")
+    parser.add_argument("--prompter", default="_context_and_usage_aware")
+    parser.add_argument("--generator", default="_gpt_basic_1x4o")
+    parser.add_argument("--discriminator", default="_basic")
+    parser.add_argument("--actor", default="_basic")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(json.loads(args.single))))
+        return
+
+    config = {
+        "task_latency": args.task_latency,
+        "settings": {
+            "toolkit": args.toolkit,
+            "prompter": args.prompter,
+            "generator": args.generator,
+            "discriminator": args.discriminator,
+            "actor": args.actor,
+        },
+    }
+    import_seconds, first_generation_seconds = [], []
+    for _ in range(args.repeats):
+        launched_at = time.time()
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.startup",
+                "--single",
+                json.dumps(config),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            print(process.stderr, file=sys.stderr)
+            raise SystemExit("Startup benchmark failed")
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        import_seconds.append(result["imported_at"] - launched_at)
+        first_generation_seconds.append(result["first_generation_at"] - launched_at)
+
+    profile = import_profile()
+    results = {
+        **config,
+        "repeats": args.repeats,
+        "import_seconds_median": statistics.median(import_seconds),
+        "first_generation_seconds_median": statistics.median(first_generation_seconds),
+        "import_self_seconds_by_package": profile,
+    }
+    print(
+        f"import: {results['import_seconds_median']:.3f}s,"
+        f" first generation: {results['first_generation_seconds_median']:.3f}s"
+        f" (getTask latency {args.task_latency:.3f}s)",
+        file=sys.stderr,
+    )
+    for package, seconds in list(profile.items())[: args.top]:
+        print(f"  {package:<40} {seconds * 1e3:8.1f}ms", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Micro-benchmarks for the code the prompters run on every step.
+
+Run with `python -m pytest benchmarks`; see benchmarks/conftest.py for options.
+"""
+
+import asyncio
+import json
+import random
+
+import pytest
+
+from base import Agent, Message, Settings, State
+from modules import prompters
+
+LOG_LINE = "INFO step completed successfully with no errors reported\n"
+
+
+def make_output(chars: int) -> str:
+    return (LOG_LINE * (chars // len(LOG_LINE) + 1))[:chars]
+
+
+def make_score_content(stdout_chars: int = 2_000) -> str:
+    return json.dumps(
+        {
+            "status": "scoringSucceeded",
+            "score": 0.42,
+            "message": {"accuracy": 0.42, "failed_cases": list(range(20))},
+            "execResult": {
+                "exitStatus": 0,
+                "stdout": make_output(stdout_chars),
+                "stderr": "",
+            },
+        }
+    )
+
+
+def make_state(
+    num_nodes: int,
+    output_chars: int = 2_000,
+    huge_output_chars: int = 200_000,
+    seed: int = 0,
+) -> State:
+    """
+    A history of bash calls and their outputs, with a few huge outputs, the
+    occasional score check and abandoned branches. The path to the last node
+    holds most of the nodes.
+    """
+    rng = random.Random(seed)
+    state = State(task_string="Benchmark task: find the answer and submit it.")
+    state.generate_node(Message(role="user", content="Start working on the task."))
+    tip = 0
+    while len(state.nodes) < num_nodes:
+        if state.nodes[tip].message.role != "assistant":
+            tool = "score" if rng.random() < 0.02 else "bash"
+            message = Message(
+                role="assistant",
+                content="Let me check the results.",
+                function_call={
+                    "type": "function",
+                    "name": tool,
+                    "arguments": "{}"
+                    if tool == "score"
+                    else json.dumps({"command": f"cat log_{len(state.nodes)}.txt"}),
+                },
+            )
+        elif (
+            function_call := state.nodes[tip].message.function_call
+        ) and function_call["name"] == "score":
+            message = Message(
+                role="function", name="score", content=make_score_content()
+            )
+        else:
+            size = huge_output_chars if rng.random() < 0.01 else output_chars
+            message = Message(role="function", name="bash", content=make_output(size))
+        node = state.generate_node(message, parent=tip, children=[])
+        if message.role == "function" and rng.random() < 0.05 and node.node_id > 2:
+            tip = state.nodes[tip].parent
+        else:
+            tip = node.node_id
+    if tip != state.last_node_id:
+        state.generate_node(
+            Message(role="user", content="Try a different approach."),
+            parent=tip,
+            children=[],
+        )
+    return state
+
+
+@pytest.fixture(scope="module")
+def states() -> dict[int, State]:
+    return {num_nodes: make_state(num_nodes) for num_nodes in (100, 1_000, 10_000)}
+
+
+@pytest.mark.parametrize("num_nodes", [100, 1_000, 10_000])
+def test_get_path(benchmark, states: dict[int, State], num_nodes: int):
+    path = benchmark(states[num_nodes].get_path)
+    assert path[0] == 0
+    assert path[-1] == states[num_nodes].last_node_id
+
+
+@pytest.mark.parametrize("stdout_chars", [2_000, 1_000_000])
+def test_format_score_message(benchmark, stdout_chars: int):
+    message = Message(
+        role="function",
+        name="score",
+        content=make_score_content(stdout_chars) + "\nPlease continue.",
+    )
+    formatted = benchmark(prompters._format_score_message, message)
+    assert formatted.content.startswith("The score is 0.42.")
+
+
+@pytest.mark.parametrize(
+    ("output_chars", "token_usage_fraction"),
+    [(2_000, 0.1), (20_000, 0.1), (20_000, 0.6), (1_000_000, 0.1)],
+)
+def test_get_trimmed_message(benchmark, output_chars: int, token_usage_fraction: float):
+    state = State(task_string="")
+    node = state.generate_node(
+        Message(role="function", name="bash", content=make_output(output_chars)),
+        metadata={"saved_output_filename": "/home/agent/output.txt"},
+    )
+    message = benchmark(prompters._get_trimmed_message, node, token_usage_fraction)
+    assert len(message.content) <= output_chars + 1_000
+
+
+@pytest.mark.parametrize(
+    ("num_nodes", "target_tok_length"),
+    [(100, 96_000), (1_000, 96_000), (10_000, 96_000), (10_000, 8_000)],
+)
+def test_trim_message_list(
+    benchmark, states: dict[int, State], num_nodes: int, target_tok_length: int
+):
+    state = states[num_nodes]
+    messages = [state.nodes[node_id].message for node_id in state.get_path()]
+    trimmed = benchmark(prompters.trim_message_list, messages, target_tok_length)
+    assert trimmed[:4] == messages[:4]
+    assert trimmed[-1] == messages[-1]
+
+
+def test_trim_message_list_huge_messages(benchmark):
+    messages = [Message(role="user", content="Start working on the task.")]
+    for _ in range(10):
+        messages.append(
+            Message(role="function", name="bash", content=make_output(1_000_000))
+        )
+    trimmed = benchmark(prompters.trim_message_list, messages, 96_000)
+    assert len(trimmed) < len(messages)
+
+
+@pytest.mark.parametrize("num_nodes", [1_000, 10_000])
+def test_context_and_usage_aware(benchmark, states: dict[int, State], num_nodes: int):
+    agent = Agent(
+        state=states[num_nodes].model_copy(),
+        settings=Settings(
+            toolkit="_basic",
+            prompter="_context_and_usage_aware",
+            generator="_gpt_basic_1x4o",
+            discriminator="_basic",
+            actor="_basic",
+        ),
+        toolkit_dict={},
+    )
+    agent.state.token_usage = agent.state.token_limit // 2
+    agent.state.next_step = {"module_type": "prompter", "args": {}}
+
+    def step():
+        asyncio.run(prompters._context_and_usage_aware(agent))
+
+    benchmark(step)
+    assert agent.state.next_step["module_type"] == "generator"
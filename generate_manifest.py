@@ -1,9 +1,16 @@
 import json
 from itertools import product
 
-TOOLKITS = ["_basic", "_basic_vision", "_vision_double_return"]
+TOOLKITS = ["_basic", "_basic_vision", "_vision_double_return", "_persistent_bash"]
 
-PROMPTERS = ["_basic", "_context_and_usage_aware"]
+PROMPTERS = [
+    "_basic",
+    "_context_and_usage_aware",
+    "_prefix_stable",
+    "_summarizing",
+    "_summarizing_4o",
+    "_summarizing_4om",
+]
 
 GENERATORS = []
 for model, n in product(
@@ -33,6 +40,30 @@ DISCRIMINATORS += [
         "c3.5sv2",
     ]
 ]
+DISCRIMINATORS += [
+    f"_compare_options_short{fallback}_{model}"
+    for fallback, model in product(
+        ["", "_or_reason"],
+        ["4", "4t", "4o", "4om", "c3o", "c3s", "c3h", "c3.5s", "c3.5sv2"],
+    )
+]
+DISCRIMINATORS += [
+    f"_tournament_{model}"
+    for model in [
+        "4",
+        "4t",
+        "4o",
+        "4om",
+        "o1p",
+        "o1m",
+        "o1",
+        "c3o",
+        "c3s",
+        "c3h",
+        "c3.5s",
+        "c3.5sv2",
+    ]
+]
 DISCRIMINATORS += [
     f"_fixed_rating_{model}"
     for model in [
@@ -60,6 +91,10 @@ DISCRIMINATORS += [
     f"_assess_and_backtrack_gpt_{gpt}"
     for gpt in ["4", "4t", "4o", "4om", "o1p", "o1m", "o1"]
 ]
+DISCRIMINATORS += [
+    f"_assess_and_backtrack_{n_judges}_judges_gpt_{gpt}"
+    for gpt, n_judges in product(["4", "4t", "4o", "4om", "o1p", "o1m", "o1"], [3, 5])
+]
 
 ACTORS = ["_basic", "_prompt_to_search", "_always_save"]
 
@@ -73,6 +108,11 @@ MANIFEST = {
             "discriminator": {"type": "string"},
             "actor": {"type": "string"},
             "autosubmit": {"type": "boolean"},
+            "adaptive_sampling": {"type": "boolean"},
+            "model_fallbacks": {
+                "type": "object",
+                "additionalProperties": {"type": "array", "items": {"type": "string"}},
+            },
         },
         "additionalProperties": False,
         "required": ["toolkit", "prompter", "generator", "discriminator", "actor"],
@@ -134,6 +174,8 @@ MANIFEST = {
             "time_limit": {"type": "integer"},
             "time_usage": {"type": "integer"},
             "timeout": {"type": "integer"},
+            "command_stats": {"type": "object", "additionalProperties": True},
+            "summaries": {"type": "object", "additionalProperties": True},
             "last_rating_options": {
                 "oneOf": [
                     {
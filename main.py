@@ -89,19 +89,23 @@ def trim_state(
                 break
 
     # Trimming content within messages in next_step args if necessary
-    next_step = state_copy["next_step"]
-    if "args" in next_step and "messages" in next_step["args"]:
-        for message in next_step["args"]["messages"]:
-            if "content" in message and len(message["content"]) > content_cutoff:
-                old_content = message["content"]
-                new_content = (
-                    old_content[:content_cutoff]
-                    + f"\n[Note: Content trimmed to {content_cutoff} characters]"
-                )
-                message["content"] = new_content
-                total_size = get_json_size_in_mb(state_copy)
-                if total_size < limit:
-                    break
+    args = state_copy["next_step"].get("args", {})
+    # message_refs only hold the messages that differ from their nodes by value
+    messages = [
+        *args.get("messages", []),
+        *(ref for ref in args.get("message_refs", []) if isinstance(ref, dict)),
+    ]
+    for message in messages:
+        if "content" in message and len(message["content"]) > content_cutoff:
+            old_content = message["content"]
+            new_content = (
+                old_content[:content_cutoff]
+                + f"\n[Note: Content trimmed to {content_cutoff} characters]"
+            )
+            message["content"] = new_content
+            total_size = get_json_size_in_mb(state_copy)
+            if total_size < limit:
+                break
 
     print(f"State size is {total_size}MB after trimming.")
     return state_copy
@@ -110,6 +114,8 @@ def trim_state(
 async def main(*args):
     global agent
     print("STARTING AGENT")
+    # the first prompt needs the tokenizer, which can load while we wait for the task
+    prompters.warm_up_tokenizer()
     task = await hooks.getTask()
     task_string = task.instructions.strip()
     hooks.log("Task:", task_string)
@@ -123,7 +129,7 @@ async def main(*args):
         timeout=default_timeout,
     )
 
-    with open("/home/agent/settings.json") as f:
+    with open(os.environ.get("SETTINGS_PATH", "/home/agent/settings.json")) as f:
         settings = Settings(**json.loads(f.read()))
 
     if os.environ.get("STARTING_STATE"):
@@ -146,6 +152,8 @@ async def main(*args):
         toolkit_dict = getattr(tools, agent.settings.toolkit)
         if task.scoring.intermediate:
             toolkit_dict = {**toolkit_dict, **tools.scoring_tools}
+        if agent.settings.actor in ("_prompt_to_search", "_always_save"):
+            toolkit_dict = {**toolkit_dict, **tools.search_tools}
         agent.set_toolkit_dict(toolkit_dict)
         # Almost always the agent should follow the order below.
         # Usually a prompter will conclude by setting the next_step to be
@@ -1,12 +1,32 @@
+import asyncio
 import json
-import math
 import os
-import random
 from typing import Optional
 
 from base import Agent, Message
+from modules.output_store import OutputStore, output_store_dir
+from modules.output_summary import summarize_output
 from templates import prompt_to_search, reject_arguments_prompt, reject_command_prompt
 
+long_output_store: OutputStore
+tool_output_store: OutputStore
+
+
+def configure_from_env() -> None:
+    global long_output_store, tool_output_store
+    directory = output_store_dir()
+    long_output_store = OutputStore(
+        os.path.join(directory, "long_outputs"), "long_output"
+    )
+    tool_output_store = OutputStore(
+        os.path.join(directory, "tool_outputs"), "tool_output"
+    )
+
+
+configure_from_env()
+
+LONG_OUTPUT_SUMMARY_TOKENS = 400
+
 
 async def get_result_message_simple(agent: Agent) -> Optional[Message]:
     last_node = agent.state.nodes[agent.state.last_node_id]
@@ -87,35 +107,34 @@ async def _basic(agent: Agent) -> None:
     agent.state.next_step["module_type"] = "prompter"
 
 
-async def maybe_prompt_to_search_post_act(output: Message) -> Optional[Message]:
+async def maybe_prompt_to_search_post_act(
+    output: Message, node_id: Optional[int] = None
+) -> Optional[Message]:
     if len(output.content) > 4500:
-        long_output_dir = "/home/agent/long_outputs"
-        try:
-            os.mkdir(long_output_dir)
-        except FileExistsError:
-            pass
-        filename = f"{long_output_dir}/long_output_{str(1 + math.floor(random.random() * 9007199254740990))}.txt"
-        with open(filename, "w") as f:
-            f.write(output.content)
+        # summarizing a huge output takes a while, so it's done off the event
+        # loop while the output is saved
+        saved_output, output_summary = await asyncio.gather(
+            long_output_store.save(output.content, node_id=node_id),
+            asyncio.to_thread(
+                summarize_output,
+                output.content,
+                token_budget=LONG_OUTPUT_SUMMARY_TOKENS,
+            ),
+        )
         output.content = prompt_to_search.format(
-            filename=filename,
-            output_start=output.content[:100],
-            output_end=output.content[-100:],
+            filename=saved_output["path"],
+            output_summary=output_summary,
         )
         return output
 
 
 async def _always_save(agent: Agent) -> None:
     output = await get_result_message_simple(agent)
-    output_dir = "/home/agent/tool_outputs"
-    try:
-        os.mkdir(output_dir)
-    except FileExistsError:
-        pass
     if output is not None:
-        filename = f"{output_dir}/tool_output_{str(1 + math.floor(random.random() * 9007199254740990))}.txt"
-        with open(filename, "w") as f:
-            f.write(output.content)
+        saved_output = await tool_output_store.save(
+            output.content, node_id=agent.state.last_node_id + 1
+        )
+        filename = saved_output["path"]
         output.content += (
             "\n\n" + f"[Note: the above tool output has been saved to {filename}]"
         )
@@ -126,6 +145,8 @@ async def _always_save(agent: Agent) -> None:
 async def _prompt_to_search(agent: Agent) -> None:
     output = await get_result_message_simple(agent)
     if output is not None:
-        await maybe_prompt_to_search_post_act(output)
+        await maybe_prompt_to_search_post_act(
+            output, node_id=agent.state.last_node_id + 1
+        )
         agent.append(output)
     agent.state.next_step["module_type"] = "prompter"
@@ -0,0 +1,296 @@
+import asyncio
+import codecs
+import os
+import shlex
+import signal
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable
+
+SpawnShell = Callable[[], Awaitable[asyncio.subprocess.Process]]
+
+# how long an interrupted command gets to exit after SIGINT, before the shell
+# and everything it started are killed
+INTERRUPT_GRACE_SECONDS = 2.0
+
+
+async def spawn_local_bash() -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(
+        "bash",
+        "--noprofile",
+        "--norc",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True,
+    )
+
+
+def _process_group_members(pgid: int) -> list[int]:
+    # the shell's children stay in its process group, since it has no job control
+    members = []
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the command name can contain spaces and parentheses, so the fields
+        # are counted from the last parenthesis
+        fields = stat.rpartition(")")[2].split()
+        if len(fields) > 2 and int(fields[2]) == pgid:
+            members.append(int(entry.name))
+    return members
+
+
+class RingBuffer:
+    """
+    Bounded text buffer. Once more than max_chars have been written, the oldest
+    text is dropped. Readers keep a cursor into the total stream of written text,
+    and are told how much they missed if the text at their cursor was dropped.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._chunks: deque[str] = deque()
+        self._size = 0
+        self.total_written = 0
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        self._chunks.append(text)
+        self._size += len(text)
+        self.total_written += len(text)
+        while self._size > self.max_chars:
+            excess = self._size - self.max_chars
+            oldest = self._chunks[0]
+            if len(oldest) <= excess:
+                self._chunks.popleft()
+                self._size -= len(oldest)
+            else:
+                self._chunks[0] = oldest[excess:]
+                self._size -= excess
+
+    def read_from(self, cursor: int) -> tuple[str, int, int]:
+        """
+        Return the text written since cursor, the new cursor, and the number of
+        characters after cursor that were dropped before they could be read.
+        """
+        start = self.total_written - self._size
+        dropped = max(0, start - cursor)
+        text = "".join(self._chunks)[max(0, cursor - start) :]
+        return text, self.total_written, dropped
+
+
+class BashJob:
+    def __init__(self, job_id: int, command: str, max_output_chars: int):
+        self.job_id = job_id
+        self.command = command
+        self.output = RingBuffer(max_output_chars)
+        self.exit_code: int | None = None
+        self.done = asyncio.Event()
+        self.cursor = 0
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.runtime_recorded = False
+
+    @property
+    def runtime(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def finish(self, exit_code: int) -> None:
+        self.exit_code = exit_code
+        self.finished_at = time.monotonic()
+        self.done.set()
+
+    def read_new_output(self) -> str:
+        text, self.cursor, dropped = self.output.read_from(self.cursor)
+        if dropped:
+            text = f"[{dropped} characters of output were dropped]\n{text}"
+        return text
+
+
+class BashSession:
+    """
+    A bash process kept alive across commands, so that the working directory,
+    environment variables and shell functions persist between tool calls.
+
+    Output is streamed into a bounded ring buffer per command. If a command is
+    still running when the caller stops waiting, the partial output is returned
+    along with a job id that can be polled later, instead of killing the command.
+    """
+
+    def __init__(
+        self,
+        spawn: SpawnShell = spawn_local_bash,
+        max_output_chars: int = 1_000_000,
+        max_jobs: int = 20,
+    ):
+        self.spawn = spawn
+        self.max_output_chars = max_output_chars
+        self.max_jobs = max_jobs
+        self.process: asyncio.subprocess.Process | None = None
+        self.cwd: str | None = None
+        self.jobs: dict[int, BashJob] = {}
+        self.current_job: BashJob | None = None
+        self._next_job_id = 1
+        self._reader: asyncio.Task | None = None
+        self._sentinel = ""
+
+    @property
+    def busy(self) -> bool:
+        return self.current_job is not None and not self.current_job.done.is_set()
+
+    async def _start(self) -> asyncio.subprocess.Process:
+        process = self.process = await self.spawn()
+        assert process.stdin is not None and process.stdout is not None
+        self._sentinel = f"__bash_session_done_{uuid.uuid4().hex}__"
+        self._reader = asyncio.create_task(self._read_output(process))
+        if self.cwd is not None:
+            # restore the working directory of the previous shell, if restarted
+            process.stdin.write(f"cd {shlex.quote(self.cwd)}\n".encode())
+        return process
+
+    async def _read_output(self, process: asyncio.subprocess.Process) -> None:
+        stdout = process.stdout
+        assert stdout is not None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while True:
+            chunk = await stdout.read(65536)
+            if not chunk:
+                break
+            pending += decoder.decode(chunk)
+            job = self.current_job
+            marker = f"\n{self._sentinel} "
+            index = pending.find(marker)
+            if index == -1:
+                # hold back text that could be the start of a sentinel split
+                # across reads, and pass the rest on to the job immediately
+                last_line = pending.rfind("\n")
+                keep = 0
+                if last_line != -1 and marker.startswith(pending[last_line:]):
+                    keep = len(pending) - last_line
+                if job is not None:
+                    job.output.write(pending[: len(pending) - keep])
+                    pending = pending[len(pending) - keep :]
+                continue
+            line_end = pending.find("\n", index + len(marker))
+            if line_end == -1:
+                continue
+            exit_code, _, cwd = pending[index + len(marker) : line_end].partition(" ")
+            if job is not None:
+                job.output.write(pending[:index])
+                job.finish(int(exit_code))
+            self.cwd = cwd or self.cwd
+            pending = pending[line_end + 1 :]
+        # the shell exited, e.g. because a command called exit
+        job = self.current_job
+        if job is not None and not job.done.is_set():
+            job.output.write(pending)
+            exit_code = await process.wait()
+            job.output.write("\n[The shell exited, so a new one will be started]")
+            job.finish(exit_code)
+        self.process = None
+
+    async def _check_syntax(self, command: str) -> str | None:
+        checker = await asyncio.create_subprocess_exec(
+            "bash",
+            "-n",
+            "-c",
+            command,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await checker.communicate()
+        if checker.returncode != 0:
+            return stderr.decode("utf-8", errors="replace")
+        return None
+
+    async def start_job(self, command: str) -> BashJob:
+        if self.busy:
+            raise RuntimeError("The shell is still running a previous command")
+        process = self.process
+        if process is None or process.returncode is not None:
+            process = await self._start()
+        stdin = process.stdin
+        assert stdin is not None
+        job = BashJob(self._next_job_id, command, self.max_output_chars)
+        self._next_job_id += 1
+        self.jobs[job.job_id] = job
+        self.current_job = job
+        # forget the output of old jobs, which is bounded but still large
+        for old_job_id in list(self.jobs)[: -self.max_jobs]:
+            del self.jobs[old_job_id]
+
+        syntax_error = await self._check_syntax(command)
+        if syntax_error is not None:
+            job.output.write(syntax_error)
+            job.finish(2)
+            return job
+
+        stdin.write(
+            (
+                f"{{\n{command}\n}} < /dev/null 2>&1\n"
+                f'printf "\\n%s %d %s\\n" {self._sentinel} $? "$PWD"\n'
+            ).encode()
+        )
+        await stdin.drain()
+        return job
+
+    async def wait(self, job: BashJob, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(job.done.wait()), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def interrupt(self, grace_seconds: float = INTERRUPT_GRACE_SECONDS) -> bool:
+        """
+        Stop the running command, sending SIGINT to the processes the shell
+        started, so the shell and its environment are kept. If the command is
+        still running after grace_seconds, or runs in the shell itself, the shell
+        is killed instead. Returns whether the shell was kept.
+        """
+        job = self.current_job
+        process = self.process
+        if process is None or job is None or job.done.is_set():
+            return True
+        sent = False
+        for pid in _process_group_members(process.pid):
+            if pid == process.pid:
+                continue
+            try:
+                os.kill(pid, signal.SIGINT)
+                sent = True
+            except ProcessLookupError:
+                pass
+        if sent and await self.wait(job, grace_seconds):
+            return True
+        await self.kill()
+        return False
+
+    async def kill(self) -> None:
+        """
+        Kill the shell and everything it started. A new shell is started in the
+        same working directory on the next command, but environment variables
+        and background processes are lost.
+        """
+        process = self.process
+        if process is None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        if self._reader is not None:
+            await self._reader
+
+    async def close(self) -> None:
+        await self.kill()
@@ -0,0 +1,93 @@
+"""
+Per-model circuit breakers, so generators can fall back to other models while a
+model is failing instead of retrying it.
+
+A model's circuit opens after failure_threshold failures in a row, where calls
+slower than slow_seconds count as failures. While it is open, the model is
+skipped. After reset_seconds, it is half open and calls are let through again:
+a success closes the circuit, and a failure opens it for another reset_seconds.
+"""
+
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+FAILURE_THRESHOLD = 3
+RESET_SECONDS = 60.0
+SLOW_SECONDS = 300.0
+
+
+@dataclass
+class CircuitBreaker:
+    failure_threshold: int = FAILURE_THRESHOLD
+    reset_seconds: float = RESET_SECONDS
+    clock: Callable[[], float] = time.monotonic
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None
+    stats: Counter = field(default_factory=Counter)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def record_success(self) -> None:
+        self.stats["successes"] += 1
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.stats["opened"] += 1
+            self.opened_at = self.clock()
+
+
+class ModelHealth:
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_seconds: float = RESET_SECONDS,
+        slow_seconds: float = SLOW_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_seconds = slow_seconds
+        self.clock = clock
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker(
+                self.failure_threshold, self.reset_seconds, self.clock
+            )
+        return self.breakers[model]
+
+    def available(self, models: Iterable[str]) -> List[str]:
+        """
+        The models to try, in order: those whose circuits let calls through, or
+        all of them if none do, since some model has to be tried.
+        """
+        models = list(models)
+        return [
+            model for model in models if self.breaker(model).state != "open"
+        ] or models
+
+    def record(self, model: str, ok: bool, seconds: float) -> bool:
+        """
+        Record the outcome of a call to model, and return whether it counts as
+        a success: it was ok, and not slower than slow_seconds.
+        """
+        ok = ok and seconds <= self.slow_seconds
+        if ok:
+            self.breaker(model).record_success()
+        else:
+            self.breaker(model).record_failure()
+        return ok
@@ -1,8 +1,10 @@
+import asyncio
 import json
 import re
+import time
 from functools import partial
 from itertools import product
-from typing import Any, Callable, Coroutine
+from typing import Any, Callable, Coroutine, Optional
 
 from pyhooks.types import (
     MiddlemanResult,
@@ -13,13 +15,17 @@ from pyhooks.types import (
 )
 
 from base import Agent, Message, hooks
+from modules import llm
 from templates import (
     assess_and_backtrack_prompt,
+    assess_and_backtrack_vote_prompt,
     claude_basic_system_prompt,
     compare_and_regenerate_prompt_v1,
     compare_options_prompt_v1,
+    compare_options_short_answer_prompt,
     get_tool_descriptions,
     gpt_basic_system_prompt,
+    reject_action_prompt,
 )
 
 
@@ -31,11 +37,37 @@ async def _basic(agent: Agent) -> None:
     agent.state.next_step["module_type"] = "actor"
 
 
+def _option_counts(agent: Agent) -> list[int]:
+    # how many samples each option stands for, as grouped by the generator
+    options = agent.state.next_step["args"]["options"]
+    counts = agent.state.next_step["args"].get("option_counts")
+    if counts is None or len(counts) != len(options):
+        return [1] * len(options)
+    return counts
+
+
+def _format_options(agent: Agent, option_indices: Optional[list[int]] = None) -> str:
+    options = agent.state.next_step["args"]["options"]
+    counts = _option_counts(agent)
+    if option_indices is None:
+        option_indices = list(range(len(options)))
+    formatted_options = ""
+    for i, index in enumerate(option_indices):
+        option = options[index]
+        option_string = json.dumps(
+            {"content": option.content, "function_call": option.function_call}
+        )
+        samples = f" (proposed in {counts[index]} samples)" if counts[index] > 1 else ""
+        formatted_options += f"\n\nOption {i}{samples}:\n{option_string}"
+    return formatted_options
+
+
 async def generate_comparison_claude_legacy(
     agent: Agent,
     middleman_settings: MiddlemanSettings,
     options_prompt_template: str,
     system_prompt: str = claude_basic_system_prompt,
+    option_indices: Optional[list[int]] = None,
 ) -> MiddlemanResult:
     system_prompt = system_prompt.format(
         tools="\n".join(get_tool_descriptions(list(agent.toolkit_dict.keys())))
@@ -51,7 +83,7 @@ async def generate_comparison_claude_legacy(
         },
     ]
     # This code is duplicated from generators:_claude_legacy_factory
-    for msg in agent.state.next_step["args"]["messages"]:
+    for msg in agent.state.get_prompt_messages():
         role = msg.role
         content = msg.content
         if msg.function_call is not None:
@@ -67,21 +99,18 @@ async def generate_comparison_claude_legacy(
                 "content": content,
             }
         )
-    formatted_options = ""
-    for i, option in enumerate(agent.state.next_step["args"]["options"]):
-        option_string = json.dumps(
-            {"content": option.content, "function_call": option.function_call}
-        )
-        formatted_options += f"\n\nOption {i}:\n{option_string}"
     wrapped_messages.append(
         {
             "role": "user",
-            "content": options_prompt_template.format(options=formatted_options),
+            "content": options_prompt_template.format(
+                options=_format_options(agent, option_indices)
+            ),
         }
     )
-    generation = await hooks.generate(
+    generation = await llm.generate(
         messages=[OpenaiChatMessage(**msg) for msg in wrapped_messages],
         settings=middleman_settings,
+        priority=llm.JUDGING,
     )
     return generation
 
@@ -91,9 +120,9 @@ async def generate_comparison_gpt(
     middleman_settings: MiddlemanSettings,
     options_prompt_template: str,
     system_prompt: str = gpt_basic_system_prompt,
+    option_indices: Optional[list[int]] = None,
 ) -> MiddlemanResult:
-    messages: list[Message] = agent.state.next_step["args"]["messages"]
-    options = agent.state.next_step["args"]["options"]
+    messages: list[Message] = agent.state.get_prompt_messages()
     wrapped_messages = [
         OpenaiChatMessage(
             role="user",
@@ -113,22 +142,19 @@ async def generate_comparison_gpt(
         }
         for k, v in agent.toolkit_dict.items()
     ]
-    formatted_options = ""
-    for i, option in enumerate(options):
-        option_string = json.dumps(
-            {"content": option.content, "function_call": option.function_call}
-        )
-        formatted_options += f"\n\nOption {i}:\n{option_string}"
     wrapped_messages.append(
         OpenaiChatMessage(
             role="user",
-            content=options_prompt_template.format(options=formatted_options),
+            content=options_prompt_template.format(
+                options=_format_options(agent, option_indices)
+            ),
         )
     )
-    generation = await hooks.generate(
+    generation = await llm.generate(
         messages=wrapped_messages,
         settings=middleman_settings,
         functions=tools,
+        priority=llm.JUDGING,
     )
     return generation
 
@@ -144,12 +170,15 @@ async def _compare_options_factory(
         )
 
     options = agent.state.next_step["args"]["options"]
+    started = time.monotonic()
+    generations = []
     choice_is_good = False
     choice = None
     while not choice_is_good:
         generation = await comparison_generator(
             agent, middleman_settings, compare_options_prompt_v1
         )
+        generations.append(generation)
         choice = re.search(
             r"<FINAL CHOICE>\s*\[?\s*(\d+)\s*\]?\s*$", generation.outputs[0].completion
         )
@@ -159,12 +188,173 @@ async def _compare_options_factory(
                 choice_is_good = True
     node_metadata = {
         "d__compare_options__original_options": options,
+        "d__compare_options__comparison": _comparison_record(
+            "reasoning", generations, started
+        ),
+        "g__generation_metadata": agent.state.next_step["args"]["generation_metadata"],
+    }
+    agent.append(options[choice], metadata=node_metadata)
+    agent.state.next_step["module_type"] = "actor"
+
+
+COMPARE_OPTIONS_SHORT_MAX_TOKENS = 16
+COMPARE_OPTIONS_SHORT_ATTEMPTS = 2
+_final_choice_re = re.compile(r"<FINAL CHOICE>\s*\[?\s*(\d+)")
+_bare_choice_re = re.compile(r"^\W*(?:option\s*)?\[?\s*(\d+)\s*\]?\W*$", re.IGNORECASE)
+
+
+def _parse_choice(completion: str, num_options: int) -> Optional[int]:
+    # "<FINAL CHOICE>[2]", "<FINAL CHOICE> 2" (cut at the stop sequence), "2",
+    # "[2]" or "Option 2"
+    matches = _final_choice_re.findall(completion)
+    if matches:
+        choice = int(matches[-1])
+    elif (match := _bare_choice_re.match(completion.strip())) is not None:
+        choice = int(match.group(1))
+    else:
+        return None
+    return choice if 0 <= choice < num_options else None
+
+
+def _comparison_record(
+    mode: str, generations: list[MiddlemanResult], started: float
+) -> dict:
+    # kept on the node, to compare the latency and cost of comparison modes
+    return {
+        "mode": mode,
+        "attempts": len(generations),
+        "latency_ms": round((time.monotonic() - started) * 1000),
+        "prompt_tokens": sum(g.n_prompt_tokens_spent or 0 for g in generations),
+        "completion_tokens": sum(g.n_completion_tokens_spent or 0 for g in generations),
+    }
+
+
+async def _compare_options_short_factory(
+    agent: Agent,
+    middleman_settings: MiddlemanSettings | None = None,
+    comparison_generator=None,
+    reasoning_settings: MiddlemanSettings | None = None,
+    max_attempts: int = COMPARE_OPTIONS_SHORT_ATTEMPTS,
+) -> None:
+    """
+    Like _compare_options_factory, but asks for the number of the best option
+    straight away, under a tiny max_tokens, instead of reasoning first.
+
+    If no valid choice comes back, the options are compared again with full
+    reasoning if reasoning_settings are given, and otherwise the option with the
+    most samples is chosen.
+    """
+    if middleman_settings is None or comparison_generator is None:
+        raise ValueError(
+            "Do not call _compare_options_short_factory directly. Use a partial application of it instead."
+        )
+
+    options = agent.state.next_step["args"]["options"]
+    started = time.monotonic()
+    generations = []
+    choice = None
+    mode = "short"
+    attempts = [(middleman_settings, compare_options_short_answer_prompt, mode)]
+    if reasoning_settings is not None:
+        attempts.append((reasoning_settings, compare_options_prompt_v1, "reasoning"))
+    for settings, prompt, mode in attempts:
+        for _ in range(max_attempts):
+            generation = await comparison_generator(agent, settings, prompt)
+            generations.append(generation)
+            if generation.outputs:
+                choice = _parse_choice(generation.outputs[0].completion, len(options))
+            if choice is not None:
+                break
+        if choice is not None:
+            break
+    if choice is None:
+        mode = "most_sampled"
+        counts = _option_counts(agent)
+        choice = max(range(len(options)), key=lambda index: counts[index])
+
+    node_metadata = {
+        "d__compare_options__original_options": options,
+        "d__compare_options__comparison": _comparison_record(
+            mode, generations, started
+        ),
         "g__generation_metadata": agent.state.next_step["args"]["generation_metadata"],
     }
     agent.append(options[choice], metadata=node_metadata)
     agent.state.next_step["module_type"] = "actor"
 
 
+TOURNAMENT_BRACKET_SIZE = 4
+TOURNAMENT_MAX_CONCURRENCY = 8
+TOURNAMENT_MAX_ATTEMPTS = 3
+
+
+async def _tournament_factory(
+    agent: Agent,
+    middleman_settings: MiddlemanSettings | None = None,
+    comparison_generator=None,
+    bracket_size: int = TOURNAMENT_BRACKET_SIZE,
+    max_concurrency: int = TOURNAMENT_MAX_CONCURRENCY,
+    max_attempts: int = TOURNAMENT_MAX_ATTEMPTS,
+) -> None:
+    """
+    Like _compare_options_factory, but for many options: the options are split
+    into brackets of bracket_size, which are compared concurrently, and the
+    winners of each round advance until one option remains. A bracket whose
+    comparisons keep failing to name a valid choice is won by its option with
+    the most samples.
+    """
+    if middleman_settings is None or comparison_generator is None:
+        raise ValueError(
+            "Do not call _tournament_factory directly. Use a partial application of it instead."
+        )
+
+    options = agent.state.next_step["args"]["options"]
+    counts = _option_counts(agent)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def judge(bracket: list[int]) -> dict:
+        result: dict[str, Any] = {"options": bracket, "attempts": 0}
+        if len(bracket) == 1:
+            return {**result, "winner": bracket[0]}
+        for _ in range(max_attempts):
+            result["attempts"] += 1
+            async with semaphore:
+                generation = await comparison_generator(
+                    agent,
+                    middleman_settings,
+                    compare_options_prompt_v1,
+                    option_indices=bracket,
+                )
+            if not generation.outputs:
+                continue
+            choice = re.search(
+                r"<FINAL CHOICE>\s*\[?\s*(\d+)\s*\]?\s*$",
+                generation.outputs[0].completion,
+            )
+            if choice is not None and 0 <= int(choice.group(1)) < len(bracket):
+                return {**result, "winner": bracket[int(choice.group(1))]}
+        return {**result, "winner": max(bracket, key=lambda index: counts[index])}
+
+    contenders = list(range(len(options)))
+    rounds = []
+    while len(contenders) > 1:
+        brackets = [
+            contenders[i : i + bracket_size]
+            for i in range(0, len(contenders), bracket_size)
+        ]
+        results = await asyncio.gather(*(judge(bracket) for bracket in brackets))
+        rounds.append(results)
+        contenders = [result["winner"] for result in results]
+
+    node_metadata = {
+        "d__tournament__original_options": options,
+        "d__tournament__rounds": rounds,
+        "g__generation_metadata": agent.state.next_step["args"]["generation_metadata"],
+    }
+    agent.append(options[contenders[0]], metadata=node_metadata)
+    agent.state.next_step["module_type"] = "actor"
+
+
 async def _fixed_rating_factory(agent: Agent) -> None:
     options: list[Message] = agent.state.next_step["args"]["options"]
     fixed_rating = 0.1
@@ -216,15 +406,19 @@ async def _fixed_rating_factory(agent: Agent) -> None:
         return
 
     rating_options = [
-        RatingOption(action=form_action(option), fixedRating=fixed_rating)
-        for option in options
+        RatingOption(
+            action=form_action(option),
+            fixedRating=fixed_rating,
+            duplicates=count if count > 1 else None,
+        )
+        for option, count in zip(options, _option_counts(agent))
     ]
     rating_template = "[Inert, should have no effect] {{&transcipt}} {{&actions}}"
     transcript = "[Inert, should have no effect]"
     # TODO: set as a dummy-but-permissioned model, or to the generation model
     # "testing-dummy:4096:cl100k_base" did not work
     rating_model = "gpt-4o-mini-2024-07-18"
-    rated_action: RatedOption = await hooks.rate_options(
+    rated_action: RatedOption = await llm.rate_options(
         rating_template=rating_template,
         transcript=transcript,
         options=rating_options,
@@ -295,6 +489,7 @@ async def _compare_and_regenerate_gpt_factory(
         agent.state.next_step["module_type"] = "actor"
     else:
         agent.state.next_step["args"]["options"] = new_options
+        agent.state.next_step["args"].pop("option_counts", None)
         await _compare_and_regenerate_gpt_factory(
             agent, n_rounds=n_rounds - 1, middleman_settings=middleman_settings
         )
@@ -349,13 +544,129 @@ async def _assess_and_backtrack_gpt_factory(
             agent.append(
                 Message(
                     role="user",
-                    content=f"The following action is not on the right track: {action.content}\n\nConsider a different approach.",
+                    content=reject_action_prompt.format(action=action.content),
                     function_call=None,
                 )
             )
             agent.state.next_step["module_type"] = "generator"
 
 
+ASSESS_AND_BACKTRACK_MAX_ROUNDS = 2
+_verdict_re = re.compile(r"<VERDICT>\s*(APPROVE|REJECT)\b")
+
+
+def _parse_verdict(completion: str) -> Optional[bool]:
+    # only the tagged verdict counts, not "approve" or "reject" in the reasoning
+    verdicts = _verdict_re.findall(completion)
+    if not verdicts:
+        return None
+    return verdicts[-1] == "APPROVE"
+
+
+async def _assess_and_backtrack_vote_factory(
+    agent: Agent,
+    comparison_generator: Callable[
+        [Agent, MiddlemanSettings, str],
+        Coroutine[Any, Any, MiddlemanResult],
+    ],
+    middleman_settings: MiddlemanSettings | None = None,
+    n_judges: int = 3,
+    quorum: Optional[int] = None,
+    max_rounds: int = ASSESS_AND_BACKTRACK_MAX_ROUNDS,
+) -> None:
+    """
+    Like _assess_and_backtrack_gpt_factory, but asks n_judges judges at once.
+    As soon as quorum of them (by default a majority) agree, the judges still
+    running are cancelled. Judges without a verdict abstain, as do judges whose
+    request fails.
+
+    Without a quorum, the verdict with more votes wins, and ties approve. If
+    no judge gives a verdict in max_rounds rounds, the action is approved.
+    """
+    if middleman_settings is None:
+        raise ValueError(
+            "Do not call _assess_and_backtrack_vote_factory directly. Use a partial application of it instead."
+        )
+    if quorum is None:
+        quorum = n_judges // 2 + 1
+
+    middleman_settings_copy = MiddlemanSettings(
+        n=1,
+        model=middleman_settings.model,
+        temp=middleman_settings.temp,
+        max_tokens=middleman_settings.max_tokens,
+        stop=middleman_settings.stop,
+    )
+
+    async def judge() -> Optional[bool]:
+        generation = await comparison_generator(
+            agent, middleman_settings_copy, assess_and_backtrack_vote_prompt
+        )
+        if not generation.outputs:
+            return None
+        return _parse_verdict(generation.outputs[0].completion)
+
+    votes = {True: 0, False: 0, None: 0}
+    failed = 0
+    cancelled = 0
+    rounds = 0
+    started = time.monotonic()
+    while votes[True] + votes[False] == 0 and rounds < max_rounds:
+        rounds += 1
+        pending = {asyncio.create_task(judge()) for _ in range(n_judges)}
+        try:
+            while pending and max(votes[True], votes[False]) < quorum:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        failed += 1
+                        votes[None] += 1
+                    else:
+                        votes[task.result()] += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            cancelled += len(pending)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    approved = votes[True] >= votes[False]
+    node_metadata = {
+        "d__assess_and_backtrack__votes": {
+            "approve": votes[True],
+            "reject": votes[False],
+            "abstain": votes[None],
+            "failed": failed,
+            "cancelled": cancelled,
+            "rounds": rounds,
+            "agreement": max(votes[True], votes[False])
+            / max(1, votes[True] + votes[False]),
+            "latency_ms": round((time.monotonic() - started) * 1000),
+        },
+    }
+    action = agent.state.next_step["args"]["options"][0]
+    if approved:
+        node_metadata["d__compare_and_regenerate__original_options"] = (
+            agent.state.next_step["args"]["options"]
+        )
+        node_metadata["g__generation_metadata"] = agent.state.next_step["args"][
+            "generation_metadata"
+        ]
+        agent.append(action, metadata=node_metadata)
+        agent.state.next_step["module_type"] = "actor"
+    else:
+        agent.append(
+            Message(
+                role="user",
+                content=reject_action_prompt.format(action=action.content),
+                function_call=None,
+            ),
+            metadata=node_metadata,
+        )
+        agent.state.next_step["module_type"] = "generator"
+
+
 models_and_comparison_generators = [
     ("gpt-4-0613", "4", generate_comparison_gpt),
     ("gpt-4-turbo-2024-04-09", "4t", generate_comparison_gpt),
@@ -380,6 +691,38 @@ for model, desc, comparison_generator in models_and_comparison_generators:
     )
 
 
+# o1 models spend their max_tokens on hidden reasoning, so they can't give a
+# short answer under a tiny budget
+for model, desc, comparison_generator in models_and_comparison_generators:
+    if desc.startswith("o1"):
+        continue
+    globals()[f"_compare_options_short_{desc}"] = partial(
+        _compare_options_short_factory,
+        middleman_settings=MiddlemanSettings(
+            n=1,
+            model=model,
+            temp=1,
+            max_tokens=COMPARE_OPTIONS_SHORT_MAX_TOKENS,
+            stop=["</FINAL CHOICE>"],
+        ),
+        comparison_generator=comparison_generator,
+    )
+    globals()[f"_compare_options_short_or_reason_{desc}"] = partial(
+        globals()[f"_compare_options_short_{desc}"],
+        reasoning_settings=MiddlemanSettings(
+            n=1, model=model, temp=1, max_tokens=3600, stop=["</FINAL CHOICE>"]
+        ),
+    )
+
+for model, desc, comparison_generator in models_and_comparison_generators:
+    globals()[f"_tournament_{desc}"] = partial(
+        _tournament_factory,
+        middleman_settings=MiddlemanSettings(
+            n=1, model=model, temp=1, max_tokens=3600, stop=["</FINAL CHOICE>"]
+        ),
+        comparison_generator=comparison_generator,
+    )
+
 for (model, desc, _), n_rounds in product(
     models_and_comparison_generators, range(1, 6)
 ):
@@ -407,3 +750,15 @@ for model, desc, comparison_generator in models_and_comparison_generators:
             n=1, model=model, temp=1, max_tokens=4096, stop=[]
         ),
     )
+
+for (model, desc, comparison_generator), n_judges in product(
+    models_and_comparison_generators, [3, 5]
+):
+    globals()[f"_assess_and_backtrack_{n_judges}_judges_gpt_{desc}"] = partial(
+        _assess_and_backtrack_vote_factory,
+        comparison_generator=comparison_generator,
+        middleman_settings=MiddlemanSettings(
+            n=1, model=model, temp=1, max_tokens=4096, stop=["</VERDICT>"]
+        ),
+        n_judges=n_judges,
+    )
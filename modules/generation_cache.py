@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from pydantic import BaseModel
+from pyhooks.types import MiddlemanResult, MiddlemanSettings
+
+
+def _to_jsonable(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return _to_jsonable(obj.model_dump())
+    if isinstance(obj, dict):
+        return {str(k): _to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(item) for item in obj]
+    return obj
+
+
+def request_hash(
+    messages: list, settings: MiddlemanSettings, functions: Optional[list] = None
+) -> str:
+    """
+    Canonical hash of a generation request. Messages may be pydantic models or
+    plain dicts, and key order doesn't matter.
+    """
+    payload = {
+        "messages": _to_jsonable(messages),
+        "settings": _to_jsonable(settings),
+        "functions": _to_jsonable(functions),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    On-disk LRU cache of generation results, keyed by a canonical hash of the
+    request.
+
+    Only requests whose results are reproducible are cached: those at temperature
+    0, or any request in replay mode, where a run is meant to repeat an earlier
+    run's generations exactly. The k-th identical request within a process maps
+    to its own entry, so retry loops that re-ask the same question still get new
+    generations instead of the same cached failure forever, while a replayed run
+    sees the same sequence of results as the original.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        replay: bool = False,
+        max_entries: int = 10_000,
+        max_bytes: int = 1 << 30,
+    ):
+        self.directory = directory
+        self.replay = replay
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "uncacheable": 0, "evictions": 0}
+        self._occurrences: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._entries: Optional[OrderedDict[str, int]] = None
+        self._total_bytes = 0
+
+    def is_cacheable(self, settings: MiddlemanSettings) -> bool:
+        return self.replay or settings.temp == 0
+
+    def key(
+        self,
+        messages: list,
+        settings: MiddlemanSettings,
+        functions: Optional[list] = None,
+    ) -> str:
+        """
+        Cache key for the next occurrence of this request.
+        """
+        digest = request_hash(messages, settings, functions)
+        with self._lock:
+            occurrence = self._occurrences.get(digest, 0)
+            self._occurrences[digest] = occurrence + 1
+        return f"{digest}_{occurrence}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_entries(self) -> OrderedDict[str, int]:
+        # least recently used first, by modification time, which is bumped on hits
+        if self._entries is None:
+            os.makedirs(self.directory, exist_ok=True)
+            files = [
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name.endswith(".json")
+            ]
+            files.sort(key=lambda entry: entry.stat().st_mtime_ns)
+            self._entries = OrderedDict(
+                (entry.name.removesuffix(".json"), entry.stat().st_size)
+                for entry in files
+            )
+            self._total_bytes = sum(self._entries.values())
+        return self._entries
+
+    def get(self, key: str) -> Optional[MiddlemanResult]:
+        with self._lock:
+            entries = self._load_entries()
+            if key not in entries:
+                self.stats["misses"] += 1
+                return None
+            try:
+                with open(self._path(key)) as f:
+                    result = MiddlemanResult(**json.load(f))
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                # missing or corrupt, e.g. deleted by another process
+                self._total_bytes -= entries.pop(key)
+                self.stats["misses"] += 1
+                return None
+            entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return result
+
+    def put(self, key: str, result: MiddlemanResult) -> None:
+        if result.error is not None or not result.outputs:
+            return
+        data = json.dumps(result.model_dump()).encode("utf-8")
+        with self._lock:
+            entries = self._load_entries()
+            path = self._path(key)
+            tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - entries.pop(key, 0)
+            entries[key] = len(data)
+            while len(entries) > 1 and (
+                len(entries) > self.max_entries or self._total_bytes > self.max_bytes
+            ):
+                old_key, size = entries.popitem(last=False)
+                self._total_bytes -= size
+                self.stats["evictions"] += 1
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
@@ -1,11 +1,18 @@
 import copy
+import os
+import time
+from collections import Counter
 from functools import partial
 from itertools import product
 from typing import Optional, cast
 
-from pyhooks.types import MiddlemanSettings, OpenaiChatMessage
+from pyhooks.types import MiddlemanResult, MiddlemanSettings, OpenaiChatMessage
 
-from base import Agent, Message, hooks
+from base import Agent, Message
+from modules import llm
+from modules.circuit_breaker import ModelHealth
+from modules.option_dedup import dedupe_options
+from modules.sampling import adapt_sampling
 from templates import (
     claude_basic_system_prompt,
     get_tool_descriptions,
@@ -13,6 +20,156 @@ from templates import (
 )
 
 ANTHROPIC_STOP_SEQUENCE_LIMIT = 4
+# Tool outputs are shown to claude_legacy models as <[tool]-output>...</[tool]-output>,
+# and a model that isn't stopped after a tool call goes on to write one itself.
+TOOL_OUTPUT_STOP_SEQUENCE = "-output>"
+OPTION_NEAR_DUPLICATE_THRESHOLD: Optional[float] = None
+
+
+def configure_from_env() -> None:
+    # Set OPTION_NEAR_DUPLICATE_THRESHOLD (a similarity between 0 and 1, e.g. 0.9)
+    # to also group options whose actions are near-duplicates, not just identical.
+    global OPTION_NEAR_DUPLICATE_THRESHOLD
+    OPTION_NEAR_DUPLICATE_THRESHOLD = (
+        float(os.environ["OPTION_NEAR_DUPLICATE_THRESHOLD"])
+        if os.environ.get("OPTION_NEAR_DUPLICATE_THRESHOLD")
+        else None
+    )
+
+
+configure_from_env()
+
+# how many times _gpt_basic_factory asks for the options it is still missing
+MAX_GENERATION_ATTEMPTS = 3
+model_health = ModelHealth()
+
+
+def _add_prompt_metadata(agent: Agent, generation_metadata: dict) -> None:
+    # set by prompters that track how the prompt was laid out, e.g. _prefix_stable
+    prompt_metadata = agent.state.next_step["args"].get("prompt_metadata")
+    if prompt_metadata is not None:
+        generation_metadata["prompt"] = prompt_metadata
+
+
+def _sampling_settings(
+    agent: Agent, middleman_settings: MiddlemanSettings, generation_metadata: dict
+) -> MiddlemanSettings:
+    # with Settings.adaptive_sampling, n and max_tokens follow the budget left
+    if not agent.settings.adaptive_sampling:
+        return copy.deepcopy(middleman_settings)
+    adapted, decision = adapt_sampling(agent.state, middleman_settings)
+    generation_metadata["sampling"] = decision
+    return adapted
+
+
+async def _generate_with_fallbacks(
+    agent: Agent,
+    middleman_settings: MiddlemanSettings,
+    generation_metadata: dict,
+    **kwargs,
+) -> MiddlemanResult:
+    """
+    Generate with middleman_settings.model or, while it fails or its circuit is
+    open, with the models it falls back to in Settings.model_fallbacks. The
+    models passed over are recorded in generation_metadata["fallbacks"].
+    """
+    chain = [
+        middleman_settings.model,
+        *agent.settings.model_fallbacks.get(middleman_settings.model, []),
+    ]
+    models = model_health.available(chain)
+    fallbacks = generation_metadata.setdefault("fallbacks", [])
+    fallbacks += [
+        {"model": model, "reason": "circuit open"}
+        for model in chain
+        if model not in models
+    ]
+
+    async def attempt(model: str) -> MiddlemanResult:
+        settings = copy.deepcopy(middleman_settings)
+        settings.model = model
+        started = time.monotonic()
+        try:
+            result = await llm.generate(settings=settings, **kwargs)
+        except Exception:
+            model_health.record(model, False, time.monotonic() - started)
+            raise
+        ok = result.error is None and bool(result.outputs)
+        model_health.record(model, ok, time.monotonic() - started)
+        return result
+
+    # the last model is always tried, and its result or error is passed on as is
+    model = models[-1]
+    result: Optional[MiddlemanResult] = None
+    for model in models[:-1]:
+        try:
+            result = await attempt(model)
+        except Exception as e:
+            fallbacks.append({"model": model, "reason": repr(e)[:500]})
+            continue
+        if result.error is None and result.outputs:
+            break
+        fallbacks.append({"model": model, "reason": repr(result.error)[:500]})
+        result = None
+    if result is None:
+        model = models[-1]
+        result = await attempt(model)
+    if not fallbacks:
+        del generation_metadata["fallbacks"]
+    if model != middleman_settings.model:
+        generation_metadata["model"] = model
+    return result
+
+
+def _claude_legacy_stop_sequences(agent: Agent) -> list[str]:
+    """
+    Stop sequences that end the generation after a call to any tool. If there
+    are more tools than stop sequences allowed, the tools called most so far get
+    their closing tags, and calls to the others are stopped by
+    TOOL_OUTPUT_STOP_SEQUENCE once the model starts making up their output.
+    """
+    tools = list(agent.toolkit_dict)
+    if len(tools) <= ANTHROPIC_STOP_SEQUENCE_LIMIT:
+        return [f"</{tool}" for tool in tools]
+    calls = Counter(
+        node.message.function_call["name"]
+        for node in agent.state.nodes
+        if node.message.function_call is not None
+    )
+    tools.sort(key=lambda tool: -calls[tool])
+    return [f"</{tool}" for tool in tools[: ANTHROPIC_STOP_SEQUENCE_LIMIT - 1]] + [
+        TOOL_OUTPUT_STOP_SEQUENCE
+    ]
+
+
+def _truncate_after_tool_call(generation: str, tools: list[str]) -> str:
+    # drop anything written after the first tool call, e.g. a made-up output
+    ends = [
+        generation.find(f"</{tool}>") + len(f"</{tool}>")
+        for tool in tools
+        if f"</{tool}>" in generation
+    ]
+    return generation[: min(ends)] if ends else generation
+
+
+def _set_options(
+    agent: Agent, options: list[Message], generation_metadata: dict
+) -> None:
+    """
+    Hand the options to the discriminator, with options that take the same
+    action grouped into one, and the number of samples for each in
+    next_step["args"]["option_counts"].
+    """
+    groups = dedupe_options(options, OPTION_NEAR_DUPLICATE_THRESHOLD)
+    if len(groups) < len(options):
+        generation_metadata["option_counts"] = [group.count for group in groups]
+    _add_prompt_metadata(agent, generation_metadata)
+    agent.state.next_step["module_type"] = "discriminator"
+    agent.state.next_step["args"].update(
+        generation_metadata=generation_metadata,
+        options=[group.option for group in groups],
+        option_counts=[group.count for group in groups],
+    )
 
 
 async def _claude_legacy_factory(
@@ -23,13 +180,14 @@ async def _claude_legacy_factory(
             "Do not call _claude_legacy_factory directly. Use a partial application of it instead."
         )
 
-    messages = agent.state.next_step["args"]["messages"]
+    messages = agent.state.get_prompt_messages()
 
-    middleman_settings_copy = copy.deepcopy(middleman_settings)
-    middleman_settings_copy.stop = [f"</{tool}" for tool in agent.toolkit_dict][
-        :ANTHROPIC_STOP_SEQUENCE_LIMIT
-    ]
-    messages = agent.state.next_step["args"]["messages"]
+    step_metadata = {}
+    middleman_settings_copy = _sampling_settings(
+        agent, middleman_settings, step_metadata
+    )
+    middleman_settings_copy.stop = _claude_legacy_stop_sequences(agent)
+    messages = agent.state.get_prompt_messages()
     wrapped_messages = [
         {
             "role": "system",
@@ -65,17 +223,24 @@ async def _claude_legacy_factory(
                 "content": "No function call was included in the last message. Please include a function call in the next message using the <[tool_name]> [args] </[tool_name]> syntax.",
             }
         )
-    generations = await hooks.generate(
+    generations = await _generate_with_fallbacks(
+        agent,
+        middleman_settings_copy,
+        step_metadata,
         messages=[OpenaiChatMessage(**msg) for msg in wrapped_messages],
-        settings=middleman_settings_copy,
     )
     if generations.outputs is None:
         raise ValueError("No generations returned from claude_legacy_factory")
 
     generation = generations.outputs[0].completion
     messages = []
+    # text generated past the tool call, which the stop sequences should prevent
+    chars_after_tool_call = 0
     for output in generations.outputs:
-        generation = output.completion
+        generation = _truncate_after_tool_call(
+            output.completion, list(agent.toolkit_dict)
+        )
+        chars_after_tool_call += len(output.completion) - len(generation)
         last_tool_loc, last_tool = max(
             [(generation.find(f"<{tool}>"), tool) for tool in agent.toolkit_dict]
         )
@@ -94,11 +259,12 @@ async def _claude_legacy_factory(
             function_call=function_call,
         )
         messages.append(message)
-    agent.state.next_step["module_type"] = "discriminator"
-    agent.state.next_step["args"]["options"] = messages
-    agent.state.next_step["args"]["generation_metadata"] = {
+    generation_metadata = {
         k: v for k, v in generations.model_dump().items() if k != "outputs"
     }
+    generation_metadata.update(step_metadata)
+    generation_metadata["chars_after_tool_call"] = chars_after_tool_call
+    _set_options(agent, messages, generation_metadata)
 
 
 claude_legacy_compat_models = [
@@ -129,10 +295,13 @@ async def _gpt_basic_factory(
             "Do not call _gpt_basic_factory directly. Use a partial application of it instead."
         )
 
-    messages: list[Message] = agent.state.next_step["args"]["messages"]
+    messages: list[Message] = agent.state.get_prompt_messages()
 
     # make a copy so we can decrement n later
-    middleman_settings_copy = copy.deepcopy(middleman_settings)
+    step_metadata = {}
+    middleman_settings_copy = _sampling_settings(
+        agent, middleman_settings, step_metadata
+    )
     wrapped_messages = [
         {
             "role": "user",
@@ -152,13 +321,15 @@ async def _gpt_basic_factory(
         }
         for k, v in agent.toolkit_dict.items()
     ]
-    num_to_generate = middleman_settings.n
+    num_to_generate = middleman_settings_copy.n
     generations = []
     generation_metadata = {}
-    while middleman_settings_copy.n > 0:
-        generation_n = await hooks.generate(
+    for _ in range(MAX_GENERATION_ATTEMPTS):
+        generation_n = await _generate_with_fallbacks(
+            agent,
+            middleman_settings_copy,
+            step_metadata,
             messages=[cast(OpenaiChatMessage, msg) for msg in wrapped_messages],
-            settings=middleman_settings_copy,
             functions=tools,
         )
         generations += [
@@ -170,7 +341,12 @@ async def _gpt_basic_factory(
         generation_metadata = {
             k: v for k, v in generation_n.model_dump().items() if k != "outputs"
         }
+        if middleman_settings_copy.n <= 0:
+            break
+    if not generations:
+        raise ValueError("No valid generations returned from gpt_basic_factory")
 
+    generation_metadata.update(step_metadata)
     options = [
         Message(
             role="assistant",
@@ -179,11 +355,7 @@ async def _gpt_basic_factory(
         )
         for g in generations
     ]
-    agent.state.next_step["module_type"] = "discriminator"
-    agent.state.next_step["args"].update(
-        generation_metadata=generation_metadata,
-        options=options,
-    )
+    _set_options(agent, options, generation_metadata)
 
 
 gpt_models = [
@@ -0,0 +1,136 @@
+"""
+Hedged model calls, to cut the tail latency of a step.
+
+The latency of recent calls is kept in memory for each kind of call, e.g. each
+model, n and max_tokens (see latency_key), since those set how long a call
+takes. Once a kind has enough samples, a call that takes longer than a given
+percentile of them gets a duplicate, and whichever responds first is used; the
+other is cancelled. An original call that loses is recorded as taking as long as
+it ran before being cancelled. The estimated tokens of duplicates are capped to a fraction
+of the tokens of all calls, to bound their cost.
+"""
+
+import asyncio
+import math
+import time
+from collections import Counter, defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+LATENCY_SAMPLES = 500
+MIN_SAMPLES = 20
+
+
+def latency_key(model: str, n: Optional[int], max_tokens: Optional[int]) -> tuple:
+    # max_tokens is rounded up to a power of two, so that similar calls share
+    # their samples
+    bucket = 2 ** math.ceil(math.log2(max_tokens)) if max_tokens else None
+    return (model, n or 1, bucket)
+
+
+class LatencyHistogram:
+    def __init__(self, max_samples: int = LATENCY_SAMPLES):
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> float:
+        # nearest-rank percentile of the recent samples
+        ordered = sorted(self.samples)
+        rank = math.ceil(percentile / 100 * len(ordered))
+        return ordered[min(len(ordered), max(1, rank)) - 1]
+
+
+class Hedger:
+    def __init__(
+        self,
+        percentile: Optional[float] = None,
+        max_hedge_fraction: float = 0.05,
+        min_samples: int = MIN_SAMPLES,
+    ):
+        """
+        Calls are hedged after the given percentile of the latency of calls
+        like them, and only while duplicates have used less than
+        max_hedge_fraction of the estimated tokens of all calls. Without a
+        percentile, latencies are still recorded but nothing is hedged.
+        """
+        self.percentile = percentile
+        self.max_hedge_fraction = max_hedge_fraction
+        self.min_samples = min_samples
+        self.histograms: Dict[Hashable, LatencyHistogram] = defaultdict(
+            LatencyHistogram
+        )
+        self.stats = Counter()
+
+    def hedge_delay(self, key: Hashable) -> Optional[float]:
+        histogram = self.histograms[key]
+        if self.percentile is None or len(histogram) < self.min_samples:
+            return None
+        return histogram.percentile(self.percentile)
+
+    def _can_hedge(self) -> bool:
+        return (
+            self.stats["hedged_tokens"] < self.max_hedge_fraction * self.stats["tokens"]
+        )
+
+    async def _timed(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        result = await call()
+        self.histograms[key].record(time.monotonic() - started)
+        return result
+
+    async def run(
+        self, call: Callable[[], Awaitable[T]], key: Hashable, tokens: int = 1
+    ) -> T:
+        """
+        Await call(), keeping its latency under key, and hedge it if it is slow.
+        tokens is the estimated number of tokens the call uses.
+        """
+        tokens = max(1, tokens)
+        self.stats["calls"] += 1
+        self.stats["tokens"] += tokens
+        delay = self.hedge_delay(key)
+        started = time.monotonic()
+        first = asyncio.ensure_future(self._timed(key, call))
+        if delay is None:
+            return await first
+        try:
+            return await asyncio.wait_for(asyncio.shield(first), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if not self._can_hedge():
+            return await first
+
+        self.stats["hedged"] += 1
+        self.stats["hedged_tokens"] += tokens
+        pending = {first, asyncio.ensure_future(self._timed(key, call))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.stats["hedge_won"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            # both calls failed
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if first in pending:
+                # the slow call never completes, so record how long it ran for at
+                # least; leaving it out would make the percentiles too low
+                self.histograms[key].record(time.monotonic() - started)
@@ -0,0 +1,186 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+
+# Vision models downscale larger images anyway, so sending more pixels than this
+# only costs upload time and tokens.
+MAX_IMAGE_DIMENSION = 2048
+MAX_IMAGE_BYTES = 4 * 1024 * 1024
+JPEG_QUALITY = 85
+
+
+def _load_pillow():
+    # Pillow is optional; without it images are sent as they are. It is imported
+    # on first use, since most runs never look at an image.
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+mime_types = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    digest: str
+    data_url: str
+    original_bytes: int
+    encoded_bytes: int
+    resized: bool
+
+
+class _LRU(OrderedDict):
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def get_recent(self, key):
+        if key not in self:
+            return None
+        self.move_to_end(key)
+        return self[key]
+
+    def put(self, key, value) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+class ImagePipeline:
+    """
+    Prepares image files for a vision model and caches the results.
+
+    Images are read, hashed and, if Pillow is installed and they exceed the size
+    budget, downscaled and re-encoded on a thread pool, so large images never
+    block the event loop. The encoded data URL is cached by content hash (and the
+    content hash by file path and modification time, so unchanged files are not
+    read again), and answers from the vision model are cached by content hash
+    and query.
+    """
+
+    def __init__(
+        self,
+        max_dimension: int = MAX_IMAGE_DIMENSION,
+        max_bytes: int = MAX_IMAGE_BYTES,
+        max_workers: int = 4,
+        max_cached_images: int = 64,
+        max_cached_answers: int = 256,
+    ):
+        self.max_dimension = max_dimension
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="image_pipeline"
+        )
+        self._lock = threading.Lock()
+        self._digests_by_path = _LRU(max_cached_images * 4)
+        self._images = _LRU(max_cached_images)
+        self._answers = _LRU(max_cached_answers)
+        self.stats = {"image_hits": 0, "image_misses": 0, "answer_hits": 0}
+
+    def _encode_sync(self, data: bytes, mime_type: str) -> tuple[bytes, str, bool]:
+        Image = _load_pillow()
+        if Image is None:
+            return data, mime_type, False
+        try:
+            image = Image.open(io.BytesIO(data))
+            if max(image.size) <= self.max_dimension and len(data) <= self.max_bytes:
+                return data, mime_type, False
+            image.load()
+        except OSError:
+            # let the vision model make what it can of files Pillow can't read
+            return data, mime_type, False
+        with image:
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+                image.mode == "P" and "transparency" in image.info
+            )
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        dimension = min(self.max_dimension, max(image.size))
+        while True:
+            resized = image.copy()
+            resized.thumbnail((dimension, dimension))
+            buffer = io.BytesIO()
+            if has_alpha:
+                resized.save(buffer, format="PNG", optimize=True)
+                mime_type = "image/png"
+            else:
+                resized.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+                mime_type = "image/jpeg"
+            if buffer.tell() <= self.max_bytes or dimension <= 256:
+                return buffer.getvalue(), mime_type, True
+            dimension = dimension * 3 // 4
+
+    def _prepare_sync(self, path: str) -> PreparedImage:
+        stat = os.stat(path)
+        path_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests_by_path.get_recent(path_key)
+            prepared = self._images.get_recent(digest) if digest else None
+            if prepared is not None:
+                self.stats["image_hits"] += 1
+                return prepared
+
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data:
+            raise ValueError(f"Image is empty: {path}")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._digests_by_path.put(path_key, digest)
+            prepared = self._images.get_recent(digest)
+            if prepared is not None:
+                # same content under another name
+                self.stats["image_hits"] += 1
+                return prepared
+            self.stats["image_misses"] += 1
+
+        extension = os.path.splitext(path)[1].lower()
+        encoded, mime_type, resized = self._encode_sync(
+            data, mime_types.get(extension, f"image/{extension[1:]}")
+        )
+        prepared = PreparedImage(
+            digest=digest,
+            data_url=f"data:{mime_type};base64,"
+            + base64.b64encode(encoded).decode("utf-8"),
+            original_bytes=len(data),
+            encoded_bytes=len(encoded),
+            resized=resized,
+        )
+        with self._lock:
+            self._images.put(digest, prepared)
+        return prepared
+
+    async def prepare(self, path: str) -> PreparedImage:
+        """
+        Return the image at path as a data URL within the size budget, along with
+        its content hash.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._prepare_sync, path)
+
+    def cached_answer(self, digest: str, query: Optional[str]) -> Optional[str]:
+        with self._lock:
+            answer = self._answers.get_recent((digest, query))
+            if answer is not None:
+                self.stats["answer_hits"] += 1
+            return answer
+
+    def cache_answer(self, digest: str, query: Optional[str], answer: str) -> None:
+        with self._lock:
+            self._answers.put((digest, query), answer)
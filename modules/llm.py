@@ -0,0 +1,131 @@
+import json
+import os
+from typing import Any, Optional
+
+from pyhooks.types import MiddlemanResult, MiddlemanSettings
+
+from base import hooks
+from modules.generation_cache import GenerationCache
+from modules.hedging import Hedger, latency_key
+from modules.scheduler import GENERATION, JUDGING, OTHER, RequestScheduler
+
+generation_cache: Optional[GenerationCache] = None
+scheduler = RequestScheduler()
+hedger = Hedger()
+
+
+def configure_from_env() -> None:
+    """
+    Build the generation cache, scheduler and hedger from the environment. Runs
+    on import, and again in each worker of supervisor.py once it has applied the
+    environment of its run.
+    """
+    global generation_cache, scheduler, hedger
+    # Set GENERATION_CACHE_DIR to cache generations on disk, e.g. to make reruns
+    # in an evaluation harness instant. Only temperature 0 requests are cached,
+    # unless GENERATION_CACHE_REPLAY is also set.
+    generation_cache = None
+    if os.environ.get("GENERATION_CACHE_DIR"):
+        generation_cache = GenerationCache(
+            os.environ["GENERATION_CACHE_DIR"],
+            replay=bool(os.environ.get("GENERATION_CACHE_REPLAY")),
+        )
+
+    # All model calls share one scheduler (see modules/scheduler.py). Set
+    # MAX_CONCURRENT_MODEL_REQUESTS to change how many run at once, and
+    # MODEL_RATE_LIMITS to a JSON object like
+    # {"gpt-4o-2024-05-13": {"requests_per_minute": 500, "tokens_per_minute": 300000}}
+    # to keep models within their provider limits.
+    scheduler = RequestScheduler(
+        max_concurrency=int(os.environ.get("MAX_CONCURRENT_MODEL_REQUESTS") or 16),
+        model_limits=json.loads(os.environ.get("MODEL_RATE_LIMITS") or "{}"),
+    )
+
+    # Set HEDGE_LATENCY_PERCENTILE (e.g. 95) to send a duplicate of generate
+    # calls that take longer than that percentile of the recent latencies of
+    # similar calls, for at most HEDGE_MAX_FRACTION (default 0.05) of the
+    # estimated tokens of all calls.
+    hedger = Hedger(
+        percentile=float(os.environ["HEDGE_LATENCY_PERCENTILE"])
+        if os.environ.get("HEDGE_LATENCY_PERCENTILE")
+        else None,
+        max_hedge_fraction=float(os.environ.get("HEDGE_MAX_FRACTION") or 0.05),
+    )
+
+
+configure_from_env()
+
+
+def _estimate_tokens(messages: Any, settings: MiddlemanSettings) -> int:
+    # roughly four characters a token, plus all the tokens that may be generated
+    return len(str(messages)) // 4 + (settings.n or 1) * (settings.max_tokens or 0)
+
+
+async def _scheduled(call, settings: MiddlemanSettings, messages: Any, priority: int):
+    return await scheduler.run(
+        call,
+        model=settings.model,
+        priority=priority,
+        tokens=_estimate_tokens(messages, settings),
+    )
+
+
+async def generate(
+    messages: list,
+    settings: MiddlemanSettings,
+    functions: Optional[list] = None,
+    priority: int = GENERATION,
+) -> MiddlemanResult:
+    """
+    Entry point for all hooks.generate calls made by the modules, so that caching,
+    scheduling and hedging apply to every generator and discriminator.
+    Discriminators pass priority=JUDGING, so that generation is served first.
+    """
+    kwargs = {"messages": messages, "settings": settings}
+    if functions is not None:
+        kwargs["functions"] = functions
+
+    def call():
+        return hooks.generate(**kwargs)
+
+    def attempt():
+        return _scheduled(call, settings, messages, priority)
+
+    def hedged():
+        return hedger.run(
+            attempt,
+            latency_key(settings.model, settings.n, settings.max_tokens),
+            tokens=_estimate_tokens(messages, settings),
+        )
+
+    cache = generation_cache
+    if cache is None:
+        return await hedged()
+    if not cache.is_cacheable(settings):
+        cache.stats["uncacheable"] += 1
+        return await hedged()
+    key = cache.key(messages, settings, functions)
+    result = cache.get(key)
+    if result is None:
+        result = await hedged()
+        cache.put(key, result)
+    return result
+
+
+async def generate_one(
+    settings: MiddlemanSettings, messages: list, priority: int = OTHER
+) -> str:
+    return await _scheduled(
+        lambda: hooks.generate_one(settings, messages=messages),
+        settings,
+        messages,
+        priority,
+    )
+
+
+async def rate_options(rating_model: str, priority: int = JUDGING, **kwargs) -> Any:
+    return await scheduler.run(
+        lambda: hooks.rate_options(rating_model=rating_model, **kwargs),
+        model=rating_model,
+        priority=priority,
+    )
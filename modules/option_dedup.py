@@ -0,0 +1,122 @@
+"""
+Deduplication of sampled options before discrimination.
+
+Options with the same action are grouped: function calls are compared by name
+and parsed arguments, with insignificant whitespace removed, and options without
+a function call by their content with whitespace collapsed. Optionally, options
+for the same tool whose actions are near-duplicates (by MinHash estimate of the
+Jaccard similarity of their word shingles) are grouped too.
+"""
+
+import hashlib
+import heapq
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from base import Message
+
+# size of the bottom-k MinHash sketches used to estimate similarity
+MINHASH_SIZE = 64
+SHINGLE_WORDS = 3
+_trailing_whitespace_re = re.compile(r"[ \t]+$", re.MULTILINE)
+
+
+@dataclass
+class OptionGroup:
+    option: Message
+    indices: List[int] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.indices)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return _trailing_whitespace_re.sub("", value).strip()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def canonical_action(option: Message) -> str:
+    function_call = option.function_call
+    if function_call is None:
+        return json.dumps({"content": " ".join(option.content.split())})
+    arguments = function_call.get("arguments")
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except json.JSONDecodeError:
+            # e.g. raw tool input from claude_legacy generators
+            pass
+    return json.dumps(
+        {"name": function_call.get("name"), "arguments": _normalize(arguments)},
+        sort_keys=True,
+    )
+
+
+def minhash(text: str) -> List[int]:
+    """
+    The MINHASH_SIZE smallest hashes of the word shingles of text, which estimate
+    the Jaccard similarity of the shingle sets of two texts (see similarity).
+    """
+    words = text.split()
+    shingles = {
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(max(1, len(words) - SHINGLE_WORDS + 1))
+    }
+    return heapq.nsmallest(
+        MINHASH_SIZE,
+        (
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest())
+            for shingle in shingles
+        ),
+    )
+
+
+def similarity(sketch: List[int], other: List[int]) -> float:
+    # the smallest hashes of the union, and how many of them are in both sets
+    union = heapq.nsmallest(MINHASH_SIZE, set(sketch) | set(other))
+    both = set(sketch) & set(other)
+    return sum(value in both for value in union) / len(union) if union else 1.0
+
+
+def dedupe_options(
+    options: List[Message], near_duplicate_threshold: Optional[float] = None
+) -> List[OptionGroup]:
+    """
+    Group options with the same action, in order of first appearance. Each
+    group is represented by its first option.
+
+    If near_duplicate_threshold is set, an option is also added to an earlier
+    group for the same tool whose estimated similarity is at least that much.
+    """
+    groups: dict[str, OptionGroup] = {}
+    for index, option in enumerate(options):
+        groups.setdefault(canonical_action(option), OptionGroup(option)).indices.append(
+            index
+        )
+    if near_duplicate_threshold is None:
+        return list(groups.values())
+
+    clusters: list[tuple[Optional[str], List[int], OptionGroup]] = []
+    for action, group in groups.items():
+        tool = (group.option.function_call or {}).get("name")
+        sketch = minhash(action)
+        for cluster_tool, cluster_sketch, cluster in clusters:
+            if (
+                cluster_tool == tool
+                and similarity(sketch, cluster_sketch) >= near_duplicate_threshold
+            ):
+                cluster.indices.extend(group.indices)
+                break
+        else:
+            clusters.append((tool, sketch, OptionGroup(group.option, [*group.indices])))
+    for _, _, cluster in clusters:
+        cluster.indices.sort()
+    return [cluster for _, _, cluster in clusters]
@@ -0,0 +1,305 @@
+import asyncio
+import bisect
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+CHUNK_SIZE = 1 << 20
+INDEX_FILENAME = ".index.jsonl"
+DEFAULT_OUTPUT_STORE_DIR = "/home/agent"
+
+
+def output_store_dir() -> str:
+    # Set OUTPUT_STORE_DIR to save outputs somewhere other than /home/agent, e.g.
+    # so that runs sharing a host (see supervisor.py) don't share stores.
+    return os.environ.get("OUTPUT_STORE_DIR") or DEFAULT_OUTPUT_STORE_DIR
+
+
+class OutputStore:
+    """
+    Content-addressed store for long tool outputs.
+
+    Outputs are hashed and written in chunks on a small thread pool, so saving a
+    huge output never blocks the event loop. Files are named after the content
+    hash, so an output that has already been saved is not written again. Every
+    save can be recorded in an append-only index that maps node ids to the file
+    and byte length holding that node's output.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str,
+        compress: bool = False,
+        max_workers: int = 2,
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.compress = compress
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"{prefix}_store"
+        )
+        self._directory_ready = False
+        self._index: Optional[Dict[int, Dict[str, Any]]] = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def _path_for_digest(self, digest: str) -> str:
+        suffix = ".txt.gz" if self.compress else ".txt"
+        return f"{self.directory}/{self.prefix}_{digest[:16]}{suffix}"
+
+    def _ensure_directory(self) -> None:
+        if not self._directory_ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._directory_ready = True
+
+    def _save_sync(self, content: str, node_id: Optional[int]) -> Dict[str, Any]:
+        self._ensure_directory()
+        hasher = hashlib.sha256()
+        length = 0
+        for start in range(0, len(content), CHUNK_SIZE):
+            chunk = content[start : start + CHUNK_SIZE].encode("utf-8")
+            hasher.update(chunk)
+            length += len(chunk)
+        digest = hasher.hexdigest()
+        path = self._path_for_digest(digest)
+
+        if not os.path.exists(path):
+            # Write to a temporary file and rename it, so readers never see a
+            # partially written output under its final name.
+            tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            opener = gzip.open if self.compress else open
+            with opener(tmp_path, "wb") as f:
+                for start in range(0, len(content), CHUNK_SIZE):
+                    f.write(content[start : start + CHUNK_SIZE].encode("utf-8"))
+            os.replace(tmp_path, path)
+
+        entry = {
+            "path": path,
+            "length": length,
+            "sha256": digest,
+            "compressed": self.compress,
+        }
+        if node_id is not None:
+            self._record_sync(node_id, entry)
+        return entry
+
+    def _record_sync(self, node_id: int, entry: Dict[str, Any]) -> None:
+        with self._index_lock:
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps({"node_id": node_id, **entry}) + "\n")
+            if self._index is not None:
+                self._index[node_id] = entry
+
+    def _load_index_sync(self) -> Dict[int, Dict[str, Any]]:
+        with self._index_lock:
+            if self._index is None:
+                index = {}
+                try:
+                    with open(self.index_path) as f:
+                        for line in f:
+                            if not line.strip():
+                                continue
+                            entry = json.loads(line)
+                            index[entry.pop("node_id")] = entry
+                except FileNotFoundError:
+                    pass
+                self._index = index
+            return self._index
+
+    def _read_sync(
+        self, entry: Dict[str, Any], start: int, length: Optional[int]
+    ) -> str:
+        if length is None:
+            length = entry["length"] - start
+        length = max(0, min(length, entry["length"] - start))
+        path: str = entry["path"]
+        if entry.get("compressed"):
+            with gzip.open(path, "rb") as f:
+                f.seek(start)
+                data = f.read(length)
+        else:
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read(length)
+        return data.decode("utf-8", errors="replace")
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def save(self, content: str, node_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Save content to the store and return its index entry. If node_id is given,
+        the entry is also recorded in the on-disk index under that node id.
+        """
+        return await self._run(self._save_sync, content, node_id)
+
+    async def lookup(self, node_id: int) -> Optional[Dict[str, Any]]:
+        index = await self._run(self._load_index_sync)
+        return index.get(node_id)
+
+    async def read(
+        self, node_id: int, start: int = 0, length: Optional[int] = None
+    ) -> Optional[str]:
+        """
+        Read length bytes starting at byte start of the output saved for node_id,
+        or None if no output was saved for that node.
+        """
+        entry = await self.lookup(node_id)
+        if entry is None:
+            return None
+        return await self._run(self._read_sync, entry, start, length)
+
+
+LINE_INDEX_BLOCK_SIZE = 1 << 16
+
+
+class LineIndex:
+    """
+    Sparse line index over a saved output, for fast line lookups and searches.
+
+    Plain files are memory-mapped rather than read, so indexing or searching a
+    multi-hundred-MB output doesn't copy it into memory. The index stores the
+    number of lines starting before each fixed-size block of the file, so
+    mapping between byte offsets and line numbers only needs to scan one block.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        if path.endswith(".gz"):
+            with gzip.open(path, "rb") as f:
+                self.data = f.read()
+        else:
+            self._file = open(path, "rb")
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self.data = b""
+            else:
+                self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data)
+        self._block_line_counts = [0]
+        for start in range(0, self.size, LINE_INDEX_BLOCK_SIZE):
+            block = self.data[start : start + LINE_INDEX_BLOCK_SIZE]
+            self._block_line_counts.append(
+                self._block_line_counts[-1] + block.count(b"\n")
+            )
+        ends_with_newline = self.size > 0 and self.data[self.size - 1 :] == b"\n"
+        self.num_lines = self._block_line_counts[-1] + (
+            0 if ends_with_newline or self.size == 0 else 1
+        )
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._file is not None:
+            self._file.close()
+
+    def line_number(self, offset: int) -> int:
+        """Zero-based number of the line containing byte offset."""
+        block = offset // LINE_INDEX_BLOCK_SIZE
+        block_start = block * LINE_INDEX_BLOCK_SIZE
+        return self._block_line_counts[block] + self.data[block_start:offset].count(
+            b"\n"
+        )
+
+    def line_start(self, line: int) -> int:
+        """Byte offset at which zero-based line starts."""
+        if line <= 0:
+            return 0
+        if line >= self.num_lines:
+            return self.size
+        # the line starts right after the line-th newline
+        block = bisect.bisect_left(self._block_line_counts, line) - 1
+        position = block * LINE_INDEX_BLOCK_SIZE
+        remaining = line - self._block_line_counts[block]
+        while remaining > 0:
+            position = self.data.find(b"\n", position) + 1
+            remaining -= 1
+        return position
+
+    def lines(self, start: int, end: int) -> list[str]:
+        """Zero-based lines in [start, end)."""
+        start = max(0, start)
+        end = min(self.num_lines, end)
+        if start >= end:
+            return []
+        chunk = self.data[self.line_start(start) : self.line_start(end)]
+        return chunk.decode("utf-8", errors="replace").splitlines()
+
+    def search(
+        self, pattern: str, regex: bool = False, max_matches: int = 50
+    ) -> tuple[list[int], bool]:
+        """
+        Zero-based line numbers of lines matching pattern, and whether the search
+        stopped early after max_matches lines.
+        """
+        matched_lines: list[int] = []
+        if regex:
+            compiled = re.compile(pattern.encode("utf-8"), re.MULTILINE)
+            offsets = (match.start() for match in compiled.finditer(self.data))
+        else:
+            offsets = self._find_all(pattern.encode("utf-8"))
+        for offset in offsets:
+            line = self.line_number(offset)
+            if matched_lines and matched_lines[-1] == line:
+                continue
+            if len(matched_lines) == max_matches:
+                return matched_lines, True
+            matched_lines.append(line)
+        return matched_lines, False
+
+    def _find_all(self, needle: bytes):
+        if not needle:
+            return
+        position = self.data.find(needle)
+        while position != -1:
+            yield position
+            # skip the rest of the line, since only matching lines are reported
+            line_end = self.data.find(b"\n", position)
+            if line_end == -1:
+                return
+            position = self.data.find(needle, line_end + 1)
+
+
+# Each cached LineIndex keeps its file open and mapped, so only the most
+# recently used ones are kept.
+MAX_LINE_INDEXES = 16
+_line_indexes: OrderedDict[str, tuple[tuple[int, int], LineIndex]] = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def get_line_index(path: str) -> LineIndex:
+    """
+    Return a LineIndex for path, reusing the cached index unless the file has
+    changed since it was built.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _line_indexes_lock:
+        cached = _line_indexes.pop(path, None)
+        if cached is not None and cached[0] == key:
+            _line_indexes[path] = cached
+            return cached[1]
+    if cached is not None:
+        cached[1].close()
+    index = LineIndex(path)
+    with _line_indexes_lock:
+        previous = _line_indexes.pop(path, None)
+        _line_indexes[path] = (key, index)
+        evicted = [previous[1]] if previous is not None else []
+        while len(_line_indexes) > MAX_LINE_INDEXES:
+            evicted.append(_line_indexes.popitem(last=False)[1][1])
+    for old_index in evicted:
+        old_index.close()
+    return index
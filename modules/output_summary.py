@@ -0,0 +1,337 @@
+import bisect
+import itertools
+import re
+from collections import deque
+from typing import Any, Callable
+
+CHARS_PER_TOKEN = 4
+
+# Everything up to a bare carriage return is overwritten on a terminal, so only
+# the text after the last one on each line is kept.
+_carriage_return_re = re.compile(r"[^\r\n]*\r(?!\n)")
+# Lines containing any of these (case-insensitively) are treated as errors. They
+# are located with str.find over each lowercased chunk, which is much faster than
+# an equivalent case-insensitive regex alternation on large outputs.
+error_keywords = [
+    "error",
+    "exception",
+    "traceback",
+    "fail",
+    "fatal",
+    "panic",
+    "assert",
+    "segmentation fault",
+    "killed",
+    "denied",
+    "cannot",
+    "can't",
+    "not found",
+    "undefined",
+    "errno",
+    "exit code: ",
+]
+_traceback_re = re.compile(r"traceback|stack backtrace|^\s+at ", re.IGNORECASE)
+_progress_re = re.compile(
+    r"\d+(\.\d+)?\s*%|\d+/\d+\s*\[|\[[=#>\-. ]{5,}\]|[█▏▎▍▌▋▊▉]{2,}|\b(it|s)/s\b"
+    r"|\d+(\.\d+)?\s*[kMG]i?B/s|\beta\b",
+    re.IGNORECASE,
+)
+_digits_re = re.compile(r"\d+")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _shorten_line(line: str, max_chars: int) -> str:
+    if len(line) <= max_chars:
+        return line
+    half = max_chars // 2
+    return f"{line[:half]} [... {len(line) - 2 * half} characters omitted ...] {line[-half:]}"
+
+
+class _CompactedLines:
+    """
+    Numbered lines with runs of consecutive progress-bar updates collapsed into
+    their latest state, and runs of repeated lines collapsed into one line.
+    """
+
+    def __init__(self):
+        # each entry is [first line number, last line number, text, key, run length]
+        self.entries: list[list] = []
+        self.size = 0
+
+    def add(self, line_number: int, line: str) -> None:
+        progress = _progress_re.search(line)
+        # progress bars are grouped by the text before their first number
+        key = ("progress", _digits_re.split(line, 1)[0]) if progress else ("line", line)
+        if self.entries:
+            last = self.entries[-1]
+            if last[3] == key and last[1] == line_number - 1:
+                last[1] = line_number
+                last[4] += 1
+                if progress:
+                    self.size += len(line) - len(last[2])
+                    last[2] = line
+                return
+        self.entries.append([line_number, line_number, line, key, 1])
+        self.size += len(line) + 1
+
+    def extend(self, lines) -> "_CompactedLines":
+        for line_number, line in lines:
+            self.add(line_number, line)
+        return self
+
+    def lines(self) -> list[tuple[int, int, str]]:
+        compacted = []
+        for first, last, text, key, run_length in self.entries:
+            if run_length > 1 and key[0] == "progress":
+                text = f"{text}  [{run_length - 1} earlier progress updates collapsed]"
+            elif run_length > 1:
+                text = f"{text}  [line repeated {run_length - 1} more times]"
+            compacted.append((first, last, text))
+        return compacted
+
+
+class OutputSummarizer:
+    """
+    Streaming summarizer for long tool outputs.
+
+    Text is fed in chunks and only a bounded amount of it is retained: the first
+    lines, the last lines, and windows of context around lines that look like
+    errors (tracebacks get a longer window). Errors are found by scanning each
+    lowercased chunk for the error keywords with str.find, rather than matching
+    every line, so huge outputs are cheap to summarize. The summary collapses carriage-return and
+    progress-bar spam and repeated lines, elides the rest, and fits within
+    token_budget.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 500,
+        context_lines: int = 2,
+        traceback_lines: int = 30,
+        max_line_chars: int = 400,
+        max_error_windows: int = 40,
+    ):
+        self.token_budget = token_budget
+        self.context_lines = context_lines
+        self.traceback_lines = traceback_lines
+        self.max_line_chars = max_line_chars
+        self.max_error_windows = max_error_windows
+        budget_chars = token_budget * CHARS_PER_TOKEN
+        self._head_chars = budget_chars // 2
+        self._tail_max_lines = max(16, budget_chars // 8)
+
+        self.num_lines = 0
+        self._carry = ""
+        self._head = _CompactedLines()
+        self._recent: deque[tuple[int, str]] = deque(maxlen=self._tail_max_lines)
+        self._first_windows: list[list[tuple[int, str]]] = []
+        self._last_windows: deque[list[tuple[int, str]]] = deque(
+            maxlen=max_error_windows // 2
+        )
+        self._open_window: tuple[list[tuple[int, str]], int] | None = None
+        self._error_counts: dict[str, int] = {}
+
+    def feed(self, text: str) -> None:
+        text, newline, self._carry = (self._carry + text).rpartition("\n")
+        if newline:
+            self._process(text.split("\n"))
+
+    def _process(self, lines: list[str]) -> None:
+        lines = [
+            _carriage_return_re.sub("", line) if "\r" in line else line
+            for line in lines
+        ]
+        first_line_number = self.num_lines
+        self.num_lines += len(lines)
+
+        def numbered(start: int, end: int) -> list[tuple[int, str]]:
+            start = max(0, start)
+            return [
+                (first_line_number + i, _shorten_line(line, self.max_line_chars))
+                for i, line in enumerate(lines[start:end], start)
+            ]
+
+        if self._open_window is not None:
+            window, remaining = self._open_window
+            window.extend(numbered(0, remaining))
+            self._open_window = (
+                (window, remaining - len(lines)) if remaining > len(lines) else None
+            )
+
+        for i in range(len(lines)):
+            if self._head.size >= self._head_chars:
+                break
+            self._head.add(*numbered(i, i + 1)[0])
+
+        for i in self._find_error_lines(lines):
+            key = _digits_re.sub("#", lines[i].strip())[:200]
+            self._error_counts[key] = self._error_counts.get(key, 0) + 1
+            if self._error_counts[key] > 1:
+                continue
+            after = self.context_lines
+            if _traceback_re.search(lines[i]):
+                # keep the indented frames and the exception line that ends them
+                after = 1
+                while (
+                    after < self.traceback_lines
+                    and i + after < len(lines)
+                    and lines[i + after][:1] in (" ", "\t")
+                ):
+                    after += 1
+            window = numbered(i - self.context_lines, i + after + 1)
+            if i < self.context_lines:
+                # the context before the error is at the end of the previous chunk
+                window[:0] = list(self._recent)[
+                    len(self._recent) - (self.context_lines - i) :
+                ]
+            if i + after + 1 > len(lines):
+                self._open_window = (window, i + after + 1 - len(lines))
+            if len(self._first_windows) < self.max_error_windows // 2:
+                self._first_windows.append(window)
+            else:
+                self._last_windows.append(window)
+
+        self._recent.extend(numbered(len(lines) - self._tail_max_lines, len(lines)))
+
+    @staticmethod
+    def _find_error_lines(lines: list[str]) -> list[int]:
+        chunk = "\n".join(lines).lower()
+        line_starts = list(
+            itertools.accumulate((len(line) + 1 for line in lines), initial=0)
+        )
+        error_lines = set()
+        for keyword in error_keywords:
+            position = chunk.find(keyword)
+            while position != -1:
+                i = bisect.bisect_right(line_starts, position) - 1
+                if (
+                    keyword != "exit code: "
+                    or chunk[position + len(keyword) : position + len(keyword) + 1]
+                    in "123456789"
+                ):
+                    error_lines.add(i)
+                # only the first match on each line matters
+                position = chunk.find(keyword, line_starts[i + 1])
+        return sorted(error_lines)
+
+    def summarize(self) -> str:
+        if self._carry:
+            self._process([self._carry])
+            self._carry = ""
+        # leave some of the budget for the notes about omitted lines
+        budget_chars = int(0.9 * self.token_budget * CHARS_PER_TOKEN)
+
+        tail = _CompactedLines().extend(self._recent)
+
+        # Errors get priority, but never crowd out the start and end entirely.
+        # Whole windows are kept, alternating between the first and last errors.
+        error_budget = max(
+            budget_chars // 2, budget_chars - self._head.size - tail.size
+        )
+        error_budget = min(error_budget, budget_chars * 2 // 3)
+        windows = [
+            _CompactedLines().extend(window)
+            for window in [*self._first_windows, *self._last_windows]
+        ]
+        selected_windows = self._fit(
+            [(i, i, window) for i, window in enumerate(windows)],
+            error_budget,
+            keep="both",
+            size=lambda window: window.size,
+        )
+        selected_errors = (
+            _CompactedLines()
+            .extend(
+                sorted(
+                    {
+                        (first, text)
+                        for *_, window in selected_windows
+                        for first, _, text in window.lines()
+                    }
+                )
+            )
+            .lines()
+        )
+        remaining = budget_chars - sum(len(text) + 1 for *_, text in selected_errors)
+        selected_head = self._fit(self._head.lines(), remaining // 2, keep="start")
+        remaining -= sum(len(text) + 1 for *_, text in selected_head)
+        selected_tail = self._fit(tail.lines(), remaining, keep="end")
+
+        selected: dict[int, tuple[int, str]] = {}
+        for first, last, text in [*selected_head, *selected_errors, *selected_tail]:
+            if first not in selected or selected[first][0] < last:
+                selected[first] = (last, text)
+
+        output_lines = []
+        covered = -1
+        for first in sorted(selected):
+            last, text = selected[first]
+            if last <= covered:
+                continue
+            if first > covered + 1:
+                output_lines.append(f"[... {first - covered - 1} lines omitted ...]")
+            output_lines.append(text)
+            covered = last
+        if covered < self.num_lines - 1:
+            output_lines.append(
+                f"[... {self.num_lines - 1 - covered} lines omitted ...]"
+            )
+
+        repeated = sorted(
+            ((count, key) for key, count in self._error_counts.items() if count > 1),
+            reverse=True,
+        )[:5]
+        if repeated:
+            output_lines.append("[Error lines repeated elsewhere in the output:]")
+            output_lines.extend(
+                f"  {count}x {_shorten_line(key, 200)}" for count, key in repeated
+            )
+        return "\n".join(output_lines)
+
+    @staticmethod
+    def _fit(
+        lines: list[tuple[int, int, Any]],
+        budget_chars: int,
+        keep: str,
+        size: Callable[[Any], int] = lambda text: len(text) + 1,
+    ) -> list[tuple[int, int, Any]]:
+        """
+        Select lines within budget_chars, keeping lines from the start, the end, or
+        both ends of lines.
+        """
+        if keep == "start":
+            order = range(len(lines))
+        elif keep == "end":
+            order = range(len(lines) - 1, -1, -1)
+        else:
+            order = (
+                i // 2 if i % 2 == 0 else len(lines) - 1 - i // 2
+                for i in range(len(lines))
+            )
+        chosen = []
+        used = 0
+        for i in order:
+            used += size(lines[i][2])
+            if used > budget_chars:
+                break
+            chosen.append(i)
+        return [lines[i] for i in sorted(chosen)]
+
+
+def summarize_output(
+    content: str, token_budget: int = 500, chunk_size: int = 1 << 22
+) -> str:
+    """
+    Condense a tool output to roughly token_budget tokens, keeping its start, its
+    end and any lines that look like errors. Outputs already within budget are
+    returned unchanged.
+    """
+    if estimate_tokens(content) <= token_budget:
+        return content
+    summarizer = OutputSummarizer(token_budget=token_budget)
+    for start in range(0, len(content), chunk_size):
+        summarizer.feed(content[start : start + chunk_size])
+    return summarizer.summarize()
@@ -1,14 +1,54 @@
+import asyncio
+import hashlib
 import json
-from typing import Any, List
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import partial
+from itertools import accumulate
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
 
-import tiktoken
+from pyhooks.types import MiddlemanSettings, OpenaiChatMessage
 
 from base import Agent, Message, Node
+from modules import llm
+from modules.output_summary import estimate_tokens, summarize_output
 from templates import (
+    notice_retroactively_summarized_prompt,
     notice_retroactively_trimmed_prompt,
     notice_retroactively_using_saved_output,
+    summarize_history_prompt,
 )
 
+if TYPE_CHECKING:
+    import tiktoken
+
+TRIMMED_OUTPUT_SUMMARY_TOKENS = 500
+
+
+def get_encoding() -> "tiktoken.Encoding":
+    # tiktoken is imported on first use, since only some prompters need it
+    import tiktoken
+
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def warm_up_tokenizer() -> None:
+    """
+    Load the tokenizer in a background thread, so that the first prompt doesn't
+    have to wait for it.
+    """
+
+    def load():
+        try:
+            get_encoding()
+        except Exception:
+            # raised again when the tokenizer is actually needed
+            pass
+
+    threading.Thread(target=load, daemon=True).start()
+
 
 def _format_score_message(message: Message) -> Message:
     # Some actors add extra lines to the score message, but the score output
@@ -66,62 +106,171 @@ async def _basic(agent: Agent) -> None:
     (lineage of most recent node)
     """
     agent.state.next_step["module_type"] = "generator"
-    agent.state.next_step["args"]["messages"] = [
-        _format_score_message(message)
-        if (
-            (message := agent.state.nodes[node_id].message).role == "function"
-            and message.name == "score"
-        )
-        else message
-        for node_id in agent.state.get_path()
-    ]
+    agent.state.set_prompt_messages(
+        [
+            _format_score_message(message)
+            if (
+                (message := agent.state.nodes[node_id].message).role == "function"
+                and message.name == "score"
+            )
+            else message
+            for node_id in agent.state.get_path()
+        ]
+    )
 
 
-def trim_message_list(messages: List[Message], target_tok_length: int) -> List[Message]:
+MESSAGE_TOKEN_CACHE_SIZE = 50_000
+
+# token counts by (encoding, content, function call), most recently used last
+_message_token_counts: OrderedDict[tuple, int] = OrderedDict()
+
+
+def _count_message_tokens(enc: "tiktoken.Encoding", message: Message) -> int:
+    function_call = message.function_call
+    key = (
+        enc.name,
+        message.content,
+        None if function_call is None else tuple(function_call.items()),
+    )
+    try:
+        count = _message_token_counts.get(key)
+    except TypeError:
+        # unhashable arguments, e.g. a dict
+        key = (enc.name, message.content, json.dumps(function_call))
+        count = _message_token_counts.get(key)
+    if count is not None:
+        _message_token_counts.move_to_end(key)
+        return count
+
+    count = len(enc.encode(message.content, disallowed_special=())) + len(
+        enc.encode(json.dumps(function_call), disallowed_special=())
+    )
+    _message_token_counts[key] = count
+    if len(_message_token_counts) > MESSAGE_TOKEN_CACHE_SIZE:
+        _message_token_counts.popitem(last=False)
+    return count
+
+
+def trim_message_list(
+    messages: List[Message],
+    target_tok_length: int,
+    head: int = 4,
+    pinned: Iterable[int] = (),
+    min_tail: int = 1,
+    role_budgets: Optional[Dict[str, int]] = None,
+) -> List[Message]:
     """
-    Trim messages by removing each message starting with the 5th message, until
-    the total token length is less than target_tok_length. Include a message in
-    the trimmed portion indicating that the sequence has been trimmed.
+    Trim messages by removing a contiguous run of messages after the first
+    `head` messages, keeping the longest tail that fits in target_tok_length.
+    Include a message in the trimmed portion indicating that the sequence has
+    been trimmed. If nothing needs to be removed, the messages are returned as is.
+
+    Parameters:
+        messages: The messages to trim.
+        target_tok_length: The token budget for the returned messages.
+        head: The number of leading messages that are always kept.
+        pinned: Indices (negative ones count from the end) of other messages
+            that are always kept, e.g. the latest tool output.
+        min_tail: The number of latest messages kept even if they don't fit.
+        role_budgets: Token budgets, by role, for the messages that may be
+            removed, e.g. {"function": 50_000} to cap tool outputs.
+
+    Token counts are cached, and the trim point is found by bisecting prefix
+    sums of the counts, so repeated calls on a growing history are cheap.
 
     Note that this function always uses tiktoken's cl100k base tokenizer, and
     disregards many details about how to use it for message formats.
     TODO: use the correct tokenizer for any given situation, and use it properly.
     """
-    enc = tiktoken.get_encoding("cl100k_base")
-    tokens_to_use = target_tok_length - len(
-        enc.encode(notice_retroactively_trimmed_prompt, disallowed_special=())
-    )
-    for msg in messages[:4]:
-        tokens_to_use -= len(enc.encode(msg.content, disallowed_special=()))
-        tokens_to_use -= len(
-            enc.encode(json.dumps(msg.function_call), disallowed_special=())
+    enc = get_encoding()
+    num_messages = len(messages)
+    head = min(head, num_messages)
+    pinned = {
+        index % num_messages
+        for index in pinned
+        if -num_messages <= index < num_messages and index % num_messages >= head
+    }
+    counts = [_count_message_tokens(enc, message) for message in messages]
+    role_budgets = role_budgets or {}
+
+    # prefix sums over the messages that may be removed; pinned ones count as 0
+    def prefix_sums(role: Optional[str] = None) -> List[int]:
+        return list(
+            accumulate(
+                (
+                    0
+                    if index < head
+                    or index in pinned
+                    or (role is not None and message.role != role)
+                    else count
+                    for index, (message, count) in enumerate(zip(messages, counts))
+                ),
+                initial=0,
+            )
         )
 
-    tail_messages_to_use = []
-    for msg in messages[4:][::-1]:
-        tokens_to_use -= len(enc.encode(msg.content, disallowed_special=()))
-        tokens_to_use -= len(
-            enc.encode(json.dumps(msg.function_call), disallowed_special=())
+    removable_tokens = prefix_sums()
+    role_tokens = {role: prefix_sums(role) for role in role_budgets}
+    fits = sum(counts) <= target_tok_length and all(
+        tokens[-1] <= role_budgets[role] for role, tokens in role_tokens.items()
+    )
+    if fits:
+        return messages
+
+    notice = Message(
+        role="user",
+        content=notice_retroactively_trimmed_prompt,
+        function_call=None,
+    )
+    kept_tokens = sum(counts) - removable_tokens[-1]
+    budget = target_tok_length - kept_tokens - _count_message_tokens(enc, notice)
+    # the tail from cut fits if prefix[-1] - prefix[cut] <= budget, and the
+    # prefix sums never decrease, so the first such cut is found by bisection
+    cut = bisect_left(
+        removable_tokens, removable_tokens[-1] - budget, lo=head, hi=num_messages
+    )
+    for role, tokens in role_tokens.items():
+        cut = max(
+            cut,
+            bisect_left(
+                tokens, tokens[-1] - role_budgets[role], lo=head, hi=num_messages
+            ),
         )
-        if tokens_to_use < 0:
-            break
-        tail_messages_to_use.append(msg)
-    if tokens_to_use >= 0:
+    cut = max(head, min(cut, num_messages - min_tail))
+    if cut == head:
         return messages
 
     return (
-        messages[:4]
-        + [
-            Message(
-                role="user",
-                content=notice_retroactively_trimmed_prompt,
-                function_call=None,
-            )
-        ]
-        + tail_messages_to_use[::-1]
+        messages[:head]
+        + [notice]
+        + [messages[index] for index in sorted(pinned) if index < cut]
+        + messages[cut:]
     )
 
 
+OUTPUT_SUMMARY_CACHE_SIZE = 1_000
+
+# summaries of long outputs by content, most recently used last
+_output_summaries: OrderedDict[str, str] = OrderedDict()
+
+
+def _summarize_output_cached(content: str) -> str:
+    # the same outputs are summarized again on every step; str caches its hash,
+    # so looking up an output that was already summarized doesn't rescan it
+    if estimate_tokens(content) <= TRIMMED_OUTPUT_SUMMARY_TOKENS:
+        return content
+    summary = _output_summaries.get(content)
+    if summary is not None:
+        _output_summaries.move_to_end(content)
+        return summary
+
+    summary = summarize_output(content, token_budget=TRIMMED_OUTPUT_SUMMARY_TOKENS)
+    _output_summaries[content] = summary
+    if len(_output_summaries) > OUTPUT_SUMMARY_CACHE_SIZE:
+        _output_summaries.popitem(last=False)
+    return summary
+
+
 def _get_trimmed_message(node: Node, token_usage_fraction: float) -> Message:
     message = node.message
     message = (
@@ -143,8 +292,7 @@ def _get_trimmed_message(node: Node, token_usage_fraction: float) -> Message:
             if (saved_output_filename := node.metadata.get("saved_output_filename"))
             else ""
         ),
-        output_start=message.content[:300],
-        output_end=message.content[-300:],
+        output_summary=_summarize_output_cached(message.content),
     )
     return Message(
         role="function",
@@ -154,16 +302,9 @@ def _get_trimmed_message(node: Node, token_usage_fraction: float) -> Message:
     )
 
 
-async def _context_and_usage_aware(agent: Agent) -> None:
-    node_ids = agent.state.get_path()
-    messages = []
+def _get_usage_message(agent: Agent) -> Message:
     token_usage_fraction = agent.state.token_usage / agent.state.token_limit
     time_usage_fraction = agent.state.time_usage / agent.state.time_limit
-    for node_id in node_ids:
-        messages.append(
-            _get_trimmed_message(agent.state.nodes[node_id], token_usage_fraction)
-        )
-
     if token_usage_fraction > time_usage_fraction:
         usage_fraction = token_usage_fraction
         usage_type = "tokens"
@@ -179,19 +320,385 @@ async def _context_and_usage_aware(agent: Agent) -> None:
     elif usage_fraction > (3 / 4):
         usage_message += " You should attempt to reach a final answer soon."
 
-    messages.append(
-        Message(
-            role="user",
-            content=usage_message,
-            name=None,
-            function_call=None,
-        )
+    return Message(
+        role="user",
+        content=usage_message,
+        name=None,
+        function_call=None,
     )
+
+
+def _get_target_tok_length(agent: Agent) -> int:
     # TODO: be more principled about the target_tok_length setting
     if "claude" in agent.settings.generator:
         target_tok_length = 0.75 * 200_000
     else:
         target_tok_length = 0.75 * 128_000
-    messages = trim_message_list(messages, int(target_tok_length))
+    return int(target_tok_length)
+
+
+async def _context_and_usage_aware(agent: Agent) -> None:
+    node_ids = agent.state.get_path()
+    messages = []
+    token_usage_fraction = agent.state.token_usage / agent.state.token_limit
+    for node_id in node_ids:
+        messages.append(
+            _get_trimmed_message(agent.state.nodes[node_id], token_usage_fraction)
+        )
+    messages.append(_get_usage_message(agent))
+    # keep the latest output along with the usage message, even if it's long
+    messages = trim_message_list(messages, _get_target_tok_length(agent), min_tail=2)
     agent.state.next_step["module_type"] = "generator"
-    agent.state.next_step["args"]["messages"] = messages
+    agent.state.set_prompt_messages(messages)
+
+
+PREFIX_STABLE_HEAD_MESSAGES = 4
+PREFIX_STABLE_TRIM_CHUNK = 16
+PREFIX_STABLE_TRIM_HEADROOM = 0.25
+
+
+async def _prefix_stable(agent: Agent) -> None:
+    """
+    Like _context_and_usage_aware, but lays the prompt out so that consecutive
+    steps share as long a prefix as possible, for provider-side prompt caching.
+
+    Old messages after the first few are dropped in whole chunks, and the trim
+    point only moves when the prompt no longer fits, far enough to leave room for
+    many more steps. The usage note, which changes every step, is always last.
+    The trim point is kept in next_step["args"]["prompt_layout"], and an
+    estimate of how many prompt tokens are shared with the previous step is
+    put in next_step["args"]["prompt_metadata"] for the generation metadata.
+    """
+    node_ids = agent.state.get_path()
+    token_usage_fraction = agent.state.token_usage / agent.state.token_limit
+    trim_long_outputs = token_usage_fraction > 0.5
+    messages = [
+        _get_trimmed_message(agent.state.nodes[node_id], token_usage_fraction)
+        for node_id in node_ids
+    ]
+    usage_message = _get_usage_message(agent)
+    notice = Message(
+        role="user",
+        content=notice_retroactively_trimmed_prompt,
+        function_call=None,
+    )
+
+    enc = get_encoding()
+    counts = [_count_message_tokens(enc, message) for message in messages]
+    prefix_tokens = list(accumulate(counts, initial=0))
+    notice_tokens = _count_message_tokens(enc, notice)
+    head = PREFIX_STABLE_HEAD_MESSAGES
+
+    def prompt_tokens(cut: int | None, end: int = len(messages)) -> int:
+        if cut is None:
+            return prefix_tokens[end]
+        return (
+            prefix_tokens[head]
+            + notice_tokens
+            + prefix_tokens[end]
+            - prefix_tokens[cut]
+        )
+
+    layout = agent.state.next_step["args"].get("prompt_layout") or {}
+    cut = None
+    if layout.get("cut_node_id") in node_ids:
+        cut = node_ids.index(layout["cut_node_id"])
+    target = _get_target_tok_length(agent) - _count_message_tokens(enc, usage_message)
+    if len(messages) > head + 1 and prompt_tokens(cut) > target:
+        low_water = target * (1 - PREFIX_STABLE_TRIM_HEADROOM)
+        cut = cut or head
+        # always keep the latest messages, even if they don't fit
+        last_cut = len(messages) - PREFIX_STABLE_TRIM_CHUNK
+        while prompt_tokens(cut) > low_water and cut < last_cut:
+            cut += PREFIX_STABLE_TRIM_CHUNK
+        if cut == head:
+            cut = None
+
+    # Estimate how much of this prompt the previous one started with. The history
+    # only grows, so unless the trim point or the trimming of long outputs
+    # changed, that is everything up to the last message of the previous prompt.
+    cut_node_id = None if cut is None else node_ids[cut]
+    if (
+        layout.get("last_node_id") in node_ids
+        and layout.get("cut_node_id") == cut_node_id
+        and layout.get("trim_long_outputs") == trim_long_outputs
+    ):
+        cached_prefix_tokens = prompt_tokens(
+            cut, node_ids.index(layout["last_node_id"]) + 1
+        )
+    elif layout:
+        cached_prefix_tokens = prefix_tokens[min(head, len(messages))]
+    else:
+        cached_prefix_tokens = 0
+
+    if cut is not None:
+        messages = messages[:head] + [notice] + messages[cut:]
+    messages.append(usage_message)
+
+    agent.state.next_step["module_type"] = "generator"
+    agent.state.set_prompt_messages(messages)
+    agent.state.next_step["args"]["prompt_layout"] = {
+        "cut_node_id": cut_node_id,
+        "last_node_id": node_ids[-1] if node_ids else None,
+        "trim_long_outputs": trim_long_outputs,
+    }
+    agent.state.next_step["args"]["prompt_metadata"] = {
+        "prompt_tokens": prompt_tokens(cut) + _count_message_tokens(enc, usage_message),
+        "cached_prefix_tokens": cached_prefix_tokens,
+        "trimmed_messages": 0 if cut is None else cut - head,
+    }
+
+
+SUMMARY_HEAD_MESSAGES = 4
+SUMMARY_SPAN_MESSAGES = 20
+SUMMARY_GROUP_SPANS = 4
+SUMMARY_MIN_RECENT_MESSAGES = 10
+# start summarizing old spans in the background once the history reaches this
+# fraction of the target length, so summaries are ready by the time they're needed
+SUMMARY_AHEAD_FRACTION = 0.6
+SUMMARY_MESSAGE_MAX_TOKENS = 1000
+# a span whose summary failed isn't tried again for this long, doubling with each
+# failure in a row
+SUMMARY_RETRY_SECONDS = 30.0
+SUMMARY_MAX_RETRY_SECONDS = 600.0
+
+# summaries being generated in the background, by span key
+_summary_tasks: dict[str, asyncio.Task] = {}
+# failures in a row and when to try again, by span key
+_summary_failures: dict[str, tuple[int, float]] = {}
+
+
+def _span_key(level: int, ids: list) -> str:
+    digest = hashlib.sha256(json.dumps(ids).encode("utf-8")).hexdigest()
+    return f"{level}_{digest[:16]}"
+
+
+def _format_history(messages: List[Message]) -> str:
+    lines = []
+    for message in messages:
+        name = f" ({message.name})" if message.name else ""
+        content = _summarize_output_cached(message.content)
+        if message.function_call is not None:
+            content += f"\n{message.function_call['name']}: {message.function_call['arguments']}"
+        lines.append(f"{message.role}{name}: {content}")
+    return "\n\n".join(lines)
+
+
+async def _summarize(
+    task_string: str,
+    history: str,
+    summary: dict,
+    middleman_settings: MiddlemanSettings,
+) -> dict:
+    generation = await llm.generate(
+        messages=[
+            OpenaiChatMessage(
+                role="user",
+                content=summarize_history_prompt.format(
+                    task=task_string, history=history
+                ),
+            )
+        ],
+        settings=middleman_settings,
+    )
+    if generation.error is not None or not generation.outputs:
+        raise ValueError(f"Could not summarize history: {generation.error}")
+    return {**summary, "content": generation.outputs[0].completion.strip()}
+
+
+def _schedule_summary(
+    agent: Agent,
+    key: str,
+    history: str,
+    summary: dict,
+    middleman_settings: MiddlemanSettings,
+) -> None:
+    if key in agent.state.summaries or key in _summary_tasks:
+        return
+    if key in _summary_failures and time.monotonic() < _summary_failures[key][1]:
+        return
+    _summary_tasks[key] = asyncio.create_task(
+        _summarize(agent.state.task_string, history, summary, middleman_settings)
+    )
+
+
+def _collect_summaries(agent: Agent) -> None:
+    for key, task in list(_summary_tasks.items()):
+        if not task.done():
+            continue
+        del _summary_tasks[key]
+        if task.cancelled() or task.exception() is not None:
+            # tried again the next time the span is needed, once the backoff is over
+            failures = _summary_failures.get(key, (0, 0.0))[0] + 1
+            delay = min(
+                SUMMARY_MAX_RETRY_SECONDS, SUMMARY_RETRY_SECONDS * 2 ** (failures - 1)
+            )
+            _summary_failures[key] = (failures, time.monotonic() + delay)
+            continue
+        _summary_failures.pop(key, None)
+        agent.state.summaries[key] = task.result()
+
+
+async def _summarizing_factory(
+    agent: Agent, middleman_settings: MiddlemanSettings | None = None
+) -> None:
+    """
+    Keep long histories within the token budget by replacing old spans of the
+    node path with summaries, instead of dropping them.
+
+    The messages after the first few are split into fixed spans, and groups of
+    spans are summarized again into higher-level summaries. Summaries are
+    generated in the background, before they are needed, and stored in
+    State.summaries under a key derived from the node ids they cover. A span is
+    only summarized again if the path changes so that it covers other nodes.
+    Spans that have to be removed before their summary is ready are dropped
+    with the usual notice, as are spans whose summary recently failed.
+    """
+    if middleman_settings is None:
+        raise ValueError(
+            "Do not call _summarizing_factory directly. Use a partial application of it instead."
+        )
+    _collect_summaries(agent)
+    summaries = agent.state.summaries
+    node_ids = agent.state.get_path()
+    token_usage_fraction = agent.state.token_usage / agent.state.token_limit
+    messages = [
+        _get_trimmed_message(agent.state.nodes[node_id], token_usage_fraction)
+        for node_id in node_ids
+    ]
+    usage_message = _get_usage_message(agent)
+    enc = get_encoding()
+    prefix_tokens = list(
+        accumulate(
+            (_count_message_tokens(enc, message) for message in messages), initial=0
+        )
+    )
+    target = _get_target_tok_length(agent) - _count_message_tokens(enc, usage_message)
+
+    head = SUMMARY_HEAD_MESSAGES
+    span = SUMMARY_SPAN_MESSAGES
+    spans = [
+        (start, start + span)
+        for start in range(
+            head, len(messages) - SUMMARY_MIN_RECENT_MESSAGES - span + 1, span
+        )
+    ]
+    span_keys = [_span_key(1, node_ids[start:end]) for start, end in spans]
+    group_size = SUMMARY_GROUP_SPANS
+    group_keys = [
+        _span_key(2, span_keys[start : start + group_size])
+        for start in range(0, len(spans) - group_size + 1, group_size)
+    ]
+
+    def raw_tokens(first: int, last: int) -> int:
+        # tokens of the messages in spans first..last-1
+        return prefix_tokens[spans[last - 1][1]] - prefix_tokens[spans[first][0]]
+
+    def summary_tokens(key: str) -> int:
+        return summaries[key].setdefault(
+            "tokens",
+            len(enc.encode(summaries[key]["content"], disallowed_special=())),
+        )
+
+    # start summarizing the oldest spans before the history gets too long
+    excess = prefix_tokens[-1] - SUMMARY_AHEAD_FRACTION * target
+    for i, (start, end) in enumerate(spans):
+        if excess <= 0:
+            break
+        excess -= raw_tokens(i, i + 1)
+        _schedule_summary(
+            agent,
+            span_keys[i],
+            _format_history(messages[start:end]),
+            {
+                "level": 1,
+                "start_node_id": node_ids[start],
+                "end_node_id": node_ids[end - 1],
+            },
+            middleman_settings,
+        )
+
+    # replace the oldest spans until the prompt fits, preferring whole groups
+    total = prefix_tokens[-1]
+    replacements: list[tuple[int, int, Optional[str]]] = []
+    i = 0
+    while i < len(spans) and total > target:
+        group = i // group_size
+        if i % group_size == 0 and group < len(group_keys):
+            group_key = group_keys[group]
+            if group_key in summaries:
+                total += summary_tokens(group_key) - raw_tokens(i, i + group_size)
+                replacements.append((i, i + group_size, group_key))
+                i += group_size
+                continue
+            if all(key in summaries for key in span_keys[i : i + group_size]):
+                _schedule_summary(
+                    agent,
+                    group_key,
+                    "\n\n".join(
+                        summaries[key]["content"]
+                        for key in span_keys[i : i + group_size]
+                    ),
+                    {
+                        "level": 2,
+                        "start_node_id": node_ids[spans[i][0]],
+                        "end_node_id": node_ids[spans[i + group_size - 1][1] - 1],
+                    },
+                    middleman_settings,
+                )
+        if span_keys[i] in summaries:
+            total += summary_tokens(span_keys[i]) - raw_tokens(i, i + 1)
+            replacements.append((i, i + 1, span_keys[i]))
+        else:
+            total -= raw_tokens(i, i + 1)
+            replacements.append((i, i + 1, None))
+        i += 1
+    # if the summaries themselves don't fit, drop the oldest ones
+    for j, (first, last, key) in enumerate(replacements):
+        if total <= target:
+            break
+        if key is not None:
+            total -= summary_tokens(key)
+            replacements[j] = (first, last, None)
+
+    prompt = messages[:head]
+    for first, last, key in replacements:
+        if key is not None:
+            prompt.append(
+                Message(
+                    role="user",
+                    content=notice_retroactively_summarized_prompt.format(
+                        num_messages=spans[last - 1][1] - spans[first][0],
+                        summary=summaries[key]["content"],
+                    ),
+                )
+            )
+        elif prompt[-1].content != notice_retroactively_trimmed_prompt:
+            prompt.append(
+                Message(
+                    role="user",
+                    content=notice_retroactively_trimmed_prompt,
+                    function_call=None,
+                )
+            )
+    remaining = spans[replacements[-1][1] - 1][1] if replacements else head
+    prompt += messages[remaining:]
+    prompt.append(usage_message)
+
+    agent.state.next_step["module_type"] = "generator"
+    agent.state.set_prompt_messages(prompt)
+
+
+summary_models = [
+    ("gpt-4o-2024-05-13", "4o"),
+    ("gpt-4o-mini-2024-07-18", "4om"),
+]
+for model, desc in summary_models:
+    globals()[f"_summarizing_{desc}"] = partial(
+        _summarizing_factory,
+        middleman_settings=MiddlemanSettings(
+            n=1, model=model, temp=0, max_tokens=SUMMARY_MESSAGE_MAX_TOKENS
+        ),
+    )
+# the default summarizing prompter uses gpt-4o-mini
+_summarizing = globals()["_summarizing_4om"]
@@ -0,0 +1,124 @@
+"""
+Budget-adaptive sampling width and max_tokens for generators.
+
+Generator partials fix n and max_tokens when they are registered. With
+Settings.adaptive_sampling, the generators adjust them every step instead: both
+shrink as the token or time budget runs low, and n widens after recent failures
+(non-zero exit codes, rejected commands or actions). Widening never takes a
+step's completion tokens past a fraction of the tokens remaining, and once the
+budget is low nothing does.
+"""
+
+import copy
+import math
+import re
+from typing import Tuple
+
+from pyhooks.types import MiddlemanSettings
+
+from base import Message, State
+from templates import (
+    reject_action_prompt,
+    reject_arguments_prompt,
+    reject_command_prompt,
+)
+
+# below this fraction of the token or time budget, n and max_tokens shrink
+# in proportion to what is left, and a step's completion tokens are capped to
+# MAX_STEP_TOKEN_FRACTION of the tokens left
+LOW_BUDGET_FRACTION = 0.3
+MIN_MAX_TOKENS = 1024
+# n is doubled for each failure among the last FAILURE_WINDOW results, up to
+# MAX_WIDEN_FACTOR times the generator's n and at most PROVIDER_MAX_N (the
+# widest generators are registered with)
+FAILURE_WINDOW = 3
+MAX_WIDEN_FACTOR = 4
+PROVIDER_MAX_N = 64
+MAX_STEP_TOKEN_FRACTION = 0.1
+_exit_code_re = re.compile(r"\nExit code: (\d+)")
+_reject_action_prefix = reject_action_prompt.split("{action}")[0]
+
+
+def is_failure(message: Message) -> bool:
+    if message.role == "user":
+        return message.content.startswith(_reject_action_prefix)
+    if message.role != "function":
+        return False
+    if message.content in (reject_command_prompt, reject_arguments_prompt):
+        return True
+    exit_codes = _exit_code_re.findall(message.content)
+    return bool(exit_codes) and exit_codes[-1] != "0"
+
+
+def recent_failures(state: State) -> int:
+    # results are the messages that answer the agent: tool outputs and
+    # rejections, but not the first message, which starts the task
+    results = []
+    for node_id in reversed(state.get_path()[1:]):
+        message = state.nodes[node_id].message
+        if message.role in ("function", "user"):
+            results.append(message)
+            if len(results) == FAILURE_WINDOW:
+                break
+    return sum(is_failure(message) for message in results)
+
+
+def budget_fraction(state: State) -> float:
+    fractions = [
+        max(0, limit - usage) / limit
+        for limit, usage in (
+            (state.token_limit, state.token_usage),
+            (state.time_limit, state.time_usage),
+        )
+        if limit > 0
+    ]
+    return min(fractions, default=1.0)
+
+
+def adapt_sampling(
+    state: State, middleman_settings: MiddlemanSettings
+) -> Tuple[MiddlemanSettings, dict]:
+    """
+    A copy of middleman_settings with n and max_tokens adjusted to the budget
+    left and to recent failures, and a record of the decision for
+    generation_metadata.
+    """
+    fraction = budget_fraction(state)
+    failures = recent_failures(state)
+    base_n = middleman_settings.n
+    n = base_n
+    max_tokens = middleman_settings.max_tokens
+    if failures:
+        n = min(
+            n * 2**failures,
+            base_n * MAX_WIDEN_FACTOR,
+            max(base_n, PROVIDER_MAX_N),
+        )
+    low_budget = fraction < LOW_BUDGET_FRACTION
+    if low_budget:
+        scale = fraction / LOW_BUDGET_FRACTION
+        n = max(1, math.floor(n * scale))
+        if max_tokens is not None:
+            max_tokens = max(MIN_MAX_TOKENS, math.floor(max_tokens * scale))
+    if max_tokens is not None and (low_budget or n > base_n):
+        step_tokens = math.floor(
+            max(0, state.token_limit - state.token_usage) * MAX_STEP_TOKEN_FRACTION
+        )
+        # until the budget is low, only the widening is capped, not the
+        # generator's own n
+        n = max(1 if low_budget else base_n, min(n, step_tokens // max_tokens))
+        if low_budget:
+            max_tokens = min(max_tokens, max(MIN_MAX_TOKENS, step_tokens))
+
+    adapted = copy.deepcopy(middleman_settings)
+    adapted.n = n
+    adapted.max_tokens = max_tokens
+    decision = {
+        "n": n,
+        "max_tokens": max_tokens,
+        "base_n": middleman_settings.n,
+        "base_max_tokens": middleman_settings.max_tokens,
+        "budget_fraction": round(fraction, 3),
+        "recent_failures": failures,
+    }
+    return adapted, decision
@@ -0,0 +1,192 @@
+"""
+Shared scheduling of model calls.
+
+Every hooks.generate, hooks.generate_one and hooks.rate_options call made by the
+modules goes through one RequestScheduler (see modules.llm), which
+- runs at most max_concurrency calls at once, serving waiting calls by priority
+  (generation before judging before anything else, then first come first served),
+- keeps each model within its requests and tokens per minute, with token buckets,
+- and retries calls that were rate limited, with jittered exponential backoff.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import time
+from collections import defaultdict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    DefaultDict,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+GENERATION = 0
+JUDGING = 1
+OTHER = 2
+
+MAX_RETRIES = 6
+_rate_limit_re = re.compile(
+    r"\b429\b|rate.?limit|too many requests|overloaded", re.IGNORECASE
+)
+
+
+def is_rate_limited(error: Any) -> bool:
+    return error is not None and _rate_limit_re.search(str(error)) is not None
+
+
+class TokenBucket:
+    """
+    Allows up to per_minute units a minute, in bursts of up to per_minute.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self, amount: float) -> float:
+        """
+        Take amount from the bucket if it holds that much, and return 0.
+        Otherwise return how many seconds to wait before trying again.
+        """
+        now = self.clock()
+        self.level = min(
+            self.capacity, self.level + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
+        # a request bigger than the bucket could never run otherwise
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            self.level -= amount
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        model_limits: Optional[Dict[str, Dict[str, float]]] = None,
+        max_retries: int = MAX_RETRIES,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """
+        model_limits maps model names to {"requests_per_minute": ...,
+        "tokens_per_minute": ...}; either may be left out, and models that
+        aren't listed are only limited by max_concurrency.
+        """
+        self.max_concurrency = max_concurrency
+        self.model_limits = model_limits or {}
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.running = 0
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        # counts, and seconds spent queued or throttled
+        self.stats: DefaultDict[str, float] = defaultdict(float)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    async def _acquire_slot(self, priority: int) -> None:
+        if self.running < self.max_concurrency and not self._waiting:
+            self.running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._order), future)
+        heapq.heappush(self._waiting, entry)
+        self.stats["max_queue_depth"] = max(
+            self.stats["max_queue_depth"], self.queue_depth
+        )
+        try:
+            # the slot is handed over by _release_slot
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            else:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            raise
+
+    def _release_slot(self) -> None:
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    async def _wait_for_model(self, model: Optional[str], tokens: int) -> None:
+        limits = self.model_limits.get(model or "", {})
+        for kind, amount in (("requests_per_minute", 1), ("tokens_per_minute", tokens)):
+            if kind not in limits:
+                continue
+            bucket = self._buckets.setdefault(
+                (model or "", kind), TokenBucket(limits[kind])
+            )
+            while (delay := bucket.take(amount)) > 0:
+                self.stats["throttled_seconds"] += delay
+                await asyncio.sleep(delay)
+
+    def backoff(self, attempt: int) -> float:
+        # "equal jitter": at least half the exponential backoff, so retries
+        # from concurrent calls spread out without retrying immediately
+        backoff = min(self.max_backoff, self.base_backoff * 2**attempt)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        model: Optional[str] = None,
+        priority: int = OTHER,
+        tokens: int = 0,
+    ) -> T:
+        """
+        Await call() once model is within its limits and then a slot is free,
+        estimating that the call uses tokens tokens. Calls wait for their
+        model's limits before taking a slot, so a throttled call doesn't hold
+        up calls to other models. Calls that are rate
+        limited, by raising an error or returning a result with an error that
+        says so, are retried up to max_retries times, after which the error
+        or result is passed on.
+        """
+        attempt = 0
+        while True:
+            await self._wait_for_model(model, tokens)
+            queued_at = time.monotonic()
+            await self._acquire_slot(priority)
+            try:
+                self.stats["queued_seconds"] += time.monotonic() - queued_at
+                self.stats["requests"] += 1
+                try:
+                    result = await call()
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt >= self.max_retries:
+                        raise
+                else:
+                    if (
+                        not is_rate_limited(getattr(result, "error", None))
+                        or attempt >= self.max_retries
+                    ):
+                        return result
+                self.stats["rate_limited"] += 1
+            finally:
+                self._release_slot()
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
@@ -0,0 +1,144 @@
+import math
+import re
+import shlex
+
+MAX_TIMEOUT = (25 - 1) * 60  # from pyhooks
+
+# Commands that are known to take a long time, with the minimum timeout to use for
+# them. The first matching pattern wins.
+known_long_commands = [
+    (
+        re.compile(
+            r"^((python3? -m )?pip3?|uv pip|poetry|conda|mamba|apt(-get)?|npm|yarn|pnpm)"
+            r" (install|add|update|upgrade|sync)\b"
+        ),
+        600,
+    ),
+    (re.compile(r"^(make|cmake|ninja|cargo|go build|mvn|gradle|bazel)\b"), 600),
+    (re.compile(r"\b(train|finetune|fine_tune|fit)\w*\.py\b"), 1200),
+    (re.compile(r"^(python3? -m )?pytest\b"), 300),
+]
+
+_env_assignment_re = re.compile(r"^\w+=\S*$")
+
+
+def command_prefix(command: str) -> str:
+    """
+    Key under which runtime statistics for command are kept: the program and its
+    first non-flag argument (e.g. "pip install", "python train.py") of the first
+    part of the command that isn't a cd, a source or an environment assignment.
+    """
+    for part in re.split(r"&&|\|\||;|\||\n", command):
+        try:
+            words = shlex.split(part)
+        except ValueError:
+            words = part.split()
+        while words and (
+            _env_assignment_re.match(words[0]) or words[0] in ("sudo", "time", "nohup")
+        ):
+            words = words[1:]
+        if not words or words[0] in ("cd", "source", ".", "export", "set"):
+            continue
+        program = words[0].rsplit("/", 1)[-1]
+        if program == "timeout" and len(words) > 2:
+            # the agent's own timeout wrapper
+            words = words[2:]
+            program = words[0].rsplit("/", 1)[-1]
+        argument = next(
+            (word for word in words[1:] if not word.startswith("-")),
+            None,
+        )
+        if program in ("python", "python3") and words[1:2] == ["-m"] and argument:
+            return f"{program} -m {argument}"
+        return program if argument is None else f"{program} {argument}"
+    return command.strip().split("\n", 1)[0][:50]
+
+
+class TimeoutPolicy:
+    """
+    Picks the timeout for a command from the runtimes of previous commands with the
+    same prefix, and from a list of commands known to be slow.
+
+    The timeout set by the agent is always respected as a lower bound. Statistics
+    are kept in a plain dict (State.command_stats) so they are saved with the
+    rest of the state. It is only used by the persistent shell toolkit, where a
+    command that outlives its timeout keeps running as a job instead of being
+    killed.
+    """
+
+    def __init__(
+        self, stats: dict, max_timeout: int = MAX_TIMEOUT, max_prefixes: int = 256
+    ):
+        self.stats = stats
+        self.max_timeout = max_timeout
+        self.max_prefixes = max_prefixes
+
+    def timeout_for(
+        self,
+        command: str,
+        base_timeout: int,
+        time_remaining: int | None = None,
+    ) -> tuple[int, str | None]:
+        """
+        Return the timeout to use for command, and the reason it was extended
+        beyond base_timeout (or None if it wasn't).
+        """
+        timeout, reason = base_timeout, None
+        stripped = command.strip()
+        for pattern, minimum in known_long_commands:
+            if pattern.search(stripped):
+                if minimum > timeout:
+                    timeout, reason = minimum, "known long-running command"
+                break
+
+        prefix = command_prefix(command)
+        stats = self.stats.get(prefix)
+        if stats is not None:
+            if stats["timeouts"] == 1:
+                # the last run timed out, so try once more with twice as long
+                learned = 2 * stats["max_timeout_used"]
+            elif stats["timeouts"] > 1:
+                # it keeps timing out (e.g. a server or `tail -f`), so stop waiting
+                # longer for it
+                learned = 0
+            else:
+                learned = math.ceil(1.5 * stats["max_seconds"])
+            if learned > timeout:
+                timeout = learned
+                reason = f"previous runs of {prefix!r}"
+
+        timeout = min(timeout, self.max_timeout)
+        if time_remaining is not None:
+            timeout = min(timeout, max(base_timeout, time_remaining))
+        if timeout <= base_timeout:
+            return base_timeout, None
+        return timeout, reason
+
+    def record(
+        self, command: str, seconds: float, timed_out: bool, timeout_used: int
+    ) -> None:
+        prefix = command_prefix(command)
+        if prefix not in self.stats and len(self.stats) >= self.max_prefixes:
+            # forget the prefix with the fewest runs to keep the state small
+            del self.stats[min(self.stats, key=lambda k: self.stats[k]["runs"])]
+        stats = self.stats.setdefault(
+            prefix,
+            {
+                "runs": 0,
+                "timeouts": 0,
+                "mean_seconds": 0.0,
+                "max_seconds": 0.0,
+                "max_timeout_used": 0,
+            },
+        )
+        stats["runs"] += 1
+        if timed_out:
+            stats["timeouts"] += 1
+            stats["max_timeout_used"] = max(stats["max_timeout_used"], timeout_used)
+        else:
+            # a successful run that fits in the timeout means the earlier
+            # timeouts were probably flukes or have been fixed
+            stats["timeouts"] = 0
+            # a run cut off at its timeout says nothing about how long it needs
+            stats["max_seconds"] = max(stats["max_seconds"], round(seconds, 3))
+        stats["mean_seconds"] += (seconds - stats["mean_seconds"]) / stats["runs"]
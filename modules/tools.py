@@ -1,5 +1,9 @@
-import base64
+import asyncio
+import glob
 import json
+import math
+import os
+import re
 from pathlib import Path
 import textwrap
 from typing import Any
@@ -7,6 +11,11 @@ from typing import Any
 from pyhooks.types import MiddlemanSettings, OpenaiChatMessage
 
 from base import State, actions, hooks
+from modules import llm
+from modules.bash_session import BashJob, BashSession
+from modules.image_cache import ImagePipeline, PreparedImage
+from modules.output_store import get_line_index, output_store_dir
+from modules.timeouts import TimeoutPolicy
 from templates import default_timeout
 
 
@@ -194,6 +203,138 @@ run_bash_state_object = {
 }
 
 
+bash_session = BashSession()
+
+
+def _record_job_runtime(_state: State, job: BashJob) -> None:
+    """
+    Record how long a finished job took, once, so later runs of similar commands
+    are waited on for long enough.
+    """
+    if not job.done.is_set() or job.runtime_recorded:
+        return
+    job.runtime_recorded = True
+    TimeoutPolicy(_state.command_stats).record(
+        job.command, job.runtime, False, math.ceil(job.runtime)
+    )
+
+
+def _format_job_output(job_id: int, output: str, exit_code: int | None) -> str:
+    if exit_code is not None:
+        output = output.removesuffix("\n")
+        return f"{output}\nExit code: {exit_code}"
+    return (
+        f"{output}\n[The command is still running as job {job_id}. Use poll_bash with"
+        f" job {job_id} to get more output, or to interrupt it.]"
+    )
+
+
+async def run_bash_session(_state: State, command: str) -> str:
+    await hooks.action(
+        {
+            "type": "run_bash",
+            "args": {"command": command},
+        }
+    )
+    if bash_session.busy:
+        job = bash_session.current_job
+        assert job is not None
+        return (
+            f"Error: the shell is still running job {job.job_id} ({job.command!r})."
+            " Use poll_bash to wait for it or interrupt it before running another"
+            " command. Use '&' to run long-running commands in the background."
+        )
+    timeout_policy = TimeoutPolicy(_state.command_stats)
+    timeout, timeout_reason = timeout_policy.timeout_for(
+        command, _state.timeout, _state.time_limit - _state.time_usage
+    )
+    job = await bash_session.start_job(command)
+    await bash_session.wait(job, timeout)
+    _record_job_runtime(_state, job)
+    output = _format_job_output(job.job_id, job.read_new_output(), job.exit_code)
+    if timeout_reason is not None:
+        output += (
+            f"\n[Note: waited up to {timeout} seconds for this command based on"
+            f" {timeout_reason}]"
+        )
+    return output
+
+
+run_bash_session_object = {
+    "description": " ".join(
+        [
+            "Run a bash command in a persistent shell on the server. The working directory,",
+            "environment variables and shell functions persist between commands.",
+            "Doesnt support interactive commands. If the command doesn't finish",
+            "within the timeout, its output so far is returned and it keeps running",
+            "as a job that can be checked on with poll_bash.",
+        ]
+    ),
+    "function": run_bash_session,
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "command": {
+                "type": "string",
+                "description": "bash command to be executed in the VM",
+            },
+        },
+        "required": ["command"],
+    },
+}
+
+
+async def poll_bash(
+    _state: State, job_id: int | str, interrupt: bool | str = False
+) -> str:
+    try:
+        job = bash_session.jobs[int(job_id)]
+    except (KeyError, ValueError):
+        return f"Error: there is no bash job {job_id}."
+    if isinstance(interrupt, str):
+        interrupt = interrupt.strip().lower() in ("true", "1", "yes")
+    if interrupt and not job.done.is_set():
+        # an interrupted job took too long, so count it as a timeout
+        job.runtime_recorded = True
+        TimeoutPolicy(_state.command_stats).record(
+            job.command, job.runtime, True, math.ceil(job.runtime)
+        )
+        if await bash_session.interrupt():
+            output = job.read_new_output().removesuffix("\n")
+            return (
+                f"{output}\n[Job {job.job_id} was interrupted.]\n"
+                f"Exit code: {job.exit_code}"
+            )
+        output = job.read_new_output()
+        return (
+            f"{output}\n[Job {job.job_id} was interrupted. The shell was restarted in"
+            " the same working directory, but environment variables were reset.]"
+        )
+    await bash_session.wait(job, _state.timeout)
+    _record_job_runtime(_state, job)
+    return _format_job_output(job.job_id, job.read_new_output(), job.exit_code)
+
+
+poll_bash_object = {
+    "description": "Get new output from a bash job that was still running when its command returned, waiting up to the timeout for it to finish. Set interrupt to true to stop the job instead.",
+    "function": poll_bash,
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "integer",
+                "description": "The id of the job to poll",
+            },
+            "interrupt": {
+                "type": "boolean",
+                "description": "Whether to interrupt the job",
+            },
+        },
+        "required": ["job_id"],
+    },
+}
+
+
 async def set_timeout(_state: State, timeout: str | int | Any) -> str:
     original_timeout = _state.timeout
     max_timeout = (25 - 1) * 60  # from pyhooks
@@ -232,13 +373,17 @@ set_timeout_object = {
 }
 
 image_file_extensions = [".png", ".jpg", ".jpeg", ".webp", ".gif"]
+image_pipeline = ImagePipeline()
+
+
+# TODO: support other vision models
+vision_model = "gpt-4o-2024-05-13"
 
 
 async def analyze_image(_state: State, image_url: str, query: str | None = None):
     task = _state.task_string
 
-    # TODO: support other vision models
-    model = "gpt-4o-2024-05-13"
+    model = vision_model
 
     if model is None:
         return "Fatal Error: No vision model configured"
@@ -265,7 +410,7 @@ I need to view this image, but don't have image input enabled. Here's the image:
             ],
         )
     ]
-    return await hooks.generate_one(
+    return await llm.generate_one(
         MiddlemanSettings(model=model, n=1, temp=1, max_tokens=500), messages=messages
     )
 
@@ -282,14 +427,19 @@ async def describe_image_fn(_state: State, file_path: str | Path, query: str | N
                 If you want to ask a question about the image, make sure you specify it in the "query" parameter.
                 """
             ).strip()
-        image_base64 = base64.b64encode(file_path.read_bytes()).decode("utf-8")
-        assert len(image_base64) > 10, "Image is empty"
-        image_url = f"data:image/{extension[1:]};base64," + image_base64
-        vlm_response = await analyze_image(_state, image_url=image_url, query=query)
+        image = await image_pipeline.prepare(str(file_path))
+        vlm_response = image_pipeline.cached_answer(image.digest, query)
+        if vlm_response is None:
+            vlm_response = await analyze_image(
+                _state, image_url=image.data_url, query=query
+            )
+            image_pipeline.cache_answer(image.digest, query, vlm_response)
         return f"The vision language model returned this:\n{vlm_response}"
 
     except FileNotFoundError:
         return f"Error: file not found: {file_path}"
+    except ValueError as e:
+        return f"Error: {e}"
 
 
 describe_image_object = {
@@ -311,12 +461,409 @@ describe_image_object = {
     },
 }
 
+# Limits on a single packed request to the vision model. Images that don't fit
+# are analyzed with separate requests instead.
+MAX_IMAGES_PER_REQUEST = 8
+MAX_IMAGE_PAYLOAD_CHARS = 15 * 1024 * 1024
+MAX_IMAGES_PER_CALL = 32
+_image_answer_re = re.compile(r"<image_(\d+)>(.*?)</image_\1>", re.DOTALL)
+
+
+def _expand_image_paths(file_paths: str | list[str]) -> list[str]:
+    if isinstance(file_paths, str):
+        try:
+            parsed = json.loads(file_paths)
+        except json.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, list):
+            file_paths = parsed
+        else:
+            file_paths = [
+                path.strip() for path in re.split(r"[\n,]", file_paths) if path.strip()
+            ]
+    paths = []
+    for path in file_paths:
+        path = os.path.expanduser(str(path))
+        if glob.has_magic(path):
+            paths.extend(
+                match
+                for match in sorted(glob.glob(path, recursive=True))
+                if Path(match).suffix.lower() in image_file_extensions
+            )
+        else:
+            paths.append(path)
+    # keep the first occurrence of each path
+    return list(dict.fromkeys(paths))
+
+
+async def analyze_images(
+    _state: State, images: list[tuple[str, str]], query: str | None = None
+) -> dict[int, str]:
+    """
+    Ask the vision model about several images (pairs of file path and data URL) in
+    one request. Returns the answers that could be parsed, by position in images.
+    """
+    if query is None:
+        query_text = "describe what you see in it. Make sure to include any information that may be relevant to the task at hand."
+    else:
+        query_text = f'answer this question about it: "{query}". Include any information that may be relevant to the task at hand.'
+
+    content: list[dict] = [
+        {
+            "type": "text",
+            "text": f"""I am another AI agent working on this task:
+<task>
+{_state.task_string}
+</task>
+I need to view these {len(images)} images, but don't have image input enabled. Here are the images:""",
+        }
+    ]
+    for i, (path, image_url) in enumerate(images, 1):
+        content.append({"type": "text", "text": f"Image {i} ({path}):"})
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    content.append(
+        {
+            "type": "text",
+            "text": f"For each image, please {query_text} Answer for each image separately, putting the answer for image N between <image_N> and </image_N> tags.",
+        }
+    )
+    response = await llm.generate_one(
+        MiddlemanSettings(
+            model=vision_model,
+            n=1,
+            temp=1,
+            max_tokens=min(4096, 500 * len(images)),
+        ),
+        messages=[OpenaiChatMessage(role="user", content=content)],
+    )
+    return {
+        int(number) - 1: answer.strip()
+        for number, answer in _image_answer_re.findall(response)
+        if 0 < int(number) <= len(images)
+    }
+
+
+async def describe_images_fn(
+    _state: State, file_paths: str | list[str], query: str | None = None
+):
+    paths = _expand_image_paths(file_paths)
+    if not paths:
+        return f"Error: no image files found matching {file_paths}"
+    notes = []
+    if len(paths) > MAX_IMAGES_PER_CALL:
+        notes.append(
+            f"[Only the first {MAX_IMAGES_PER_CALL} of {len(paths)} images were analyzed]"
+        )
+        paths = paths[:MAX_IMAGES_PER_CALL]
+
+    async def prepare(path: str):
+        if Path(path).suffix.lower() not in image_file_extensions:
+            return f"Error: file extension {Path(path).suffix} not in allowed extensions {image_file_extensions}."
+        try:
+            return await image_pipeline.prepare(path)
+        except FileNotFoundError:
+            return f"Error: file not found: {path}"
+        except ValueError as e:
+            return f"Error: {e}"
+
+    prepared = await asyncio.gather(*(prepare(path) for path in paths))
+    answers: dict[int, str] = {}
+    # images that still need to be analyzed, by position
+    pending: dict[int, PreparedImage] = {}
+    for i, image in enumerate(prepared):
+        if isinstance(image, str):
+            answers[i] = image
+        elif (cached := image_pipeline.cached_answer(image.digest, query)) is not None:
+            answers[i] = cached
+        else:
+            pending[i] = image
+
+    # pack as many images as fit into each request
+    batches: list[list[int]] = []
+    payload_chars = 0
+    for i in pending:
+        image_chars = len(pending[i].data_url)
+        if (
+            not batches
+            or len(batches[-1]) == MAX_IMAGES_PER_REQUEST
+            or payload_chars + image_chars > MAX_IMAGE_PAYLOAD_CHARS
+        ):
+            batches.append([])
+            payload_chars = 0
+        batches[-1].append(i)
+        payload_chars += image_chars
+
+    async def analyze_batch(batch: list[int]) -> None:
+        if len(batch) > 1:
+            packed = await analyze_images(
+                _state, [(paths[i], pending[i].data_url) for i in batch], query
+            )
+            for position, answer in packed.items():
+                answers[batch[position]] = answer
+        # images that are alone in their request, or that the model didn't answer
+        # in the expected format, are analyzed separately and in parallel
+        missing = [i for i in batch if i not in answers]
+        responses = await asyncio.gather(
+            *(
+                analyze_image(_state, image_url=pending[i].data_url, query=query)
+                for i in missing
+            )
+        )
+        answers.update(zip(missing, responses))
+        for i in batch:
+            image_pipeline.cache_answer(pending[i].digest, query, answers[i])
+
+    await asyncio.gather(*(analyze_batch(batch) for batch in batches))
+
+    sections = [
+        f"Image {i + 1}: {path}\n{answers[i]}" for i, path in enumerate(paths)
+    ]
+    return "\n\n".join(
+        ["The vision language model returned this:", *sections, *notes]
+    )
+
+
+describe_images_object = {
+    "description": "Have an advanced vision language model analyze several image files at once, such as a directory of plots.",
+    "function": describe_images_fn,
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "file_paths": {
+                "anyOf": [
+                    {"type": "string"},
+                    {"type": "array", "items": {"type": "string"}},
+                ],
+                "description": "A glob pattern such as plots/*.png, or a list of image file paths.",
+            },
+            "query": {
+                "type": "string",
+                "description": "A specific question to ask about each image, if you have one.",
+            },
+        },
+        "required": ["file_paths"],
+    },
+}
+
+# where modules.actors saves long outputs
+saved_output_dirs: list[str] = []
+
+
+def configure_from_env() -> None:
+    global saved_output_dirs
+    directory = output_store_dir()
+    saved_output_dirs = [
+        os.path.join(directory, "long_outputs"),
+        os.path.join(directory, "tool_outputs"),
+    ]
+
+
+configure_from_env()
+
+
+def _find_saved_output(file_path: str) -> str | None:
+    if not file_path:
+        # default to the most recently saved output
+        candidates = [
+            entry.path
+            for output_dir in saved_output_dirs
+            if os.path.isdir(output_dir)
+            for entry in os.scandir(output_dir)
+            if entry.is_file()
+            and not entry.name.startswith(".")
+            and ".tmp-" not in entry.name
+        ]
+        return max(candidates, key=os.path.getmtime, default=None)
+    if os.path.sep not in file_path:
+        file_path = next(
+            (
+                os.path.join(output_dir, file_path)
+                for output_dir in saved_output_dirs
+                if os.path.isfile(os.path.join(output_dir, file_path))
+            ),
+            file_path,
+        )
+    real_path = os.path.realpath(file_path)
+    if not any(
+        real_path.startswith(os.path.realpath(output_dir) + os.path.sep)
+        for output_dir in saved_output_dirs
+    ):
+        return None
+    return real_path if os.path.isfile(real_path) else None
+
+
+def _format_lines(lines: list[str], first_line: int, max_line_length: int = 500) -> str:
+    return "\n".join(
+        f"{first_line + i}: "
+        + (line if len(line) <= max_line_length else line[:max_line_length] + "...")
+        for i, line in enumerate(lines)
+    )
+
+
+def _as_int(value: Any) -> int | None:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+async def search_output(
+    _state: State,
+    file_path: str = "",
+    pattern: str | None = None,
+    regex: bool | str = False,
+    context_lines: int | str = 2,
+    start_line: int | str | None = None,
+    end_line: int | str | None = None,
+    max_matches: int | str = 50,
+) -> str:
+    try:
+        context_lines = max(0, _as_int(context_lines) or 0)
+        start_line = _as_int(start_line)
+        end_line = _as_int(end_line)
+        max_matches = max(1, _as_int(max_matches) or 50)
+    except ValueError:
+        return "Error: context_lines, start_line, end_line and max_matches must be integers."
+    if isinstance(regex, str):
+        regex = regex.strip().lower() in ("true", "1", "yes")
+    # indexing and searching a huge output takes a while, so keep it off the
+    # event loop
+    return await asyncio.to_thread(
+        _search_output_sync,
+        str(file_path or "").strip(),
+        pattern,
+        bool(regex),
+        context_lines,
+        start_line,
+        end_line,
+        max_matches,
+    )
+
+
+def _search_output_sync(
+    file_path: str,
+    pattern: str | None,
+    regex: bool,
+    context_lines: int,
+    start_line: int | None,
+    end_line: int | None,
+    max_matches: int,
+) -> str:
+    path = _find_saved_output(file_path)
+    if path is None:
+        return (
+            f"Error: {file_path or 'no saved output'} is not a saved output. "
+            f"Saved outputs are in {' and '.join(saved_output_dirs)}."
+        )
+
+    index = get_line_index(path)
+    header = f"{path} has {index.num_lines} lines."
+
+    if pattern:
+        try:
+            matched_lines, truncated = index.search(
+                pattern, regex=regex, max_matches=max_matches
+            )
+        except re.error as e:
+            return f"Error: invalid regular expression: {e}"
+        if not matched_lines:
+            return f"{header}\nNo lines match {pattern!r}."
+        # merge overlapping context windows into contiguous blocks
+        blocks: list[list[int]] = []
+        for line in matched_lines:
+            block_start = max(0, line - context_lines)
+            block_end = min(index.num_lines, line + context_lines + 1)
+            if blocks and block_start <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], block_end)
+            else:
+                blocks.append([block_start, block_end])
+        results = "\n--\n".join(
+            _format_lines(index.lines(block_start, block_end), block_start + 1)
+            for block_start, block_end in blocks
+        )
+        summary = f"{len(matched_lines)} matching lines"
+        if truncated:
+            summary = f"First {max_matches} matching lines (there are more)"
+        return f"{header} {summary}:\n{results}"
+
+    if start_line is None and end_line is None:
+        start_line, end_line = 1, 20
+    elif start_line is None:
+        start_line = 1
+    if start_line < 0:
+        # negative line numbers count from the end of the output, as in tail
+        start_line = index.num_lines + start_line + 1
+    start_line = max(1, start_line)
+    if end_line is None:
+        end_line = start_line + 99
+    elif end_line < 0:
+        end_line = index.num_lines + end_line + 1
+    end_line = min(end_line, start_line + 999)
+    lines = index.lines(start_line - 1, end_line)
+    if not lines:
+        return f"{header} No lines in range {start_line}-{end_line}."
+    return f"{header} Lines {start_line}-{start_line + len(lines) - 1}:\n" + (
+        _format_lines(lines, start_line)
+    )
+
+
+search_output_object = {
+    "description": " ".join(
+        [
+            "Search or view a long tool output saved by the scaffolding,",
+            "without printing the whole file.",
+            "If pattern is given, returns the matching lines (with line numbers and",
+            "surrounding context); otherwise returns the lines from start_line to",
+            "end_line. Negative line numbers count from the end of the output.",
+        ]
+    ),
+    "function": search_output,
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "file_path": {
+                "type": "string",
+                "description": "The saved output file. Leave empty for the most recently saved output.",
+            },
+            "pattern": {
+                "type": "string",
+                "description": "Substring (or regular expression, if regex is true) to search for.",
+            },
+            "regex": {
+                "type": "boolean",
+                "description": "Whether pattern is a regular expression.",
+            },
+            "context_lines": {
+                "type": "integer",
+                "description": "Number of lines of context around each match. Defaults to 2.",
+            },
+            "start_line": {
+                "type": "integer",
+                "description": "First line to return (1-based, negative to count from the end).",
+            },
+            "end_line": {
+                "type": "integer",
+                "description": "Last line to return (inclusive).",
+            },
+            "max_matches": {
+                "type": "integer",
+                "description": "Maximum number of matching lines to return. Defaults to 50.",
+            },
+        },
+        "required": [],
+    },
+}
+
 # These tools can be added to any toolkit to enable mid-run scoring.
 scoring_tools = {
     "score": score_fn_object,
     "score_log": score_log_fn_object,
 }
 
+# These tools are added to the toolkit by actors that save long outputs to files.
+search_tools = {
+    "search_output": search_output_object,
+}
+
 _basic = {
     "python": run_python_object,
     "bash": run_bash_state_object,
@@ -324,9 +871,19 @@ _basic = {
     "timeout": set_timeout_object,
 }
 
-_basic_vision = {"describe_image": describe_image_object, **_basic}
+_basic_vision = {
+    "describe_image": describe_image_object,
+    "describe_images": describe_images_object,
+    **_basic,
+}
 
 _vision_double_return = {
     **_basic_vision,
     "submit": double_return_fn_object,
 }
+
+_persistent_bash = {
+    **_basic,
+    "bash": run_bash_session_object,
+    "poll_bash": poll_bash_object,
+}
@@ -0,0 +1,181 @@
+"""
+Runs many agents on one host from a single warmed-up parent process.
+
+The parent imports the agent modules and loads the tokenizer once, then forks a
+worker for each run, so runs skip that startup work and share the parent's
+memory copy-on-write. Runs are taken from a queue directory: each *.json file
+there holds the environment for one run (the variables pyhooks reads, plus
+SETTINGS_PATH and optionally STARTING_STATE_PATH), e.g.
+
+    {"env": {"RUN_ID": "123", "AGENT_TOKEN": "...", "TASK_ID": "task/1",
+             "SETTINGS_PATH": "/runs/123/settings.json"},
+     "log_path": "/runs/123/agent.log"}
+
+Each worker applies its run's environment before reconfiguring the modules
+from it, so settings like MODEL_RATE_LIMITS or GENERATION_CACHE_DIR can differ
+between runs. Unless the environment sets OUTPUT_STORE_DIR, each run saves long
+outputs under runs/<RUN_ID> in the supervisor's output store directory, since
+output stores index outputs by node id.
+
+A claimed run is renamed to *.json.running, then to *.json.done or
+*.json.failed when its worker exits.
+
+Usage: python supervisor.py QUEUE_DIR [--workers 8] [--exit-when-empty]
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import Optional
+
+from pyhooks import Actions, Hooks
+
+import base
+import main
+from modules import actors, generators, llm, prompters, tools
+from modules.output_store import output_store_dir
+
+fork_context = multiprocessing.get_context("fork")
+
+
+def warm_up() -> None:
+    """
+    Do the startup work shared by every run in the parent, and keep the
+    garbage collector from touching the resulting objects, which would copy the
+    pages they live on into each worker.
+    """
+    prompters.get_encoding()
+    gc.collect()
+    gc.freeze()
+
+
+def reinitialize_hooks() -> None:
+    """
+    Replace the hooks and actions created when base was imported (with the
+    parent's environment) by ones for this run, wherever they were imported.
+    """
+    old = {id(base.hooks): Hooks(), id(base.actions): Actions()}
+    for module in list(sys.modules.values()):
+        for name in ("hooks", "actions"):
+            value = getattr(module, name, None)
+            if value is not None and id(value) in old:
+                setattr(module, name, old[id(value)])
+
+
+def reinitialize_from_env() -> None:
+    """
+    Rebuild the module state that was configured from the parent's environment
+    when the modules were imported.
+    """
+    for module in (llm, generators, actors, tools):
+        module.configure_from_env()
+
+
+def run_agent(spec: dict) -> None:
+    if log_path := spec.get("log_path"):
+        log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+        os.close(log_fd)
+    if "OUTPUT_STORE_DIR" not in spec["env"]:
+        run_id = spec["env"].get("RUN_ID") or str(os.getpid())
+        os.environ["OUTPUT_STORE_DIR"] = os.path.join(
+            output_store_dir(), "runs", str(run_id)
+        )
+    os.environ.update({key: str(value) for key, value in spec["env"].items()})
+    reinitialize_hooks()
+    reinitialize_from_env()
+    base.hooks.main(main.main)
+
+
+def claim_next(queue_dir: Path) -> Optional[Path]:
+    for path in sorted(queue_dir.glob("*.json")):
+        claimed = path.with_name(f"{path.name}.running")
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            # claimed by another supervisor
+            continue
+        return claimed
+    return None
+
+
+def finish(claimed: Path, exit_code: Optional[int]) -> None:
+    status = "done" if exit_code == 0 else "failed"
+    claimed.rename(
+        claimed.with_name(claimed.name.removesuffix(".running") + f".{status}")
+    )
+    print(
+        f"{claimed.name.removesuffix('.running')}: {status} (exit code {exit_code})",
+        flush=True,
+    )
+
+
+def supervise(
+    queue_dir: Path,
+    workers: int,
+    poll_interval: float = 1.0,
+    exit_when_empty: bool = False,
+) -> None:
+    running: dict[Path, BaseProcess] = {}
+    try:
+        while True:
+            while len(running) < workers and (claimed := claim_next(queue_dir)):
+                try:
+                    with open(claimed) as f:
+                        spec = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"{claimed.name}: invalid run spec: {e}", flush=True)
+                    finish(claimed, None)
+                    continue
+                process = fork_context.Process(target=run_agent, args=(spec,))
+                process.start()
+                running[claimed] = process
+            if not running and exit_when_empty:
+                return
+            multiprocessing.connection.wait(
+                [process.sentinel for process in running.values()],
+                timeout=poll_interval,
+            )
+            for claimed, process in list(running.items()):
+                if not process.is_alive():
+                    process.join()
+                    finish(claimed, process.exitcode)
+                    del running[claimed]
+    finally:
+        for claimed, process in running.items():
+            process.terminate()
+            process.join()
+            finish(claimed, process.exitcode)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("queue_dir", type=Path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--exit-when-empty",
+        action="store_true",
+        help="Exit once the queue is empty and all runs have finished.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    warm_up()
+    supervise(
+        args.queue_dir,
+        workers=args.workers,
+        poll_interval=args.poll_interval,
+        exit_when_empty=args.exit_when_empty,
+    )
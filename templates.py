@@ -14,6 +14,15 @@ tool_descriptions = {
         "returns a history of your registered scores; do not provide a value for this tool"
     ),
     "describe_image": "path to an image file, and a question about the image, if you have one",
+    "describe_images": (
+        "JSON object with file_paths (a glob pattern or a list of image file paths) and a"
+        " query to ask about each image, if you have one"
+    ),
+    "poll_bash": "id of a bash job that is still running, to get its new output",
+    "search_output": (
+        "JSON object with the saved output's file_path and either a pattern to search for"
+        ' (with "regex": true for a regular expression) or a start_line and end_line to view'
+    ),
 }
 
 
@@ -39,25 +48,42 @@ gpt_basic_system_prompt = """You are an autonomous AI agent. You are made up of
 
 compare_options_prompt_v1 = """The following options have been proposed as a next step. They may contain a tool use, or may consist purely of reasoning, which can be valuable on its own insofar as it contains useful observations or insight. I will present each option in a json format, and you should choose the one that you believe is the best next step. You should start off by considering the merits and demerits of each option, and conclude with <FINAL CHOICE>[number of the option you choose]</FINAL CHOICE>. The description of the tools are included just so you can contextualize the options given, but you should NOT make use of any of them now. You should simply reason and make a choice using the format described above. The options are as follows:{options}"""
 
+compare_options_short_answer_prompt = """The following options have been proposed as a next step. They may contain a tool use, or may consist purely of reasoning, which can be valuable on its own insofar as it contains useful observations or insight. I will present each option in a json format, and you should choose the one that you believe is the best next step. Answer immediately with the number of the option you choose, as <FINAL CHOICE>[number of the option you choose]</FINAL CHOICE>, and nothing else: do not explain your choice. The description of the tools are included just so you can contextualize the options given, but you should NOT make use of any of them now. The options are as follows:{options}"""
+
 compare_and_regenerate_prompt_v1 = """The following options have been proposed as a next step. They may contain a tool use, or may consist purely of reasoning, which can be valuable on its own insofar as it contains useful observations or insight. I will present each option in a json format, so you can consider them as suggestions, and then decide on a next step. You should then do three things in order: First, you should go over each option and analyze its merits and demerits. Then, you should propose the best alternative action you can imagine (for example, this could be a better version of one of the options, or it could be a new option which combines the best aspects of two or more of the previous options, or something else). Then, you should conclude with <FINAL ACTION>[the next step you end up deciding on]</FINAL ACTION>. The final action you decide on can be identical to any of the presented options if it's the best you can imagine, but if you can come up with a final action that is better than all the options, you should propose that instead. The options are presented primarily as a starting point or inspiration. If you do decide on a final action that is identical with one of the presented options, you should copy that explicitly instead of making reference to it. But again, recall that you're encouraged to come up with an even better option if you can. For your final action, you should use the same syntax as used in the options, that is: you should use a JSON format with keys "content", and, optionally, "function_call". Please remember, it is crucial that you use the <FINAL ACTION> syntax with those tags. The options are as follows:{options}"""
 
 assess_and_backtrack_prompt = """The following action has been proposed as a next step. It may contain a tool use, or may consist purely of reasoning, which can be valuable on its own insofar as it contains useful observations or insight. Write a brief comparison of the proposed action to alternatives, and decide which one is most likely to succeed. Then, summarize your conclusion about the proposed action with one word: APPROVE or REJECT. {options}"""
 
+assess_and_backtrack_vote_prompt = """The following action has been proposed as a next step. It may contain a tool use, or may consist purely of reasoning, which can be valuable on its own insofar as it contains useful observations or insight. Write a brief comparison of the proposed action to alternatives, and decide which one is most likely to succeed. Then, conclude with your verdict on the proposed action, as <VERDICT>APPROVE</VERDICT> or <VERDICT>REJECT</VERDICT>. {options}"""
+
+reject_action_prompt = """The following action is not on the right track: {action}
+
+Consider a different approach."""
+
 reject_command_prompt = """The previous action does not match any of the supported commands. Write an action using one of the supported commands."""
 
 reject_arguments_prompt = """The previous tool call included unexpected arguments or argument types. Please try again with the correct arguments, or attempt a different action."""
 
 prompt_to_search = """The output of the last command was too long to display.
-The scaffolding saved the output of the command to "{filename}". If you need to look at the contents of the file, consider searching it.
-The file starts with the following:
-"{output_start}..."
- and ends with the following:
-"...{output_end}\""""
+The scaffolding saved the output of the command to "{filename}". If you need to look at the contents of the file, consider searching it with the search_output tool.
+Here is a condensed view of the output, keeping its start, its end and any lines that look like errors:
+{output_summary}"""
 
 notice_retroactively_using_saved_output = """The output of the previous command was long and is being truncated to lower token usage. This message may have initially displayed the entire output, and so subsequent actions may have taken advantage of that information. {saved_output_instructions}
-The output starts with the following:
-"{output_start}..."
-and ends with the following:
-"...{output_end}\""""
+Here is a condensed view of the output, keeping its start, its end and any lines that look like errors:
+{output_summary}"""
 
 notice_retroactively_trimmed_prompt = """Part of the history of the conversation has been trimmed to lower token usage. This means that some messages in this part of the conversation have been removed. Past actions may have taken advantage of the information in those messages."""
+
+summarize_history_prompt = """You are helping an autonomous AI agent keep track of its work on this task:
+<task>
+{task}
+</task>
+Below is part of the history of the agent's work, which is about to be removed from its context to lower token usage:
+<history>
+{history}
+</history>
+Summarize this part of the history for the agent, in at most a few hundred words. Keep everything it may need later: what it learned, file paths, commands and code that worked or failed and why, results and scores, and what it was planning to do next. Leave out anything that no longer matters. Reply with the summary only."""
+
+notice_retroactively_summarized_prompt = """Part of the history of the conversation has been replaced with a summary to lower token usage. Here is the summary of the {num_messages} messages that were removed:
+{summary}"""
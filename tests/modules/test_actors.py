@@ -1,5 +1,6 @@
 import asyncio # noqa: F401
 import json
+import threading
 from typing import Any
 
 import pytest
@@ -7,6 +8,7 @@ import pytest_mock
 
 import base
 import modules.actors as actors
+from modules.output_store import OutputStore
 import templates
 
 
@@ -162,3 +164,27 @@ async def test_get_result_message_simple(
     output = await actors.get_result_message_simple(agent)
 
     assert output == expected_output
+
+
+@pytest.mark.asyncio
+async def test_prompt_to_search_summarizes_off_event_loop(
+    mocker: pytest_mock.MockerFixture, monkeypatch: pytest.MonkeyPatch, tmp_path
+):
+    monkeypatch.setattr(
+        actors, "long_output_store", OutputStore(str(tmp_path), "long_output")
+    )
+    summary_threads = []
+
+    def summarize_output(content: str, token_budget: int) -> str:
+        summary_threads.append(threading.get_ident())
+        return "the summary"
+
+    mocker.patch.object(actors, "summarize_output", side_effect=summarize_output)
+    output = base.Message(role="function", name="bash", content="x" * 10_000)
+
+    result = await actors.maybe_prompt_to_search_post_act(output, node_id=3)
+
+    assert result is not None
+    assert "the summary" in result.content
+    assert str(tmp_path) in result.content
+    assert summary_threads and summary_threads[0] != threading.get_ident()
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import pytest
+import pytest_asyncio
+
+from modules.bash_session import BashSession, RingBuffer
+
+if TYPE_CHECKING:
+    import pathlib
+
+
+@pytest_asyncio.fixture(name="session")
+async def fixture_session():
+    session = BashSession()
+    yield session
+    await session.close()
+
+
+async def run(session: BashSession, command: str, timeout: float = 10):
+    job = await session.start_job(command)
+    await session.wait(job, timeout)
+    return job
+
+
+@pytest.mark.asyncio
+async def test_state_persists_between_commands(
+    session: BashSession, tmp_path: pathlib.Path
+):
+    await run(session, f"cd {tmp_path} && export GREETING=hello")
+    await run(session, 'greet() { echo "$GREETING from $(pwd)"; }')
+    job = await run(session, "greet; echo oops >&2; false")
+
+    assert job.exit_code == 1
+    assert job.read_new_output() == f"hello from {tmp_path}\noops\n"
+    assert session.cwd == str(tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_long_command_returns_partial_output(session: BashSession):
+    job = await run(session, "echo started; sleep 0.5; echo finished", timeout=0.2)
+
+    assert job.exit_code is None
+    # the last newline is held back until it's clear it isn't part of the
+    # end-of-command marker
+    assert job.read_new_output() == "started"
+    assert session.busy
+    with pytest.raises(RuntimeError):
+        await session.start_job("echo too soon")
+
+    assert await session.wait(job, 5)
+    assert job.exit_code == 0
+    assert job.read_new_output() == "\nfinished\n"
+    assert not session.busy
+
+
+@pytest.mark.asyncio
+async def test_interrupt_keeps_shell(session: BashSession):
+    await run(session, "export GREETING=hello")
+    job = await run(session, "echo waiting; sleep 30", timeout=0.2)
+
+    assert await session.interrupt()
+
+    assert job.done.is_set()
+    assert job.exit_code == 130
+    assert "waiting" in job.read_new_output()
+    job = await run(session, "echo $GREETING")
+    assert job.read_new_output() == "hello\n"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "command",
+    [
+        # runs in the shell itself, so there is nothing else to interrupt
+        "echo waiting; while true; do :; done",
+        "echo waiting; trap '' INT; sleep 30",
+    ],
+)
+async def test_interrupt_restarts_in_same_directory(
+    session: BashSession, tmp_path: pathlib.Path, command: str
+):
+    await run(session, f"cd {tmp_path}")
+    job = await run(session, command, timeout=0.2)
+
+    assert not await session.interrupt(grace_seconds=0.2)
+
+    assert job.done.is_set()
+    assert "waiting" in job.read_new_output()
+    job = await run(session, "pwd")
+    assert job.exit_code == 0
+    assert job.read_new_output() == f"{tmp_path}\n"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ["command", "expected_exit_code", "expected_output"],
+    [
+        ("echo 'unterminated", 2, "unexpected EOF"),
+        ("exit 3", 3, "The shell exited"),
+        ("printf 'no newline'", 0, "no newline"),
+    ],
+)
+async def test_command_edge_cases(
+    session: BashSession,
+    command: str,
+    expected_exit_code: int,
+    expected_output: str,
+):
+    job = await run(session, command)
+
+    assert job.exit_code == expected_exit_code
+    assert expected_output in job.read_new_output()
+    # the session is still usable afterwards
+    job = await run(session, "echo ok")
+    assert job.read_new_output() == "ok\n"
+
+
+@pytest.mark.asyncio
+async def test_output_is_bounded():
+    session = BashSession(max_output_chars=1000)
+    try:
+        job = await run(session, "for i in $(seq 1 2000); do echo line $i; done")
+    finally:
+        await session.close()
+
+    output = job.read_new_output()
+    assert job.exit_code == 0
+    assert output.startswith("[")
+    assert "characters of output were dropped]" in output
+    assert output.endswith("line 2000\n")
+    assert len(output) < 1100
+
+
+def test_ring_buffer_cursors():
+    buffer = RingBuffer(max_chars=10)
+    buffer.write("0123456")
+    text, cursor, dropped = buffer.read_from(0)
+    assert (text, cursor, dropped) == ("0123456", 7, 0)
+
+    buffer.write("789abcdef")
+    text, cursor, dropped = buffer.read_from(cursor)
+    assert (text, cursor, dropped) == ("789abcdef", 16, 0)
+
+    buffer.write("ghijklmnopqrstuvwxyz")
+    text, cursor, dropped = buffer.read_from(cursor)
+    assert (text, cursor, dropped) == ("qrstuvwxyz", 36, 10)
+
+
+@pytest.mark.asyncio
+async def test_wait_does_not_cancel_job(session: BashSession):
+    job = await session.start_job("sleep 0.3; echo done")
+    await asyncio.gather(session.wait(job, 0.05), session.wait(job, 0.05))
+
+    assert await session.wait(job, 5)
+    assert job.read_new_output() == "done\n"
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from modules.circuit_breaker import ModelHealth
+
+
+def test_circuit_opens_and_resets():
+    now = 0.0
+    health = ModelHealth(
+        failure_threshold=2, reset_seconds=60, slow_seconds=100, clock=lambda: now
+    )
+    chain = ["gpt-4o", "gpt-4o-mini"]
+    assert health.record("gpt-4o", ok=False, seconds=1) is False
+    assert health.available(chain) == chain
+    # slow calls count as failures
+    assert health.record("gpt-4o", ok=True, seconds=200) is False
+    assert health.breaker("gpt-4o").state == "open"
+    assert health.available(chain) == ["gpt-4o-mini"]
+
+    now = 60.0
+    assert health.breaker("gpt-4o").state == "half_open"
+    assert health.available(chain) == chain
+    # a failure while half open opens the circuit again
+    health.record("gpt-4o", ok=False, seconds=1)
+    assert health.available(chain) == ["gpt-4o-mini"]
+
+    now = 120.0
+    assert health.record("gpt-4o", ok=True, seconds=1) is True
+    assert health.breaker("gpt-4o").state == "closed"
+    assert health.breaker("gpt-4o").stats == {
+        "failures": 3,
+        "successes": 1,
+        "opened": 1,
+    }
+
+
+def test_all_circuits_open_tries_every_model():
+    health = ModelHealth(failure_threshold=1)
+    health.record("gpt-4o", ok=False, seconds=1)
+    health.record("gpt-4o-mini", ok=False, seconds=1)
+    assert health.available(["gpt-4o", "gpt-4o-mini"]) == ["gpt-4o", "gpt-4o-mini"]
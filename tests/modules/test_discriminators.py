@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from pyhooks.types import MiddlemanModelOutput, MiddlemanResult, MiddlemanSettings
+
+import base
+import modules.discriminators as discriminators
+
+
+def make_agent(options: list[str], option_counts: list[int] | None = None):
+    state = base.State(
+        task_string="test task",
+        next_step={
+            "module_type": "discriminator",
+            "args": {
+                "options": [
+                    base.Message(role="assistant", content=content)
+                    for content in options
+                ],
+                "generation_metadata": {},
+            },
+        },
+    )
+    if option_counts is not None:
+        state.next_step["args"]["option_counts"] = option_counts
+    state.generate_node(base.Message(role="user", content="Start."))
+    return base.Agent(
+        state=state,
+        settings=base.Settings(
+            toolkit="_basic",
+            prompter="_basic",
+            generator="_gpt_basic_1x4o",
+            discriminator="_tournament_4o",
+            actor="_basic",
+        ),
+        toolkit_dict={},
+    )
+
+
+@pytest.mark.asyncio
+async def test_tournament_picks_winner_in_log_rounds():
+    options = [f"option {i}" for i in range(9)]
+    options[7] = "the best option"
+    agent = make_agent(options)
+    brackets = []
+
+    async def comparison_generator(
+        agent, settings, template, option_indices: list[int]
+    ):
+        # the tournament always says which options are in the bracket
+        brackets.append(option_indices)
+        # prefer the best option, and otherwise the last one in the bracket
+        candidates = [
+            agent.state.next_step["args"]["options"][i] for i in option_indices
+        ]
+        choice = next(
+            (i for i, option in enumerate(candidates) if "best" in option.content),
+            len(candidates) - 1,
+        )
+        return MiddlemanResult(
+            outputs=[MiddlemanModelOutput(completion=f"<FINAL CHOICE>{choice}")]
+        )
+
+    await discriminators._tournament_factory(
+        agent,
+        middleman_settings=MiddlemanSettings(model="gpt-4o", n=1),
+        comparison_generator=comparison_generator,
+        bracket_size=3,
+    )
+    assert agent.state.nodes[-1].message.content == "the best option"
+    assert agent.state.next_step["module_type"] == "actor"
+    assert brackets == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [2, 5, 7]]
+    rounds = agent.state.nodes[-1].metadata["d__tournament__rounds"]
+    assert [[result["winner"] for result in round] for round in rounds] == [
+        [2, 5, 7],
+        [7],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_tournament_falls_back_to_most_sampled_option():
+    agent = make_agent(["a", "b", "c"], option_counts=[1, 5, 2])
+    calls = 0
+
+    async def comparison_generator(agent, settings, template, option_indices=None):
+        nonlocal calls
+        calls += 1
+        return MiddlemanResult(outputs=[MiddlemanModelOutput(completion="No idea.")])
+
+    await discriminators._tournament_factory(
+        agent,
+        middleman_settings=MiddlemanSettings(model="gpt-4o", n=1),
+        comparison_generator=comparison_generator,
+        max_attempts=2,
+    )
+    assert agent.state.nodes[-1].message.content == "b"
+    assert calls == 2
+
+
+@pytest.mark.parametrize(
+    ("completion", "expected"),
+    [
+        ("<FINAL CHOICE>[2]</FINAL CHOICE>", 2),
+        ("<FINAL CHOICE> 1", 1),
+        ("I considered <FINAL CHOICE>[0]. <FINAL CHOICE>[2]", 2),
+        ("2", 2),
+        ("[1]", 1),
+        ("Option 0.", 0),
+        ("<FINAL CHOICE>[3]", None),
+        ("Option 1 looks good, but 2 is better", None),
+        ("", None),
+    ],
+)
+def test_parse_choice(completion: str, expected: int | None):
+    assert discriminators._parse_choice(completion, num_options=3) == expected
+
+
+@pytest.mark.asyncio
+async def test_compare_options_short_falls_back_to_reasoning():
+    agent = make_agent(["a", "b", "c"])
+    prompts = []
+
+    async def comparison_generator(agent, settings, template):
+        prompts.append(template)
+        completion = (
+            "Hmm"
+            if template == discriminators.compare_options_short_answer_prompt
+            else "Option 1 is best. <FINAL CHOICE>[1]"
+        )
+        return MiddlemanResult(
+            outputs=[MiddlemanModelOutput(completion=completion)],
+            n_prompt_tokens_spent=100,
+            n_completion_tokens_spent=5,
+        )
+
+    await discriminators._compare_options_short_factory(
+        agent,
+        middleman_settings=MiddlemanSettings(model="gpt-4o", n=1, max_tokens=16),
+        comparison_generator=comparison_generator,
+        reasoning_settings=MiddlemanSettings(model="gpt-4o", n=1),
+    )
+    assert agent.state.nodes[-1].message.content == "b"
+    assert prompts == [discriminators.compare_options_short_answer_prompt] * 2 + [
+        discriminators.compare_options_prompt_v1
+    ]
+    record = agent.state.nodes[-1].metadata["d__compare_options__comparison"]
+    assert record["mode"] == "reasoning"
+    assert record["attempts"] == 3
+    assert record["prompt_tokens"] == 300
+    assert record["completion_tokens"] == 15
+
+
+@pytest.mark.asyncio
+async def test_assess_and_backtrack_votes_exit_early():
+    agent = make_agent(["ls -la"])
+    completions = iter(
+        [
+            "Rejecting this would be a mistake. <VERDICT>APPROVE",
+            "I would not REJECT it. <VERDICT>APPROVE",
+            "<VERDICT>REJECT",
+        ]
+    )
+    cancelled = []
+
+    async def comparison_generator(agent, settings, template):
+        completion = next(completions)
+        try:
+            # the judge that rejects is the slowest
+            await asyncio.sleep(10 if "REJECT" in completion[-10:] else 0)
+        except asyncio.CancelledError:
+            cancelled.append(completion)
+            raise
+        return MiddlemanResult(outputs=[MiddlemanModelOutput(completion=completion)])
+
+    await discriminators._assess_and_backtrack_vote_factory(
+        agent,
+        comparison_generator=comparison_generator,
+        middleman_settings=MiddlemanSettings(model="gpt-4o", n=1),
+        n_judges=3,
+    )
+    assert agent.state.nodes[-1].message.content == "ls -la"
+    assert agent.state.next_step["module_type"] == "actor"
+    assert cancelled == ["<VERDICT>REJECT"]
+    votes = agent.state.nodes[-1].metadata["d__assess_and_backtrack__votes"]
+    assert (votes["approve"], votes["reject"], votes["cancelled"]) == (2, 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_assess_and_backtrack_votes_reject_by_majority():
+    agent = make_agent(["rm -rf /"])
+    completions = iter(["<VERDICT>REJECT", "APPROVE, I guess", "<VERDICT> REJECT"])
+
+    async def comparison_generator(agent, settings, template):
+        return MiddlemanResult(
+            outputs=[MiddlemanModelOutput(completion=next(completions))]
+        )
+
+    await discriminators._assess_and_backtrack_vote_factory(
+        agent,
+        comparison_generator=comparison_generator,
+        middleman_settings=MiddlemanSettings(model="gpt-4o", n=1),
+        n_judges=3,
+    )
+    assert agent.state.nodes[-1].message.role == "user"
+    assert agent.state.next_step["module_type"] == "generator"
+    votes = agent.state.nodes[-1].metadata["d__assess_and_backtrack__votes"]
+    assert (votes["approve"], votes["reject"], votes["abstain"]) == (0, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_assess_and_backtrack_votes_failed_judges_abstain():
+    agent = make_agent(["rm -rf /"])
+    completions = iter(["<VERDICT>REJECT", None, "<VERDICT>REJECT"])
+
+    async def comparison_generator(agent, settings, template):
+        completion = next(completions)
+        if completion is None:
+            raise RuntimeError("rate limited")
+        return MiddlemanResult(outputs=[MiddlemanModelOutput(completion=completion)])
+
+    await discriminators._assess_and_backtrack_vote_factory(
+        agent,
+        comparison_generator=comparison_generator,
+        middleman_settings=MiddlemanSettings(model="gpt-4o", n=1),
+        n_judges=3,
+    )
+    assert agent.state.next_step["module_type"] == "generator"
+    votes = agent.state.nodes[-1].metadata["d__assess_and_backtrack__votes"]
+    assert (votes["reject"], votes["abstain"], votes["failed"]) == (2, 1, 1)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from pyhooks.types import (
+    MiddlemanModelOutput,
+    MiddlemanResult,
+    MiddlemanSettings,
+    OpenaiChatMessage,
+)
+
+import modules.llm as llm
+from modules.generation_cache import GenerationCache, request_hash
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def make_result(completion: str) -> MiddlemanResult:
+    return MiddlemanResult(outputs=[MiddlemanModelOutput(completion=completion)])
+
+
+def first_completion(result: MiddlemanResult | None) -> str:
+    assert result is not None and result.outputs is not None
+    return result.outputs[0].completion
+
+
+def test_request_hash_is_canonical():
+    settings = MiddlemanSettings(model="gpt-4o", n=1, temp=0, max_tokens=10)
+    as_models = [OpenaiChatMessage(role="user", content="hello")]
+    as_dicts = [
+        {"content": "hello", "role": "user", "name": None, "function_call": None}
+    ]
+    assert request_hash(as_models, settings) == request_hash(as_dicts, settings)
+    assert request_hash(as_models, settings) != request_hash(
+        as_models, settings, functions=[{"name": "bash"}]
+    )
+    assert request_hash(as_models, settings) != request_hash(
+        as_models, MiddlemanSettings(model="gpt-4o", n=2, temp=0, max_tokens=10)
+    )
+
+
+def test_cache_round_trip_and_occurrences(tmp_path: Path):
+    cache = GenerationCache(str(tmp_path))
+    messages = [{"role": "user", "content": "hello"}]
+    settings = MiddlemanSettings(model="gpt-4o", n=1, temp=0)
+
+    first_key = cache.key(messages, settings)
+    second_key = cache.key(messages, settings)
+    # asking the same thing again (e.g. in a retry loop) gets its own entry
+    assert first_key != second_key
+    assert cache.get(first_key) is None
+    cache.put(first_key, make_result("hi"))
+    cache.put(second_key, make_result("hi again"))
+    assert first_completion(cache.get(first_key)) == "hi"
+
+    # a new process sees the same keys in the same order
+    replayed = GenerationCache(str(tmp_path))
+    assert first_completion(replayed.get(replayed.key(messages, settings))) == "hi"
+    assert (
+        first_completion(replayed.get(replayed.key(messages, settings))) == "hi again"
+    )
+    assert replayed.stats["hits"] == 2
+
+
+def test_cache_policy_and_eviction(tmp_path: Path):
+    cache = GenerationCache(str(tmp_path), max_entries=2)
+    assert cache.is_cacheable(MiddlemanSettings(model="gpt-4o", temp=0))
+    assert not cache.is_cacheable(MiddlemanSettings(model="gpt-4o", temp=1))
+    assert GenerationCache(str(tmp_path), replay=True).is_cacheable(
+        MiddlemanSettings(model="gpt-4o", temp=1)
+    )
+
+    cache.put("a", make_result("a"))
+    cache.put("b", make_result("b"))
+    assert cache.get("a") is not None
+    cache.put("c", make_result("c"))
+    # b was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats["evictions"] == 1
+    assert not (tmp_path / "b.json").exists()
+
+    cache.put("error", MiddlemanResult(error="rate limited"))
+    assert cache.get("error") is None
+
+
+@pytest.mark.asyncio
+async def test_llm_generate_uses_cache(tmp_path: Path, mocker: MockerFixture):
+    generate_mock = mocker.patch(
+        "pyhooks.Hooks.generate", autospec=True, return_value=make_result("hi")
+    )
+    messages = [OpenaiChatMessage(role="user", content="hello")]
+    settings = MiddlemanSettings(model="gpt-4o", n=1, temp=0)
+
+    mocker.patch.object(llm, "generation_cache", None)
+    await llm.generate(messages=messages, settings=settings)
+    assert generate_mock.call_args.kwargs == {
+        "messages": messages,
+        "settings": settings,
+    }
+
+    mocker.patch.object(llm, "generation_cache", GenerationCache(str(tmp_path)))
+    result = await llm.generate(messages=messages, settings=settings)
+    assert first_completion(result) == "hi"
+    assert generate_mock.await_count == 2
+    # a fresh cache (e.g. a rerun of the same evaluation) replays the result
+    cache = GenerationCache(str(tmp_path))
+    mocker.patch.object(llm, "generation_cache", cache)
+    result = await llm.generate(messages=messages, settings=settings)
+    assert first_completion(result) == "hi"
+    assert generate_mock.await_count == 2
+
+    await llm.generate(
+        messages=messages, settings=MiddlemanSettings(model="gpt-4o", n=1, temp=1)
+    )
+    assert generate_mock.await_count == 3
+    assert cache.stats["uncacheable"] == 1
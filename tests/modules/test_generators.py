@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from pyhooks.types import MiddlemanModelOutput, MiddlemanResult, MiddlemanSettings
+
+import base
+import modules.generators as generators
+from modules.circuit_breaker import ModelHealth
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+def make_agent(model_fallbacks: dict | None = None) -> base.Agent:
+    state = base.State(task_string="test task")
+    state.generate_node(base.Message(role="user", content="Start."))
+    state.set_prompt_messages([state.nodes[0].message])
+    return base.Agent(
+        state=state,
+        settings=base.Settings(
+            toolkit="_basic",
+            prompter="_basic",
+            generator="_gpt_basic_1x4o",
+            discriminator="_basic",
+            actor="_basic",
+            model_fallbacks=model_fallbacks or {},
+        ),
+        toolkit_dict={
+            "bash": {"description": "Run a command", "parameters": {}},
+        },
+    )
+
+
+def make_result(*completions: str) -> MiddlemanResult:
+    return MiddlemanResult(
+        outputs=[
+            MiddlemanModelOutput(completion=completion) for completion in completions
+        ]
+    )
+
+
+@pytest.mark.asyncio
+async def test_gpt_basic_falls_back_while_model_fails(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(generators, "model_health", ModelHealth(failure_threshold=2))
+    models = []
+
+    async def generate(messages, settings, functions=None):
+        models.append(settings.model)
+        if settings.model == "gpt-4o":
+            raise RuntimeError("500 Internal Server Error")
+        return make_result(*["hi"] * settings.n)
+
+    mocker.patch.object(generators.llm, "generate", side_effect=generate)
+    settings = MiddlemanSettings(model="gpt-4o", n=2, temp=1, max_tokens=10)
+    agents = [make_agent({"gpt-4o": ["gpt-4o-mini"]}) for _ in range(3)]
+    for agent in agents:
+        await generators._gpt_basic_factory(agent, middleman_settings=settings)
+        assert agent.state.next_step["args"]["option_counts"] == [2]
+
+    # the circuit opened after two failures, so the third step skips gpt-4o
+    assert models == ["gpt-4o", "gpt-4o-mini"] * 2 + ["gpt-4o-mini"]
+    metadata = agents[-1].state.next_step["args"]["generation_metadata"]
+    assert metadata["model"] == "gpt-4o-mini"
+    assert metadata["fallbacks"] == [{"model": "gpt-4o", "reason": "circuit open"}]
+
+
+@pytest.mark.asyncio
+async def test_gpt_basic_stops_after_max_attempts(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(generators, "model_health", ModelHealth())
+    generate = mocker.patch.object(
+        generators.llm, "generate", return_value=make_result()
+    )
+    agent = make_agent()
+    with pytest.raises(ValueError, match="No valid generations"):
+        await generators._gpt_basic_factory(
+            agent,
+            middleman_settings=MiddlemanSettings(model="gpt-4o", n=1, max_tokens=10),
+        )
+    assert generate.await_count == generators.MAX_GENERATION_ATTEMPTS
+
+
+def test_claude_legacy_stop_sequences_cover_every_tool():
+    agent = make_agent()
+    agent.toolkit_dict = {tool: {} for tool in ["python", "bash", "submit", "timeout"]}
+    assert generators._claude_legacy_stop_sequences(agent) == [
+        "</python",
+        "</bash",
+        "</submit",
+        "</timeout",
+    ]
+
+    agent.toolkit_dict = {
+        tool: {}
+        for tool in ["describe_image", "python", "bash", "submit", "timeout", "score"]
+    }
+    for tool in ["bash", "score", "bash"]:
+        agent.append(
+            base.Message(
+                role="assistant",
+                content="",
+                function_call={"name": tool, "arguments": ""},
+            )
+        )
+    assert generators._claude_legacy_stop_sequences(agent) == [
+        "</bash",
+        "</score",
+        "</describe_image",
+        generators.TOOL_OUTPUT_STOP_SEQUENCE,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_claude_legacy_drops_text_after_tool_call(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(generators, "model_health", ModelHealth())
+    # stopped by TOOL_OUTPUT_STOP_SEQUENCE, and not stopped at all
+    mocker.patch.object(
+        generators.llm,
+        "generate",
+        return_value=make_result(
+            "Let me look.<describe_image>a.png</describe_image>\n<describe_image",
+            "Done.<score></score>\n<score-output>1.0</score-output>\nGreat!",
+        ),
+    )
+    agent = make_agent()
+    agent.toolkit_dict = {"describe_image": {}, "score": {}}
+    await generators._claude_legacy_factory(
+        agent,
+        middleman_settings=MiddlemanSettings(model="claude", n=2, max_tokens=10),
+    )
+    options = agent.state.next_step["args"]["options"]
+    assert [option.function_call for option in options] == [
+        {"type": "function", "name": "describe_image", "arguments": "a.png"},
+        {"type": "function", "name": "score", "arguments": ""},
+    ]
+    assert [option.content for option in options] == ["Let me look.", "Done."]
+    metadata = agent.state.next_step["args"]["generation_metadata"]
+    assert metadata["chars_after_tool_call"] == len("\n<describe_image") + len(
+        "\n<score-output>1.0</score-output>\nGreat!"
+    )
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from modules.hedging import Hedger, LatencyHistogram, latency_key
+
+
+def test_latency_histogram_percentile():
+    histogram = LatencyHistogram(max_samples=100)
+    for seconds in range(1, 201):
+        histogram.record(seconds)
+    # only the last 100 samples are kept
+    assert len(histogram) == 100
+    assert histogram.percentile(50) == 150
+    assert histogram.percentile(95) == 195
+    assert histogram.percentile(100) == 200
+    assert histogram.percentile(0) == 101
+
+
+def make_call(latencies: list[float]):
+    calls = []
+
+    async def call():
+        index = len(calls)
+        calls.append(index)
+        try:
+            await asyncio.sleep(latencies[index])
+        except asyncio.CancelledError:
+            calls[index] = "cancelled"
+            raise
+        return index
+
+    return call, calls
+
+
+def warmed_up(hedger: Hedger, seconds: float = 0.01) -> Hedger:
+    for _ in range(hedger.min_samples):
+        hedger.histograms["gpt-4o"].record(seconds)
+    return hedger
+
+
+@pytest.mark.asyncio
+async def test_hedger_duplicates_slow_calls():
+    hedger = warmed_up(Hedger(percentile=95, max_hedge_fraction=0.5))
+    call, calls = make_call([10, 0])
+    assert await hedger.run(call, "gpt-4o") == 1
+    # let the cancellation of the slow call go through
+    await asyncio.sleep(0)
+    assert calls == ["cancelled", 1]
+    assert hedger.stats["hedged"] == hedger.stats["hedge_won"] == 1
+    # the cancelled call is recorded too, as taking longer than the one that won
+    samples = hedger.histograms["gpt-4o"].samples
+    assert len(samples) == hedger.min_samples + 2
+    assert samples[-1] > samples[-2]
+
+
+@pytest.mark.parametrize(
+    ("hedger", "expected_calls"),
+    [
+        # hedging is off without a percentile
+        (warmed_up(Hedger()), [0]),
+        # too few samples to know what is slow
+        (Hedger(percentile=95), [0]),
+        # over the cost cap
+        (warmed_up(Hedger(percentile=95, max_hedge_fraction=0)), [0]),
+    ],
+)
+@pytest.mark.asyncio
+async def test_hedger_does_not_hedge(hedger: Hedger, expected_calls: list):
+    call, calls = make_call([0.05, 0])
+    assert await hedger.run(call, "gpt-4o") == 0
+    assert calls == expected_calls
+    assert hedger.stats["hedged"] == 0
+    assert hedger.histograms["gpt-4o"].samples[-1] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_hedger_caps_duplicates_by_tokens():
+    hedger = warmed_up(Hedger(percentile=95, max_hedge_fraction=0.5))
+    call, calls = make_call([0.05, 0])
+    assert await hedger.run(call, "gpt-4o", tokens=1000) == 1
+    assert hedger.stats["hedged_tokens"] == 1000
+
+    # half of all calls were hedged, but not half of their tokens
+    for _ in range(2):
+        call, calls = make_call([0.05, 0])
+        assert await hedger.run(call, "gpt-4o", tokens=10) == 0
+        assert calls == [0]
+    assert hedger.stats["hedged"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedger_keeps_latencies_by_key():
+    key = latency_key("gpt-4o", 1, 3000)
+    assert key == latency_key("gpt-4o", None, 4096) != latency_key("gpt-4o", 8, 4096)
+    hedger = Hedger(percentile=95, max_hedge_fraction=1)
+    for _ in range(hedger.min_samples):
+        hedger.histograms[key].record(0.01)
+
+    # a call for more completions takes longer, and isn't hedged on the
+    # latencies of smaller calls
+    call, calls = make_call([0.05, 0])
+    assert await hedger.run(call, latency_key("gpt-4o", 8, 4096)) == 0
+    assert calls == [0]
+    call, calls = make_call([0.05, 0])
+    assert await hedger.run(call, key) == 1
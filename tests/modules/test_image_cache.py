@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import base64
+import io
+from typing import TYPE_CHECKING
+
+import pytest
+
+from modules.image_cache import ImagePipeline
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.mark.asyncio
+async def test_prepare_caches_by_content(tmp_path: Path):
+    pipeline = ImagePipeline()
+    (tmp_path / "a.png").write_bytes(b"not really a png")
+    (tmp_path / "b.png").write_bytes(b"not really a png")
+
+    image = await pipeline.prepare(str(tmp_path / "a.png"))
+    assert image.data_url == "data:image/png;base64," + base64.b64encode(
+        b"not really a png"
+    ).decode("utf-8")
+    assert not image.resized
+
+    assert await pipeline.prepare(str(tmp_path / "a.png")) is image
+    assert await pipeline.prepare(str(tmp_path / "b.png")) is image
+    assert pipeline.stats["image_misses"] == 1
+    assert pipeline.stats["image_hits"] == 2
+
+    (tmp_path / "a.png").write_bytes(b"a different image")
+    assert (await pipeline.prepare(str(tmp_path / "a.png"))).digest != image.digest
+
+
+@pytest.mark.asyncio
+async def test_prepare_rejects_empty_images(tmp_path: Path):
+    (tmp_path / "empty.png").write_bytes(b"")
+    with pytest.raises(ValueError, match="empty"):
+        await ImagePipeline().prepare(str(tmp_path / "empty.png"))
+
+
+@pytest.mark.asyncio
+async def test_large_images_are_downscaled(tmp_path: Path):
+    Image = pytest.importorskip("PIL.Image")
+    Image.new("RGB", (3000, 1500), color=(200, 30, 30)).save(tmp_path / "big.png")
+    Image.new("RGB", (300, 150)).save(tmp_path / "small.png")
+    pipeline = ImagePipeline(max_dimension=1000)
+
+    image = await pipeline.prepare(str(tmp_path / "big.png"))
+    assert image.resized
+    assert image.data_url.startswith("data:image/jpeg;base64,")
+    encoded = base64.b64decode(image.data_url.split(",", 1)[1])
+    assert Image.open(io.BytesIO(encoded)).size == (1000, 500)
+
+    small = await pipeline.prepare(str(tmp_path / "small.png"))
+    assert not small.resized
+    assert small.encoded_bytes == small.original_bytes
+
+
+def test_answers_are_cached_by_digest_and_query():
+    pipeline = ImagePipeline(max_cached_answers=2)
+    pipeline.cache_answer("abc", None, "a red square")
+    pipeline.cache_answer("abc", "what color?", "red")
+    assert pipeline.cached_answer("abc", None) == "a red square"
+    assert pipeline.cached_answer("abc", "what shape?") is None
+
+    # the least recently used answer is evicted first
+    pipeline.cache_answer("def", None, "a blue circle")
+    assert pipeline.cached_answer("abc", "what color?") is None
+    assert pipeline.cached_answer("abc", None) == "a red square"
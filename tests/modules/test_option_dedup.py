@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from base import Message
+from modules.option_dedup import canonical_action, dedupe_options, minhash, similarity
+
+
+def bash(command: str, content: str = "Let me look.") -> Message:
+    return Message(
+        role="assistant",
+        content=content,
+        function_call={
+            "type": "function",
+            "name": "bash",
+            "arguments": json.dumps({"command": command}),
+        },
+    )
+
+
+def test_canonical_action():
+    assert canonical_action(bash("ls -la")) == canonical_action(
+        Message(
+            role="assistant",
+            content="Something else entirely.",
+            function_call={
+                "name": "bash",
+                "type": "function",
+                "arguments": '{\n  "command": "ls -la  \\n"\n}',
+            },
+        )
+    )
+    assert canonical_action(bash("ls -la")) != canonical_action(bash("ls -l"))
+    assert canonical_action(
+        Message(role="assistant", content="I am  done.\n")
+    ) == canonical_action(Message(role="assistant", content="I am done."))
+
+
+@pytest.mark.parametrize(
+    ("threshold", "expected_groups"),
+    [
+        (None, [[0, 2, 4], [1], [3]]),
+        (0.5, [[0, 2, 3, 4], [1]]),
+    ],
+)
+def test_dedupe_options(threshold: float | None, expected_groups: list[list[int]]):
+    script = "python train.py --epochs 10 --lr 0.001 --batch-size 32 --seed 0"
+    options = [
+        bash(script),
+        Message(role="assistant", content="I think the answer is 42."),
+        bash(script + "  ", content="Different reasoning."),
+        bash(script.replace("--seed 0", "--seed 1")),
+        bash(script),
+    ]
+    groups = dedupe_options(options, near_duplicate_threshold=threshold)
+    assert [group.indices for group in groups] == expected_groups
+    assert [group.count for group in groups] == [len(g) for g in expected_groups]
+    assert groups[0].option is options[0]
+
+
+def test_similarity():
+    text = " ".join(f"word{i}" for i in range(200))
+    assert similarity(minhash(text), minhash(text)) == 1.0
+    assert similarity(minhash(text), minhash(text.replace("word0 ", ""))) > 0.9
+    assert similarity(minhash(text), minhash("something else entirely")) == 0.0
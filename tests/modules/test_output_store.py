@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import pytest
+
+import modules.output_store as output_store
+from modules.output_store import OutputStore
+
+if TYPE_CHECKING:
+    import pathlib
+
+
+@pytest.mark.asyncio
+async def test_save_deduplicates_content(tmp_path: pathlib.Path):
+    store = OutputStore(str(tmp_path / "outputs"), "tool_output")
+
+    first = await store.save("hello world", node_id=1)
+    mtime = os.stat(first["path"]).st_mtime_ns
+    second = await store.save("hello world", node_id=2)
+    third = await store.save("something else", node_id=3)
+
+    assert first["path"] == second["path"]
+    assert os.stat(second["path"]).st_mtime_ns == mtime
+    assert third["path"] != first["path"]
+    assert sorted(os.listdir(tmp_path / "outputs")) == sorted(
+        [
+            ".index.jsonl",
+            os.path.basename(first["path"]),
+            os.path.basename(third["path"]),
+        ]
+    )
+    with open(first["path"]) as f:
+        assert f.read() == "hello world"
+
+
+@pytest.mark.asyncio
+async def test_index_maps_node_ids(tmp_path: pathlib.Path):
+    directory = str(tmp_path / "outputs")
+    store = OutputStore(directory, "tool_output")
+    content = "héllo\n" * 10
+
+    entry = await store.save(content, node_id=7)
+    await store.save("unindexed")
+
+    with open(os.path.join(directory, ".index.jsonl")) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [{"node_id": 7, **entry}]
+    assert entry["length"] == len(content.encode("utf-8"))
+
+    # A fresh store picks up the index from disk
+    reloaded = OutputStore(directory, "tool_output")
+    assert await reloaded.lookup(7) == entry
+    assert await reloaded.lookup(8) is None
+    assert await reloaded.read(8) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize(
+    ["start", "length", "expected"],
+    [
+        (0, None, "0123456789abcdef"),
+        (4, 3, "456"),
+        (10, None, "abcdef"),
+        (14, 100, "ef"),
+        (20, 5, ""),
+    ],
+)
+async def test_range_reads(
+    tmp_path: pathlib.Path,
+    compress: bool,
+    start: int,
+    length: int | None,
+    expected: str,
+):
+    store = OutputStore(str(tmp_path / "outputs"), "long_output", compress=compress)
+    entry = await store.save("0123456789abcdef", node_id=3)
+
+    assert entry["path"].endswith(".txt.gz" if compress else ".txt")
+    assert await store.read(3, start, length) == expected
+    if compress:
+        with gzip.open(entry["path"], "rt") as f:
+            assert f.read() == "0123456789abcdef"
+
+
+def test_line_index_cache_closes_evicted_indexes(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(output_store, "MAX_LINE_INDEXES", 2)
+    monkeypatch.setattr(output_store, "_line_indexes", OrderedDict())
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"output_{i}.txt"
+        path.write_text(f"line {i}\n")
+        paths.append(str(path))
+
+    first = output_store.get_line_index(paths[0])
+    output_store.get_line_index(paths[1])
+    assert output_store.get_line_index(paths[0]) is first
+    output_store.get_line_index(paths[2])
+
+    # paths[1] was the least recently used
+    assert list(output_store._line_indexes) == [paths[0], paths[2]]
+    assert first.lines(0, 1) == ["line 0"]
@@ -0,0 +1,76 @@
+import pytest
+
+from modules.output_summary import (
+    CHARS_PER_TOKEN,
+    OutputSummarizer,
+    summarize_output,
+)
+
+
+def test_short_output_is_unchanged():
+    content = "line 1\nline 2\r\nline 3"
+    assert summarize_output(content, token_budget=100) == content
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000, 1 << 22])
+def test_keeps_head_tail_and_errors(chunk_size: int):
+    lines = [f"building step {i}" for i in range(5000)]
+    lines[2500] = "src/main.c:10:3: error: expected ';' before '}' token"
+    lines[4000:4004] = [
+        "Traceback (most recent call last):",
+        '  File "train.py", line 3, in <module>',
+        "    main()",
+        "ValueError: learning rate must be positive",
+    ]
+    content = "\n".join(lines)
+
+    summary = summarize_output(content, token_budget=300, chunk_size=chunk_size)
+
+    assert len(summary) <= 300 * CHARS_PER_TOKEN
+    assert summary.startswith("building step 0\n")
+    assert summary.endswith("building step 4999")
+    assert "error: expected ';'" in summary
+    assert "building step 2499\nsrc/main.c:10:3" in summary
+    assert "ValueError: learning rate must be positive" in summary
+    assert "lines omitted ...]" in summary
+
+
+def test_collapses_progress_bars_and_repeats():
+    summarizer = OutputSummarizer(token_budget=200)
+    summarizer.feed(
+        "".join(f"\rDownloading: {p}% |{'#' * (p // 10)}|" for p in range(101)) + "\n"
+    )
+    summarizer.feed(
+        "".join(f"Epoch 1: {i}/50 [00:01<00:10, 4.2it/s]\n" for i in range(51))
+    )
+    summarizer.feed("warning: retrying connection\n" * 100)
+    summarizer.feed("".join(f"filler line {i}\n" for i in range(1000)))
+
+    summary = summarizer.summarize()
+
+    assert "Downloading: 100% |##########|" in summary
+    assert "Downloading: 99%" not in summary
+    assert "Epoch 1: 50/50" in summary
+    assert "[50 earlier progress updates collapsed]" in summary
+    assert "warning: retrying connection  [line repeated 99 more times]" in summary
+
+
+def test_repeated_errors_are_counted_once():
+    content = (
+        "".join(f"setup {i}\n" for i in range(500))
+        + "".join(f"ERROR: connection {i} refused\nretrying\n" for i in range(2000))
+        + "".join(f"teardown {i}\n" for i in range(500))
+    )
+
+    summary = summarize_output(content, token_budget=200)
+
+    assert summary.count("ERROR: connection 0 refused") == 1
+    assert "ERROR: connection 2 refused" not in summary
+    assert "2000x ERROR: connection # refused" in summary
+
+
+def test_long_lines_are_shortened():
+    summary = summarize_output("x" * 100_000, token_budget=200)
+
+    assert len(summary) < 1000
+    assert "characters omitted ...]" in summary
@@ -1,8 +1,18 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+from typing import TYPE_CHECKING, Literal
+
 import pytest
+from pyhooks.types import MiddlemanModelOutput, MiddlemanResult, MiddlemanSettings
 
 import base
 import modules.prompters as prompters
 
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
 
 @pytest.mark.parametrize(
     ("content", "metadata", "expect_trim", "expect_full_output_instructions"),
@@ -42,3 +52,252 @@ def test_get_trimmed_message(
             f"The full output is saved as {metadata['saved_output_filename']}."
             in trimmed_message.content
         )
+
+
+def test_get_trimmed_message_reuses_summaries(
+    monkeypatch: pytest.MonkeyPatch, mocker: MockerFixture
+):
+    monkeypatch.setattr(prompters, "_output_summaries", prompters.OrderedDict())
+    summarize_mock = mocker.patch.object(
+        prompters, "summarize_output", return_value="summary"
+    )
+    node = base.Node(
+        node_id=0,
+        parent=-1,
+        children=[],
+        message=base.Message(role="function", content="x" * 200_000, name="test"),
+    )
+
+    for _ in range(3):
+        assert "summary" in prompters._get_trimmed_message(node, 0.5).content
+
+    summarize_mock.assert_called_once()
+
+
+def words(role: Literal["function", "user"], num_words: int) -> base.Message:
+    return base.Message(role=role, content="word " * num_words)
+
+
+@pytest.mark.parametrize(
+    ("sizes", "target", "kwargs", "expected"),
+    [
+        # everything fits
+        ([10] * 10, 1000, {}, list(range(10))),
+        # keep the longest tail that fits after the head and the notice
+        ([10] * 20, 40 + 30, {}, [0, 1, 2, 3, "notice", 17, 18, 19]),
+        ([10] * 20, 40 + 29, {}, [0, 1, 2, 3, "notice", 18, 19]),
+        # the head alone overflows: keep the latest message anyway
+        ([100] * 4 + [10] * 6, 50, {}, [0, 1, 2, 3, "notice", 9]),
+        ([100] * 4 + [10] * 6, 50, {"min_tail": 3}, [0, 1, 2, 3, "notice", 7, 8, 9]),
+        # nothing to remove after the head
+        ([100] * 4, 50, {}, [0, 1, 2, 3]),
+        # pinned messages are kept, and count against the budget
+        ([10] * 20, 40 + 30, {"pinned": [5]}, [0, 1, 2, 3, "notice", 5, 18, 19]),
+        (
+            [10] * 20,
+            20 + 50,
+            {"pinned": [-1], "head": 2},
+            [0, 1, "notice", 15, 16, 17, 18, 19],
+        ),
+        # odd messages are function outputs, capped separately
+        (
+            [10] * 20,
+            1000,
+            {"role_budgets": {"function": 20}},
+            [0, 1, 2, 3, "notice", 16, 17, 18, 19],
+        ),
+    ],
+)
+def test_trim_message_list(
+    monkeypatch: pytest.MonkeyPatch,
+    sizes: list[int],
+    target: int,
+    kwargs: dict,
+    expected: list,
+):
+    monkeypatch.setattr(
+        prompters,
+        "_count_message_tokens",
+        lambda enc, message: len(message.content.split()),
+    )
+    notice_tokens = len(prompters.notice_retroactively_trimmed_prompt.split())
+    messages = [
+        words("function" if i % 2 else "user", size) for i, size in enumerate(sizes)
+    ]
+    if "notice" in expected:
+        target += notice_tokens
+
+    trimmed = prompters.trim_message_list(messages, target, **kwargs)
+    assert [
+        "notice"
+        if message.content == prompters.notice_retroactively_trimmed_prompt
+        else next(i for i, m in enumerate(messages) if m is message)
+        for message in trimmed
+    ] == expected
+
+
+def make_agent(num_messages: int) -> base.Agent:
+    state = base.State(
+        task_string="test task",
+        next_step={"module_type": "prompter", "args": {}},
+    )
+    for i in range(num_messages):
+        state.generate_node(
+            base.Message(role="user", content=f"message {i} " + "word " * 100)
+        )
+    return base.Agent(
+        state=state,
+        settings=base.Settings(
+            toolkit="_basic",
+            prompter="_prefix_stable",
+            generator="_gpt_basic_1x4o",
+            discriminator="_basic",
+            actor="_basic",
+        ),
+        toolkit_dict={},
+    )
+
+
+@pytest.mark.asyncio
+async def test_prefix_stable_trims_in_chunks(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(prompters, "_get_target_tok_length", lambda agent: 5000)
+    agent = make_agent(20)
+
+    await prompters._prefix_stable(agent)
+    args = agent.state.next_step["args"]
+    assert len(agent.state.get_prompt_messages()) == 21
+    assert agent.state.get_prompt_messages()[-1].content.startswith(
+        "So far in this attempt"
+    )
+    assert args["prompt_metadata"]["cached_prefix_tokens"] == 0
+    assert args["prompt_metadata"]["trimmed_messages"] == 0
+
+    # grow the history until it no longer fits
+    for i in range(20, 60):
+        agent.state.generate_node(
+            base.Message(role="user", content=f"message {i} " + "word " * 100)
+        )
+    await prompters._prefix_stable(agent)
+    messages = agent.state.get_prompt_messages()
+    metadata = agent.state.next_step["args"]["prompt_metadata"]
+    trimmed = metadata["trimmed_messages"]
+    assert trimmed > 0
+    assert trimmed % prompters.PREFIX_STABLE_TRIM_CHUNK == 0
+    assert [m.content.split()[1] for m in messages[:4]] == ["0", "1", "2", "3"]
+    assert messages[4].content == prompters.notice_retroactively_trimmed_prompt
+    assert messages[5].content.startswith(f"message {4 + trimmed} ")
+    # trimming leaves headroom below the target
+    assert metadata["prompt_tokens"] < 5000 * 0.8
+
+    # the next few steps keep the same trim point, so the prompt prefix is shared
+    previous_messages = messages
+    agent.state.generate_node(
+        base.Message(role="user", content="message 60 " + "word " * 100)
+    )
+    await prompters._prefix_stable(agent)
+    messages = agent.state.get_prompt_messages()
+    metadata = agent.state.next_step["args"]["prompt_metadata"]
+    assert metadata["trimmed_messages"] == trimmed
+    assert messages[: len(previous_messages) - 1] == previous_messages[:-1]
+    assert 0 < metadata["cached_prefix_tokens"] < metadata["prompt_tokens"]
+
+
+@pytest.mark.asyncio
+async def test_summarizing_replaces_old_spans(
+    monkeypatch: pytest.MonkeyPatch, mocker: MockerFixture
+):
+    monkeypatch.setattr(prompters, "_get_target_tok_length", lambda agent: 8000)
+    monkeypatch.setattr(prompters, "_summary_tasks", {})
+    monkeypatch.setattr(prompters, "_summary_failures", {})
+
+    async def generate(messages, settings):
+        history = messages[0].content.split("<history>")[1]
+        first_message = history.split()[2]
+        return MiddlemanResult(
+            outputs=[MiddlemanModelOutput(completion=f"summary from {first_message}")]
+        )
+
+    generate_mock = mocker.patch.object(prompters.llm, "generate", side_effect=generate)
+    agent = make_agent(100)
+
+    # the first spans are dropped while their summaries are being generated
+    await prompters._summarizing(agent)
+    messages = agent.state.get_prompt_messages()
+    assert messages[4].content == prompters.notice_retroactively_trimmed_prompt
+    assert messages[-1].content.startswith("So far in this attempt")
+    await asyncio.gather(*prompters._summary_tasks.values())
+    assert generate_mock.call_count > 0
+
+    await prompters._summarizing(agent)
+    messages = agent.state.get_prompt_messages()
+    assert "summary from 4" in messages[4].content
+    assert messages[4].content.startswith("Part of the history of the conversation")
+    assert len(agent.state.summaries) == generate_mock.call_count
+    summary = agent.state.summaries[next(iter(agent.state.summaries))]
+    assert (summary["start_node_id"], summary["end_node_id"]) == (4, 23)
+
+    # summaries are reused rather than generated again
+    call_count = generate_mock.call_count
+    await prompters._summarizing(agent)
+    assert agent.state.get_prompt_messages() == messages
+    assert generate_mock.call_count == call_count
+
+
+@pytest.mark.asyncio
+async def test_summarizing_backs_off_after_failures(
+    monkeypatch: pytest.MonkeyPatch, mocker: MockerFixture
+):
+    monkeypatch.setattr(prompters, "_get_target_tok_length", lambda agent: 8000)
+    monkeypatch.setattr(prompters, "_summary_tasks", {})
+    monkeypatch.setattr(prompters, "_summary_failures", {})
+    now = 1000.0
+    monkeypatch.setattr(prompters.time, "monotonic", lambda: now)
+    generate_mock = mocker.patch.object(
+        prompters.llm, "generate", return_value=MiddlemanResult(error="overloaded")
+    )
+    agent = make_agent(100)
+    summarizing = functools.partial(
+        prompters._summarizing_factory,
+        middleman_settings=MiddlemanSettings(model="summary-model", n=1, temp=0),
+    )
+
+    await summarizing(agent)
+    await asyncio.gather(*prompters._summary_tasks.values(), return_exceptions=True)
+    call_count = generate_mock.call_count
+    assert call_count > 0
+    assert generate_mock.call_args.kwargs["settings"].model == "summary-model"
+
+    # failed spans aren't tried again until their backoff is over
+    await summarizing(agent)
+    await summarizing(agent)
+    assert not prompters._summary_tasks
+    assert generate_mock.call_count == call_count
+    assert all(failures == 1 for failures, _ in prompters._summary_failures.values())
+
+    now += prompters.SUMMARY_RETRY_SECONDS
+    await summarizing(agent)
+    assert len(prompters._summary_tasks) == call_count
+
+
+@pytest.mark.asyncio
+async def test_prompt_messages_are_stored_by_reference():
+    agent = make_agent(10)
+    agent.state.generate_node(
+        base.Message(role="function", name="score", content='{"score": 1}')
+    )
+    await prompters._basic(agent)
+    messages = agent.state.get_prompt_messages()
+    assert len(messages) == 11
+    assert messages[-1].content == "The score is 1."
+    # only the reformatted score message is stored by value
+    assert agent.state.next_step["args"]["message_refs"] == [
+        *range(10),
+        messages[-1],
+    ]
+
+    restored = base.State.parse_obj(agent.state.model_dump())
+    assert restored.get_prompt_messages() == messages
+
+    # states that store the messages themselves still work
+    agent.state.next_step["args"] = {"messages": messages[:2]}
+    assert agent.state.get_prompt_messages() == messages[:2]
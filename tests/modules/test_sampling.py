@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import pytest
+from pyhooks.types import MiddlemanSettings
+
+import base
+from modules import sampling
+from templates import reject_action_prompt, reject_command_prompt
+
+
+def make_state(results: list[base.Message], token_usage: int = 0, time_usage: int = 0):
+    state = base.State(
+        task_string="test task",
+        token_limit=1_000_000,
+        token_usage=token_usage,
+        time_limit=1_000,
+        time_usage=time_usage,
+    )
+    state.generate_node(base.Message(role="user", content="Start."))
+    for result in results:
+        state.generate_node(
+            base.Message(
+                role="assistant",
+                content="",
+                function_call={"name": "bash", "arguments": "{}"},
+            )
+        )
+        state.generate_node(result)
+    return state
+
+
+def bash_output(exit_code: int) -> base.Message:
+    return base.Message(
+        role="function", name="bash", content=f"output\nExit code: {exit_code}"
+    )
+
+
+@pytest.mark.parametrize(
+    ("message", "expected"),
+    [
+        (bash_output(0), False),
+        (bash_output(1), True),
+        (base.Message(role="function", name="bash", content="Exit code: 0"), False),
+        (base.Message(role="function", name="x", content=reject_command_prompt), True),
+        (
+            base.Message(role="user", content=reject_action_prompt.format(action="ls")),
+            True,
+        ),
+        (base.Message(role="user", content="Keep going."), False),
+        (base.Message(role="assistant", content="\nExit code: 1"), False),
+    ],
+)
+def test_is_failure(message: base.Message, expected: bool):
+    assert sampling.is_failure(message) == expected
+
+
+@pytest.mark.parametrize(
+    ("results", "token_usage", "time_usage", "expected_n", "expected_max_tokens"),
+    [
+        # plenty of budget, no failures
+        ([bash_output(0)], 0, 0, 4, 4096),
+        # widened after failures, up to 4x
+        ([bash_output(0), bash_output(1)], 0, 0, 8, 4096),
+        ([bash_output(1)] * 3, 0, 0, 16, 4096),
+        # shrunk when the time budget runs low
+        ([bash_output(0)], 0, 850, 2, 2048),
+        # widening is capped to a tenth of the tokens left at any budget
+        ([bash_output(1)] * 3, 500_000, 0, 12, 4096),
+        # shrunk and capped to a tenth of the tokens left once it is
+        ([bash_output(1)] * 3, 800_000, 0, 7, 2730),
+        ([bash_output(0)], 995_000, 0, 1, 1024),
+    ],
+)
+def test_adapt_sampling(
+    results, token_usage, time_usage, expected_n, expected_max_tokens
+):
+    settings = MiddlemanSettings(model="gpt-4o", n=4, max_tokens=4096)
+    state = make_state(results, token_usage, time_usage)
+    adapted, decision = sampling.adapt_sampling(state, settings)
+    assert (adapted.n, adapted.max_tokens) == (expected_n, expected_max_tokens)
+    assert decision["n"] == expected_n
+    assert (settings.n, settings.max_tokens) == (4, 4096)
+
+
+@pytest.mark.parametrize(
+    ("base_n", "expected_n"),
+    [
+        # 24 completions of 4096 tokens fit in a tenth of the 1M tokens left
+        (8, 24),
+        # but the generator's own n isn't cut while the budget isn't low
+        (64, 64),
+    ],
+)
+def test_adapt_sampling_caps_widening_at_full_budget(base_n: int, expected_n: int):
+    settings = MiddlemanSettings(model="gpt-4o", n=base_n, max_tokens=4096)
+    state = make_state([bash_output(1)] * 3)
+    adapted, _ = sampling.adapt_sampling(state, settings)
+    assert (adapted.n, adapted.max_tokens) == (expected_n, 4096)
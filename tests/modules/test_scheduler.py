@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import pytest
+from pyhooks.types import MiddlemanModelOutput, MiddlemanResult, MiddlemanSettings
+
+import modules.llm as llm
+from modules.scheduler import (
+    GENERATION,
+    JUDGING,
+    OTHER,
+    RequestScheduler,
+    TokenBucket,
+)
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+class ThrottlingEndpoint:
+    """
+    Stands in for the model API: serves max_concurrency requests at once, and
+    answers any more, as well as the first throttle_first, with a 429.
+    """
+
+    def __init__(self, max_concurrency: int, throttle_first: int = 0):
+        self.max_concurrency = max_concurrency
+        self.throttle_first = throttle_first
+        self.running = 0
+        self.requests = 0
+
+    async def generate(self, _self, messages, settings, functions=None):
+        self.requests += 1
+        if self.running >= self.max_concurrency or self.requests <= self.throttle_first:
+            return MiddlemanResult(error="Error code: 429 - Rate limit reached")
+        self.running += 1
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.running -= 1
+        return MiddlemanResult(
+            outputs=[MiddlemanModelOutput(completion=messages[0]["content"])]
+        )
+
+
+@pytest.mark.asyncio
+async def test_generate_retries_throttled_requests(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+):
+    endpoint = ThrottlingEndpoint(max_concurrency=4, throttle_first=3)
+    mocker.patch("pyhooks.Hooks.generate", autospec=True, side_effect=endpoint.generate)
+    scheduler = RequestScheduler(max_concurrency=4, base_backoff=0.001)
+    monkeypatch.setattr(llm, "scheduler", scheduler)
+    monkeypatch.setattr(llm, "generation_cache", None)
+
+    settings = MiddlemanSettings(model="gpt-4o", n=1, temp=1, max_tokens=10)
+    results = await asyncio.gather(
+        *(
+            llm.generate(
+                messages=[{"role": "user", "content": str(i)}], settings=settings
+            )
+            for i in range(20)
+        )
+    )
+    completions = []
+    for result in results:
+        assert result.outputs is not None
+        completions.append(result.outputs[0].completion)
+    assert completions == [str(i) for i in range(20)]
+    assert scheduler.stats["rate_limited"] == 3
+    assert scheduler.stats["requests"] == endpoint.requests == 23
+    assert scheduler.stats["max_queue_depth"] == 16
+    assert scheduler.running == 0
+    assert scheduler.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_gives_up_after_max_retries():
+    scheduler = RequestScheduler(max_retries=2, base_backoff=0.001)
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("429 Too Many Requests")
+
+    with pytest.raises(RuntimeError, match="429"):
+        await scheduler.run(call)
+    assert calls == 3
+
+    async def fails():
+        nonlocal calls
+        calls += 1
+        raise ValueError("bad request")
+
+    calls = 0
+    with pytest.raises(ValueError):
+        await scheduler.run(fails)
+    assert calls == 1
+    assert scheduler.running == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_serves_waiting_calls_by_priority():
+    scheduler = RequestScheduler(max_concurrency=1)
+    unblock = asyncio.Event()
+    order = []
+
+    async def blocking():
+        await unblock.wait()
+
+    def record(name):
+        async def call():
+            order.append(name)
+
+        return call
+
+    first = asyncio.create_task(scheduler.run(blocking))
+    await asyncio.sleep(0)
+    waiting = [
+        asyncio.create_task(scheduler.run(record(name), priority=priority))
+        for name, priority in [
+            ("other", OTHER),
+            ("judging", JUDGING),
+            ("generation 1", GENERATION),
+            ("generation 2", GENERATION),
+        ]
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth == 4
+    unblock.set()
+    await asyncio.gather(first, *waiting)
+    assert order == ["generation 1", "generation 2", "judging", "other"]
+
+
+@pytest.mark.asyncio
+async def test_throttled_call_does_not_hold_a_slot():
+    # 100 tokens a second for the slow model
+    scheduler = RequestScheduler(
+        max_concurrency=1, model_limits={"slow": {"tokens_per_minute": 6000}}
+    )
+    order = []
+
+    def record(name):
+        async def call():
+            order.append(name)
+
+        return call
+
+    await scheduler.run(record("slow 1"), model="slow", tokens=6000)
+    throttled = asyncio.create_task(
+        scheduler.run(record("slow 2"), model="slow", tokens=30)
+    )
+    await asyncio.sleep(0)
+    await scheduler.run(record("fast"), model="fast")
+    assert order == ["slow 1", "fast"]
+    await throttled
+    assert order == ["slow 1", "fast", "slow 2"]
+    assert scheduler.stats["throttled_seconds"] > 0
+
+
+def test_token_bucket():
+    now = 0.0
+    bucket = TokenBucket(per_minute=60, clock=lambda: now)
+    assert bucket.take(50) == 0
+    # 10 left, refilled at one a second
+    assert bucket.take(20) == pytest.approx(10)
+    now = 10.0
+    assert bucket.take(20) == 0
+    # requests bigger than the bucket wait for a full bucket
+    assert bucket.take(1_000) == pytest.approx(60)
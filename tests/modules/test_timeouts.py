@@ -0,0 +1,86 @@
+import pytest
+
+from modules.timeouts import MAX_TIMEOUT, TimeoutPolicy, command_prefix
+
+
+@pytest.mark.parametrize(
+    ["command", "expected_prefix"],
+    [
+        ("ls -la", "ls"),
+        ("pip install -q numpy torch", "pip install"),
+        ("cd /home/agent && python train.py --epochs 3", "python train.py"),
+        ("python -m pytest -x tests", "python -m pytest"),
+        ("CUDA_VISIBLE_DEVICES=0 timeout 100 python3 eval.py", "python3 eval.py"),
+        ("source venv/bin/activate; make -j8", "make"),
+        ("sudo apt-get install -y git", "apt-get install"),
+    ],
+)
+def test_command_prefix(command: str, expected_prefix: str):
+    assert command_prefix(command) == expected_prefix
+
+
+def test_base_timeout_is_used_for_unknown_commands():
+    policy = TimeoutPolicy({})
+    assert policy.timeout_for("echo hello", 5) == (5, None)
+
+
+def test_known_long_commands_get_longer_timeouts():
+    policy = TimeoutPolicy({})
+    timeout, reason = policy.timeout_for("pip install torch", 60)
+    assert timeout == 600
+    assert reason == "known long-running command"
+    # the agent's own timeout is never shortened
+    assert policy.timeout_for("pip install torch", 900) == (900, None)
+
+
+def test_timeouts_are_learned_from_previous_runs():
+    stats = {}
+    policy = TimeoutPolicy(stats)
+    policy.record("python eval.py --split dev", 100.0, False, 600)
+    policy.record("python eval.py --split test", 120.0, False, 600)
+    assert stats["python eval.py"]["runs"] == 2
+    assert stats["python eval.py"]["mean_seconds"] == pytest.approx(110.0)
+
+    timeout, reason = policy.timeout_for("python eval.py", 60)
+    assert timeout == 180
+    assert reason == "previous runs of 'python eval.py'"
+
+    # after a timeout, the next run gets twice as long
+    policy.record("python eval.py", 200.0, True, 200)
+    assert policy.timeout_for("python eval.py", 60)[0] == 400
+    # and a successful run resets that
+    policy.record("python eval.py", 10.0, False, 400)
+    assert policy.timeout_for("python eval.py", 60)[0] == 180
+
+
+def test_commands_that_keep_timing_out_are_not_extended():
+    stats = {}
+    policy = TimeoutPolicy(stats)
+    policy.record("python serve.py", 60.0, True, 60)
+    assert policy.timeout_for("python serve.py", 60)[0] == 120
+    policy.record("python serve.py", 120.0, True, 120)
+    assert policy.timeout_for("python serve.py", 60) == (60, None)
+    # timed-out runs don't count towards how long the command needs
+    assert stats["python serve.py"]["max_seconds"] == 0.0
+
+
+def test_timeouts_are_capped():
+    policy = TimeoutPolicy({})
+    policy.record("python slow.py", MAX_TIMEOUT, True, MAX_TIMEOUT)
+    assert policy.timeout_for("python slow.py", 60)[0] == MAX_TIMEOUT
+    # but never beyond the time left for the task, unless the agent asked for it
+    assert policy.timeout_for("python slow.py", 60, time_remaining=100)[0] == 100
+    assert policy.timeout_for("python slow.py", 200, time_remaining=100) == (
+        200,
+        None,
+    )
+
+
+def test_least_used_prefixes_are_forgotten():
+    stats = {}
+    policy = TimeoutPolicy(stats, max_prefixes=2)
+    policy.record("make", 1.0, False, 10)
+    policy.record("make", 1.0, False, 10)
+    policy.record("ls", 1.0, False, 10)
+    policy.record("cat file", 1.0, False, 10)
+    assert set(stats) == {"make", "cat file"}
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import datetime
+import hashlib
 import json
-import random
 from typing import TYPE_CHECKING, Any
 
 import pyhooks
@@ -14,6 +14,7 @@ import modules.generators as generators
 import modules.prompters as prompters
 import modules.tools as tools
 import templates
+from modules.bash_session import BashSession
 
 if TYPE_CHECKING:
     from pyfakefs.fake_filesystem import FakeFilesystem
@@ -50,10 +51,7 @@ async def test_score_fn(mocker: MockerFixture):
     ["actor", "expected_output_file"],
     [
         ("_basic", None),
-        (
-            "_always_save",
-            "/home/agent/tool_outputs/tool_output_7605875871743421.txt",
-        ),
+        ("_always_save", "/home/agent/tool_outputs/tool_output_{digest}.txt"),
     ],
 )
 async def test_score_feedback(
@@ -62,7 +60,6 @@ async def test_score_feedback(
     actor: str,
     expected_output_file: str | None,
 ):
-    random.seed(0)
     fs.create_dir("/home/agent")
 
     score_result = pyhooks.types.ScoreResult(
@@ -134,6 +131,9 @@ async def test_score_feedback(
     assert isinstance(action_mock.call_args.args[1]["args"], dict)
     expected_content = json.dumps(score_result.model_dump())
     if expected_output_file is not None:
+        expected_output_file = expected_output_file.format(
+            digest=hashlib.sha256(expected_content.encode()).hexdigest()[:16]
+        )
         expected_content += f"\n\n[Note: the above tool output has been saved to {expected_output_file}]"
     assert agent.state.nodes[agent.state.last_node_id].message == base.Message(
         role="function",
@@ -351,3 +351,232 @@ async def test_double_return_fn(
         assert expected_submit_arg in state.submissions  # the submission should be added to the state
         assert ("more than 10%" in result) == expect_more_than_10
         assert ("less than 10%" in result) == expect_less_than_10
+
+
+@pytest.fixture(name="saved_output")
+def fixture_saved_output(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    output_dir = tmp_path / "tool_outputs"
+    output_dir.mkdir()
+    monkeypatch.setattr(tools, "saved_output_dirs", [str(output_dir)])
+    path = output_dir / "tool_output_0123456789abcdef.txt"
+    path.write_text(
+        "\n".join(
+            f"ERROR: step {i} failed" if i % 1000 == 0 else f"line {i}"
+            for i in range(1, 5001)
+        )
+        + "\n"
+    )
+    return path
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ["kwargs", "expected_lines", "unexpected_lines"],
+    [
+        ({}, ["1: line 1", "20: line 20"], ["21: line 21"]),
+        (
+            {"start_line": "4990", "end_line": 4992},
+            ["4990: line 4990", "4992: line 4992"],
+            ["4989: line 4989", "4993: line 4993"],
+        ),
+        ({"start_line": -2}, ["4999: line 4999", "5000: ERROR: step 5000 failed"], []),
+        ({"start_line": 0, "end_line": 2}, ["1: line 1", "2: line 2"], ["0: "]),
+        (
+            {"pattern": "ERROR", "context_lines": 0, "max_matches": 2},
+            ["1000: ERROR", "2000: ERROR", "First 2 matching lines"],
+            ["3000: ERROR"],
+        ),
+        (
+            {"pattern": "ERROR", "context_lines": 1},
+            ["999: line 999", "1000: ERROR: step 1000 failed", "1001: line 1001"],
+            ["998: line 998", "1002: line 1002"],
+        ),
+        (
+            {"pattern": r"step \d+000 failed$", "regex": "true", "context_lines": 0},
+            ["3000: ERROR: step 3000 failed", "5 matching lines"],
+            ["2999: line 2999"],
+        ),
+        ({"pattern": "not in the output"}, ["No lines match"], []),
+    ],
+)
+async def test_search_output(
+    saved_output,
+    kwargs: dict[str, Any],
+    expected_lines: list[str],
+    unexpected_lines: list[str],
+):
+    output = await tools.search_output(
+        base.State(task_string="test task"), str(saved_output), **kwargs
+    )
+
+    assert output.startswith(f"{saved_output} has 5000 lines.")
+    for line in expected_lines:
+        assert line in output
+    for line in unexpected_lines:
+        assert line not in output
+
+
+@pytest.mark.asyncio
+async def test_search_output_finds_saved_files(saved_output, tmp_path):
+    state = base.State(task_string="test task")
+
+    by_name = await tools.search_output(state, saved_output.name)
+    latest = await tools.search_output(state, "")
+    outside = tmp_path / "other.txt"
+    outside.write_text("secret")
+    not_saved = await tools.search_output(state, str(outside))
+
+    assert by_name.startswith(f"{saved_output} has 5000 lines.")
+    assert latest == by_name
+    assert not_saved.startswith("Error:")
+
+
+@pytest.mark.asyncio
+async def test_run_bash_session_and_poll(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+):
+    session = BashSession()
+    monkeypatch.setattr(tools, "bash_session", session)
+    action_mock = mocker.patch(
+        "pyhooks.Hooks.action", autospec=True, return_value=mocker.AsyncMock()()
+    )
+    state = base.State(task_string="test task", timeout=1)
+
+    try:
+        output = await tools.run_bash_session(state, "export X=42; echo $X")
+        assert output == "42\nExit code: 0"
+
+        output = await tools.run_bash_session(state, "echo $X; sleep 2; echo done")
+        assert output.startswith("42")
+        assert "still running as job 2" in output
+
+        output = await tools.run_bash_session(state, "echo busy")
+        assert output.startswith("Error: the shell is still running job 2")
+
+        output = await tools.poll_bash(state, "2")
+        assert output.endswith("done\nExit code: 0")
+        assert await tools.poll_bash(state, 7) == "Error: there is no bash job 7."
+    finally:
+        await session.close()
+
+    assert action_mock.call_count == 3
+    assert action_mock.call_args.args[1] == {
+        "type": "run_bash",
+        "args": {"command": "echo busy"},
+    }
+
+
+@pytest.mark.asyncio
+async def test_poll_bash_interrupt_keeps_environment(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+):
+    session = BashSession()
+    monkeypatch.setattr(tools, "bash_session", session)
+    mocker.patch(
+        "pyhooks.Hooks.action", autospec=True, return_value=mocker.AsyncMock()()
+    )
+    state = base.State(task_string="test task", timeout=1)
+
+    try:
+        await tools.run_bash_session(state, "export X=42")
+        output = await tools.run_bash_session(state, "sleep 30")
+        assert "still running as job 2" in output
+
+        output = await tools.poll_bash(state, 2, interrupt="true")
+        assert output.endswith("[Job 2 was interrupted.]\nExit code: 130")
+        output = await tools.run_bash_session(state, "echo $X")
+        assert output == "42\nExit code: 0"
+    finally:
+        await session.close()
+
+
+@pytest.mark.asyncio
+async def test_describe_image_caches_answers(tmp_path, mocker: MockerFixture):
+    generate_one_mock = mocker.patch(
+        "pyhooks.Hooks.generate_one", autospec=True, return_value="a red square"
+    )
+    mocker.patch.object(tools, "image_pipeline", tools.ImagePipeline())
+    (tmp_path / "plot.png").write_bytes(b"fake png bytes")
+    state = base.State(task_string="test task")
+
+    for _ in range(2):
+        output = await tools.describe_image_fn(state, str(tmp_path / "plot.png"))
+        assert output == "The vision language model returned this:\na red square"
+    generate_one_mock.assert_awaited_once()
+    messages = generate_one_mock.call_args.kwargs["messages"]
+    assert messages[0].content[1]["image_url"]["url"].startswith(
+        "data:image/png;base64,"
+    )
+
+    await tools.describe_image_fn(state, str(tmp_path / "plot.png"), "what color?")
+    assert generate_one_mock.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_describe_images_packs_images(tmp_path, mocker: MockerFixture):
+    async def generate_one(_self, settings, messages):
+        images = [
+            part for part in messages[0].content if part["type"] == "image_url"
+        ]
+        if len(images) == 1:
+            return "a single image"
+        # answer all but the last image in the packed format
+        return "\n".join(
+            f"<image_{i}>\npacked answer {i}\n</image_{i}>"
+            for i in range(1, len(images))
+        )
+
+    generate_one_mock = mocker.patch(
+        "pyhooks.Hooks.generate_one", autospec=True, side_effect=generate_one
+    )
+    mocker.patch.object(tools, "image_pipeline", tools.ImagePipeline())
+    for name in ["a.png", "b.png", "c.png"]:
+        (tmp_path / name).write_bytes(f"fake {name}".encode())
+    (tmp_path / "notes.txt").write_text("not an image")
+    state = base.State(task_string="test task")
+
+    output = await tools.describe_images_fn(state, str(tmp_path / "*"))
+
+    assert output == "\n\n".join(
+        [
+            "The vision language model returned this:",
+            f"Image 1: {tmp_path / 'a.png'}\npacked answer 1",
+            f"Image 2: {tmp_path / 'b.png'}\npacked answer 2",
+            f"Image 3: {tmp_path / 'c.png'}\na single image",
+        ]
+    )
+    # one packed request, and one retry for the image it didn't answer
+    assert generate_one_mock.await_count == 2
+
+    # answers are cached, so asking again needs no requests
+    output = await tools.describe_images_fn(
+        state, [str(tmp_path / "c.png"), str(tmp_path / "missing.png")]
+    )
+    assert "Image 1: " + str(tmp_path / "c.png") + "\na single image" in output
+    assert f"Error: file not found: {tmp_path / 'missing.png'}" in output
+    assert generate_one_mock.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_describe_images_splits_large_payloads(tmp_path, mocker: MockerFixture):
+    generate_one_mock = mocker.patch(
+        "pyhooks.Hooks.generate_one", autospec=True, return_value="an image"
+    )
+    mocker.patch.object(tools, "image_pipeline", tools.ImagePipeline())
+    mocker.patch.object(tools, "MAX_IMAGE_PAYLOAD_CHARS", 10)
+    paths = []
+    for name in ["a.png", "b.png", "c.png"]:
+        (tmp_path / name).write_bytes(f"fake {name}".encode())
+        paths.append(str(tmp_path / name))
+
+    output = await tools.describe_images_fn(
+        base.State(task_string="test task"), json.dumps(paths)
+    )
+
+    assert output.count("an image") == 3
+    assert generate_one_mock.await_count == 3
+    for call in generate_one_mock.call_args_list:
+        images = [
+            part for part in call.kwargs["messages"][0].content if part["type"] == "image_url"
+        ]
+        assert len(images) == 1
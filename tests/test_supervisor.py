@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import sys
+from typing import TYPE_CHECKING
+
+import base
+import supervisor
+from modules import actors, generators, llm, tools
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import pytest
+    from pytest_mock import MockerFixture
+
+
+def test_reinitialize_hooks():
+    old_hooks, old_actions = base.hooks, base.actions
+    try:
+        supervisor.reinitialize_hooks()
+        assert base.hooks is not old_hooks
+        assert base.actions is not old_actions
+        assert tools.hooks is base.hooks
+        assert tools.actions is base.actions
+        assert llm.hooks is base.hooks
+    finally:
+        for module in (base, tools, llm):
+            setattr(module, "hooks", old_hooks)
+        for module in (base, tools):
+            setattr(module, "actions", old_actions)
+
+
+def test_run_agent_applies_run_env(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, mocker: MockerFixture
+):
+    env = {
+        "RUN_ID": "123",
+        "GENERATION_CACHE_DIR": str(tmp_path / "cache"),
+        "MAX_CONCURRENT_MODEL_REQUESTS": 3,
+        "MODEL_RATE_LIMITS": json.dumps({"gpt-4o": {"requests_per_minute": 5}}),
+        "HEDGE_LATENCY_PERCENTILE": "95",
+        "OPTION_NEAR_DUPLICATE_THRESHOLD": "0.9",
+    }
+    for key in env:
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv("OUTPUT_STORE_DIR", str(tmp_path))
+    # restored after the test, since run_agent replaces them
+    for module, name in [
+        (llm, "generation_cache"),
+        (llm, "scheduler"),
+        (llm, "hedger"),
+        (generators, "OPTION_NEAR_DUPLICATE_THRESHOLD"),
+        (actors, "long_output_store"),
+        (actors, "tool_output_store"),
+        (tools, "saved_output_dirs"),
+    ]:
+        monkeypatch.setattr(module, name, getattr(module, name))
+    mocker.patch.object(supervisor, "reinitialize_hooks")
+    main_mock = mocker.patch("pyhooks.Hooks.main", autospec=True)
+
+    supervisor.run_agent({"env": env})
+
+    main_mock.assert_called_once()
+    assert llm.generation_cache is not None
+    assert llm.generation_cache.directory == str(tmp_path / "cache")
+    assert llm.scheduler.max_concurrency == 3
+    assert llm.scheduler.model_limits == {"gpt-4o": {"requests_per_minute": 5}}
+    assert llm.hedger.percentile == 95
+    assert generators.OPTION_NEAR_DUPLICATE_THRESHOLD == 0.9
+    run_dir = tmp_path / "runs" / "123"
+    assert actors.long_output_store.directory == str(run_dir / "long_outputs")
+    assert tools.saved_output_dirs == [
+        str(run_dir / "long_outputs"),
+        str(run_dir / "tool_outputs"),
+    ]
+
+
+def test_supervise_runs_queue(tmp_path: Path, mocker: MockerFixture):
+    for name, exit_code in [("a", 0), ("b", 3), ("c", 0)]:
+        (tmp_path / f"{name}.json").write_text(
+            json.dumps({"env": {"EXIT_CODE": exit_code}})
+        )
+    (tmp_path / "invalid.json").write_text("{")
+    mocker.patch.object(
+        supervisor,
+        "run_agent",
+        side_effect=lambda spec: sys.exit(int(spec["env"]["EXIT_CODE"])),
+    )
+
+    supervisor.supervise(tmp_path, workers=2, poll_interval=0.1, exit_when_empty=True)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "a.json.done",
+        "b.json.failed",
+        "c.json.done",
+        "invalid.json.failed",
+    ]